@@ -1,10 +1,77 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
-from routes import whatsapp_router
+from fastapi.concurrency import run_in_threadpool
+
+from config import settings
+from metrics import metrics
+from routes import ledger_router, metrics_router, whatsapp_router
+from service.job_queue import JobQueue
+from service.whatsapp_service import close_whatsapp_service, process_message_job, warm_up_whatsapp_service
+from tools.http_clients import http_clients
+from tools.status_tracker import get_status_tracker
+from tools.ledger import get_ledger
+from logger import log
+
+
+async def warm_up() -> None:
+    """
+    Build the service and load the heavy modules in a worker thread. Runs as a task once
+    startup has finished, so the server binds its port without waiting for it.
+    """
+    await asyncio.sleep(0)
+    try:
+        await run_in_threadpool(warm_up_whatsapp_service)
+    except Exception as e:
+        # Not fatal: whatever failed is loaded again on first use
+        log.error(e, "Warm-up failed")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_queue = None
+    if settings.webhook_processing_mode == "background":
+        job_queue = JobQueue(
+            handler=process_message_job,
+            pool_type=settings.worker_pool_type,
+            pool_size=settings.worker_pool_size,
+            max_size=settings.job_queue_max_size,
+            partitions=settings.message_partitions,
+        )
+        await job_queue.start()
+        metrics.register_collector("job_queue", job_queue.collect_metrics)
+    app.state.job_queue = job_queue
+    status_tracker = get_status_tracker()
+    if status_tracker is not None:
+        metrics.register_collector("status_tracker", status_tracker.collect_metrics)
+    # With a process worker pool the workers build their own service; the web process does not need one
+    warm_up_task = None
+    in_process = settings.webhook_processing_mode == "sync" or settings.worker_pool_type == "thread"
+    if settings.warm_up_on_startup and in_process:
+        warm_up_task = asyncio.create_task(warm_up(), name="loris-warm-up")
+    yield
+    if warm_up_task is not None:
+        await warm_up_task
+    if status_tracker is not None:
+        metrics.unregister_collector("status_tracker")
+        status_tracker.close()
+    if job_queue is not None:
+        metrics.unregister_collector("job_queue")
+        await job_queue.stop(drain_timeout=settings.job_queue_drain_timeout)
+    close_whatsapp_service()
+    ledger = get_ledger()
+    if ledger is not None:
+        ledger.close()
+    await http_clients.aclose()
+
 
-app = FastAPI(title="Loris, the AI Personal Finance Assistant API")
+app = FastAPI(title="Loris, the AI Personal Finance Assistant API", lifespan=lifespan)
 
 app.include_router(whatsapp_router.router, tags=["Loris Whatsapp Inteface"])
+app.include_router(metrics_router.router, tags=["Metrics"])
+app.include_router(ledger_router.router, tags=["Ledger"])
 
 if __name__ == '__main__':
     uvicorn.run(app, host='0.0.0.0', port=8002)
@@ -0,0 +1,312 @@
+"""
+Local stand-ins for the Graph API and the OpenAI/Groq endpoints, used by the load test.
+
+Serves media info, media download and /messages like graph.facebook.com, and chat
+completions and audio transcriptions like OpenAI and Groq (OpenAI-compatible API),
+with configurable latency and error injection per endpoint. Arrival times of the
+requests that belong to a replayed message are recorded so the load test can split
+its latency into stages.
+
+Point the app at it with:
+    META_GRAPH_BASE_URL=<url>  OPENAI_BASE_URL=<url>/openai/v1  GROQ_BASE_URL=<url>/groq
+"""
+import asyncio
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import wave
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+
+ENDPOINTS = (
+    "graph_media",
+    "graph_download",
+    "graph_messages",
+    "openai_chat",
+    "openai_transcription",
+    "groq_chat",
+    "groq_transcription",
+)
+
+FAKE_PURCHASE = {
+    "store_name": "Supermercado Teste",
+    "amount": 123.45,
+    "currency": "R$",
+    "date": "2024-03-12",
+    "payment_method": "Credit Card",
+    "category": "groceries",
+}
+FAKE_TRANSCRIPTION = "Paguei 45,90 no mercado hoje no cartao de debito"
+
+
+class EndpointBehavior:
+    """
+    Latency (seconds, plus uniform jitter) and error injection for one fake endpoint.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 500):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+def parse_behaviors(latencies: List[str], error_rates: List[str]) -> Dict[str, EndpointBehavior]:
+    """
+    Build endpoint behaviors from "endpoint=seconds[:jitter]" and "endpoint=rate" specs.
+    "graph", "openai" and "groq" apply to every endpoint of that upstream.
+    """
+    behaviors = {endpoint: EndpointBehavior() for endpoint in ENDPOINTS}
+
+    def targets(name: str) -> List[str]:
+        matched = [endpoint for endpoint in ENDPOINTS if endpoint == name or endpoint.startswith(name + "_")]
+        if not matched:
+            raise ValueError(f"Unknown endpoint '{name}', expected one of {', '.join(ENDPOINTS)}")
+        return matched
+
+    for spec in latencies:
+        name, _, value = spec.partition("=")
+        latency, _, jitter = value.partition(":")
+        for endpoint in targets(name):
+            behaviors[endpoint].latency = float(latency)
+            behaviors[endpoint].jitter = float(jitter or 0.0)
+    for spec in error_rates:
+        name, _, value = spec.partition("=")
+        for endpoint in targets(name):
+            behaviors[endpoint].error_rate = float(value)
+    return behaviors
+
+
+def default_audio_bytes(seconds: float = 2.0, sample_rate: int = 16000) -> bytes:
+    """A short mono WAV tone, for when no audio sample is given."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        frames = bytearray()
+        for index in range(int(seconds * sample_rate)):
+            value = int(8000 * ((index // 40) % 2 * 2 - 1))
+            frames += value.to_bytes(2, "little", signed=True)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def default_image_bytes() -> bytes:
+    """A small rendered receipt, for when no image sample is given."""
+    from PIL import Image, ImageDraw
+
+    lines = ["SUPERMERCADO TESTE LTDA", "CNPJ 12.345.678/0001-90", "", "ARROZ 5KG          R$ 24,90",
+             "FEIJAO 1KG         R$ 8,55", "", "TOTAL              R$ 123,45", "CARTAO DE CREDITO",
+             "DATA 12/03/2024 10:22"]
+    image = Image.new("L", (800, 40 * len(lines) + 40), 255)
+    draw = ImageDraw.Draw(image)
+    for index, line in enumerate(lines):
+        draw.text((40, 20 + index * 40), line, fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class FakeUpstreams:
+    """
+    Runs the fake upstream API in a background thread. events[key][name] holds the arrival
+    time (time.monotonic) of "media_info", "media_downloaded" (media id keys) and "reply"
+    (recipient keys) requests; stats holds per-endpoint call, error and latency counts.
+    """
+
+    def __init__(
+        self,
+        behaviors: Optional[Dict[str, EndpointBehavior]] = None,
+        image_bytes: Optional[bytes] = None,
+        audio_bytes: Optional[bytes] = None,
+        host: str = "127.0.0.1",
+        port: int = 8900,
+    ):
+        self.behaviors = behaviors or {endpoint: EndpointBehavior() for endpoint in ENDPOINTS}
+        self.image_bytes = image_bytes if image_bytes is not None else default_image_bytes()
+        self.audio_bytes = audio_bytes if audio_bytes is not None else default_audio_bytes()
+        self.host = host
+        self.port = port
+        self.events: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self.stats: Dict[str, Dict[str, float]] = {
+            endpoint: {"calls": 0, "errors": 0, "latency_total": 0.0} for endpoint in ENDPOINTS
+        }
+        self._lock = threading.Lock()
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self.app = self._build_app()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def record_event(self, key: str, name: str) -> None:
+        with self._lock:
+            self.events[key].setdefault(name, time.monotonic())
+
+    async def _inject(self, endpoint: str) -> Optional[Response]:
+        """Sleep for the endpoint's latency; return an error response if one is injected."""
+        behavior = self.behaviors[endpoint]
+        delay = behavior.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        failed = behavior.should_fail()
+        with self._lock:
+            stats = self.stats[endpoint]
+            stats["calls"] += 1
+            stats["latency_total"] += delay
+            if failed:
+                stats["errors"] += 1
+        if failed:
+            return JSONResponse(status_code=behavior.error_status,
+                                content={"error": {"message": "Injected failure", "type": "server_error"}})
+        return None
+
+    def _media_bytes(self, media_id: str) -> bytes:
+        return self.audio_bytes if media_id.startswith("aud") else self.image_bytes
+
+    @staticmethod
+    def _chat_completion(body: dict) -> dict:
+        text = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+        # Batched extractions number their texts; answer with one item per text
+        count = len(re.findall(r"### Text \d+", text))
+        payload = {"items": [FAKE_PURCHASE] * count} if count else FAKE_PURCHASE
+        arguments = json.dumps(payload)
+        tools = body.get("tools") or []
+        if tools:
+            message = {
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": "call_fake",
+                    "type": "function",
+                    "function": {"name": tools[0]["function"]["name"], "arguments": arguments},
+                }],
+            }
+        else:
+            message = {"role": "assistant", "content": arguments}
+        prompt_tokens, completion_tokens = len(text) // 4, len(arguments) // 4
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake-model"),
+            "choices": [{"index": 0, "message": message, "logprobs": None,
+                         "finish_reason": "tool_calls" if tools else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Fake upstreams")
+
+        async def chat(provider: str, request: Request) -> Response:
+            body = await request.json()
+            error = await self._inject(f"{provider}_chat")
+            return error or JSONResponse(self._chat_completion(body))
+
+        async def transcription(provider: str, request: Request) -> Response:
+            # Drain the multipart upload like the real API would; the content is not inspected
+            await request.body()
+            error = await self._inject(f"{provider}_transcription")
+            return error or JSONResponse({"text": FAKE_TRANSCRIPTION})
+
+        @app.post("/openai/v1/chat/completions")
+        async def openai_chat(request: Request):
+            return await chat("openai", request)
+
+        @app.post("/groq/openai/v1/chat/completions")
+        async def groq_chat(request: Request):
+            return await chat("groq", request)
+
+        @app.post("/openai/v1/audio/transcriptions")
+        async def openai_transcription(request: Request):
+            return await transcription("openai", request)
+
+        @app.post("/groq/openai/v1/audio/transcriptions")
+        async def groq_transcription(request: Request):
+            return await transcription("groq", request)
+
+        @app.get("/media/{media_id}")
+        async def media_download(media_id: str):
+            error = await self._inject("graph_download")
+            if error:
+                return error
+            self.record_event(media_id, "media_downloaded")
+            mime_type = "audio/wav" if media_id.startswith("aud") else "image/jpeg"
+            return Response(content=self._media_bytes(media_id), media_type=mime_type)
+
+        @app.post("/{version}/{phone_number_id}/messages")
+        async def messages(version: str, phone_number_id: str, request: Request):
+            body = await request.json()
+            error = await self._inject("graph_messages")
+            if error:
+                return error
+            self.record_event(body.get("to", ""), "reply")
+            return JSONResponse({
+                "messaging_product": "whatsapp",
+                "contacts": [{"input": body.get("to"), "wa_id": body.get("to")}],
+                "messages": [{"id": f"wamid.fake-{time.monotonic_ns()}"}],
+            })
+
+        @app.get("/{version}/{media_id}")
+        async def media_info(version: str, media_id: str, request: Request):
+            self.record_event(media_id, "media_info")
+            error = await self._inject("graph_media")
+            if error:
+                return error
+            content = self._media_bytes(media_id)
+            return JSONResponse({
+                "messaging_product": "whatsapp",
+                "url": f"{str(request.base_url).rstrip('/')}/media/{media_id}",
+                "mime_type": "audio/wav" if media_id.startswith("aud") else "image/jpeg",
+                "sha256": hashlib.sha256(content).hexdigest(),
+                "file_size": len(content),
+                "id": media_id,
+            })
+
+        return app
+
+    def start(self, timeout: float = 10.0) -> None:
+        config = uvicorn.Config(self.app, host=self.host, port=self.port, log_level="warning", access_log=False)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="fake-upstreams", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError(f"Fake upstreams did not start on {self.url}")
+            time.sleep(0.05)
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join(timeout=10)
+            self._server = None
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Per-endpoint calls, injected errors and mean injected latency."""
+        with self._lock:
+            return {
+                endpoint: {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "mean_latency": stats["latency_total"] / stats["calls"] if stats["calls"] else 0.0,
+                }
+                for endpoint, stats in self.stats.items()
+            }
@@ -0,0 +1,324 @@
+"""
+Offline load test: replays WhatsApp webhooks against /wpp-webhook with the Graph API
+and the LLM providers replaced by local fakes (benchmarks.fake_upstreams).
+
+The app is started as a subprocess pointed at the fakes (or --app-url targets one that
+is already running with META_GRAPH_BASE_URL/OPENAI_BASE_URL/GROQ_BASE_URL set), webhooks
+are sent open-loop at --rate requests per second, and latency percentiles and throughput
+are reported per stage:
+    webhook_response  request sent -> HTTP response
+    until_media_info  request sent -> media info requested (queueing, dedupe)
+    media_download    media info requested -> media served
+    processing        media served (or request sent, for text) -> reply sent (OCR/transcription, LLM, save)
+    end_to_end        request sent -> reply sent
+
+Payloads are WhatsAppWebhook JSON files as Meta sends them; message ids, senders and media
+ids are made unique per request unless --keep-ids is given. Without --payloads, text, image
+and audio webhooks are generated according to --mix.
+
+Usage (from the app folder):
+    python -m benchmarks.load_test --rate 10 --requests 200 --latency openai=0.8:0.2 --error-rate openai=0.05
+"""
+import argparse
+import asyncio
+import copy
+import glob
+import hashlib
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_upstreams import ENDPOINTS, FakeUpstreams, parse_behaviors  # noqa: E402
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STAGES = ("webhook_response", "until_media_info", "media_download", "processing", "end_to_end")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _synthetic_payload(message_type: str) -> Dict[str, Any]:
+    message: Dict[str, Any] = {"from": "5500000000000", "id": "wamid.load", "timestamp": str(int(time.time())),
+                               "type": message_type}
+    if message_type == "text":
+        message["text"] = {"body": "Gastei R$ 32,50 na padaria hoje no pix"}
+    elif message_type == "image":
+        message["image"] = {"mime_type": "image/jpeg", "sha256": "", "id": "img"}
+    else:
+        message["audio"] = {"mime_type": "audio/wav", "sha256": "", "id": "aud", "voice": True}
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "0", "changes": [{"field": "messages", "value": {
+            "messaging_product": "whatsapp",
+            "metadata": {"display_phone_number": "5500000000001", "phone_number_id": "fake-phone"},
+            "contacts": [{"profile": {"name": "Load Test"}, "wa_id": "5500000000000"}],
+            "messages": [message],
+        }}]}],
+    }
+
+
+def _load_payloads(folder: Optional[str], mix: Dict[str, int]) -> List[Dict[str, Any]]:
+    if folder:
+        payloads = []
+        for path in sorted(glob.glob(os.path.join(folder, "*.json"))):
+            with open(path, encoding="utf-8") as f:
+                payloads.append(json.load(f))
+        return payloads
+    return [_synthetic_payload(message_type) for message_type, weight in mix.items() for _ in range(weight)]
+
+
+def _make_unique(payload: Dict[str, Any], sequence: int) -> Dict[str, Any]:
+    """Give every message its own id, sender and media id so dedupe and caches don't short-circuit it."""
+    payload = copy.deepcopy(payload)
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            for index, message in enumerate(change.get("value", {}).get("messages") or []):
+                suffix = f"{sequence}-{index}"
+                message["id"] = f"wamid.load-{suffix}"
+                message["from"] = f"55{sequence:09d}{index}"
+                for kind, prefix in (("image", "img"), ("audio", "aud"), ("document", "doc")):
+                    if kind in message:
+                        message[kind]["id"] = f"{prefix}-{suffix}"
+                        message[kind]["sha256"] = hashlib.sha256(suffix.encode()).hexdigest()
+    return payload
+
+
+def _tracked_messages(payload: Dict[str, Any]) -> List[Dict[str, Optional[str]]]:
+    tracked = []
+    for entry in payload.get("entry", []):
+        for change in entry.get("changes", []):
+            for message in change.get("value", {}).get("messages") or []:
+                media = message.get("image") or message.get("audio") or message.get("document") or {}
+                tracked.append({"sender": message.get("from"), "media_id": media.get("id"), "type": message.get("type")})
+    return tracked
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _summarize(samples: Dict[str, List[tuple]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for stage in STAGES:
+        intervals = samples.get(stage, [])
+        if not intervals:
+            continue
+        durations = sorted(end - start for start, end in intervals)
+        window = max(end for _, end in intervals) - min(start for start, _ in intervals)
+        summary[stage] = {
+            "count": len(durations),
+            "p50": _percentile(durations, 0.50),
+            "p95": _percentile(durations, 0.95),
+            "p99": _percentile(durations, 0.99),
+            "throughput": len(durations) / window if window > 0 else float("nan"),
+        }
+    return summary
+
+
+class LoadTest:
+    def __init__(self, app_url: str, upstreams: FakeUpstreams, payloads: List[Dict[str, Any]], rate: float,
+                 requests: int, keep_ids: bool, drain_timeout: float):
+        self.app_url = app_url.rstrip("/")
+        self.upstreams = upstreams
+        self.payloads = payloads
+        self.rate = rate
+        self.requests = requests
+        self.keep_ids = keep_ids
+        self.drain_timeout = drain_timeout
+        self.sent: List[Dict[str, Any]] = []
+        self.status_codes: Dict[int, int] = {}
+
+    async def _send(self, client: httpx.AsyncClient, payload: Dict[str, Any]) -> None:
+        record = {"messages": _tracked_messages(payload), "sent": time.monotonic(), "responded": None}
+        self.sent.append(record)
+        try:
+            response = await client.post(f"{self.app_url}/wpp-webhook", json=payload)
+            status = response.status_code
+        except httpx.HTTPError:
+            status = 0
+        record["responded"] = time.monotonic()
+        record["status"] = status
+        self.status_codes[status] = self.status_codes.get(status, 0) + 1
+
+    async def run(self) -> float:
+        payload_cycle = itertools.cycle(self.payloads)
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+        async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(300.0)) as client:
+            start = time.monotonic()
+            tasks = []
+            # Open loop: requests go out on schedule whether or not earlier ones have answered
+            for sequence in range(self.requests):
+                delay = start + sequence / self.rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                payload = next(payload_cycle)
+                if not self.keep_ids:
+                    payload = _make_unique(payload, sequence)
+                tasks.append(asyncio.create_task(self._send(client, payload)))
+            await asyncio.gather(*tasks)
+        await self._wait_for_replies()
+        return time.monotonic() - start
+
+    def pending_replies(self) -> int:
+        events = self.upstreams.events
+        return sum(1 for record in self.sent for message in record["messages"]
+                   if record.get("status") == 200 and "reply" not in events.get(message["sender"], {}))
+
+    async def _wait_for_replies(self) -> None:
+        # Background mode answers before processing; wait for the replies to reach the fake /messages
+        deadline = time.monotonic() + self.drain_timeout
+        while self.pending_replies() and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+
+    def stage_samples(self) -> Dict[str, List[tuple]]:
+        samples: Dict[str, List[tuple]] = {stage: [] for stage in STAGES}
+        events = self.upstreams.events
+        for record in self.sent:
+            sent = record["sent"]
+            if record["responded"] is not None:
+                samples["webhook_response"].append((sent, record["responded"]))
+            for message in record["messages"]:
+                media_events = events.get(message["media_id"] or "", {})
+                reply = events.get(message["sender"] or "", {}).get("reply")
+                media_info = media_events.get("media_info")
+                downloaded = media_events.get("media_downloaded")
+                if media_info:
+                    samples["until_media_info"].append((sent, media_info))
+                if media_info and downloaded:
+                    samples["media_download"].append((media_info, downloaded))
+                if reply:
+                    processing_start = downloaded if message["media_id"] else sent
+                    if processing_start:
+                        samples["processing"].append((processing_start, reply))
+                    samples["end_to_end"].append((sent, reply))
+        return samples
+
+
+def _start_app(port: int, upstreams_url: str, data_path: str, extra_env: List[str]) -> subprocess.Popen:
+    env = dict(os.environ)
+    for name, value in {
+        "META_ACCESS_TOKEN": "load-test", "META_APP_ID": "load-test", "META_APP_SECRET": "load-test",
+        "META_API_VERSION": "v22.0", "META_PHONE_NUMBER_ID": "fake-phone", "META_VERIFY_TOKEN": "load-test",
+        "OPEN_AI_MODEL": "gpt-4o-mini", "OPEN_AI_API_KEY": "load-test",
+        "GROQ_MODEL": "llama-3.3-70b-versatile", "GROQ_API_KEY": "load-test",
+    }.items():
+        env.setdefault(name, value)
+    env["LOCAL_DATA_PATH"] = data_path
+    env["META_GRAPH_BASE_URL"] = upstreams_url
+    env["OPENAI_BASE_URL"] = f"{upstreams_url}/openai/v1"
+    env["GROQ_BASE_URL"] = f"{upstreams_url}/groq"
+    for item in extra_env:
+        name, _, value = item.partition("=")
+        env[name] = value
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=APP_DIR, env=env,
+    )
+
+
+def _wait_until_up(url: str, process: Optional[subprocess.Popen], timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"App exited with code {process.returncode}")
+        try:
+            httpx.get(f"{url}/wpp-webhook", timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"App did not come up on {url}")
+
+
+def _parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in ("text", "image", "audio"):
+            raise argparse.ArgumentTypeError(f"Unknown message type in mix: {name}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay WhatsApp webhooks against fake upstreams")
+    parser.add_argument("--payloads", help="Folder with recorded WhatsAppWebhook .json payloads")
+    parser.add_argument("--mix", type=_parse_mix, default={"text": 1, "image": 1, "audio": 1},
+                        help="Synthetic message mix when no payloads are given, e.g. text=2,image=1")
+    parser.add_argument("--rate", type=float, default=5.0, help="Webhook requests per second")
+    parser.add_argument("--requests", type=int, default=100, help="Total webhook requests")
+    parser.add_argument("--latency", action="append", default=[],
+                        help="Injected latency, endpoint=seconds[:jitter] (endpoints: %s, or graph/openai/groq)" % ", ".join(ENDPOINTS))
+    parser.add_argument("--error-rate", action="append", default=[], help="Injected error rate, endpoint=fraction")
+    parser.add_argument("--image", help="Image served for media downloads (default: rendered receipt)")
+    parser.add_argument("--audio", help="Audio served for media downloads (default: generated WAV)")
+    parser.add_argument("--app-url", help="Target an already running app instead of starting one")
+    parser.add_argument("--upstream-port", type=int, default=0, help="Port for the fake upstreams (default: free port)")
+    parser.add_argument("--env", action="append", default=[], help="Extra KEY=VALUE for the spawned app")
+    parser.add_argument("--keep-ids", action="store_true", help="Replay payloads without making ids unique")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="Seconds to wait for pending replies")
+    args = parser.parse_args()
+
+    payloads = _load_payloads(args.payloads, args.mix)
+    if not payloads:
+        parser.error(f"No .json payloads found in {args.payloads}")
+
+    def read(path: Optional[str]) -> Optional[bytes]:
+        if not path:
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    upstreams = FakeUpstreams(
+        behaviors=parse_behaviors(args.latency, args.error_rate),
+        image_bytes=read(args.image),
+        audio_bytes=read(args.audio),
+        port=args.upstream_port or _free_port(),
+    )
+    upstreams.start()
+    process = None
+    data_dir = tempfile.TemporaryDirectory(prefix="loris-load-")
+    try:
+        app_url = args.app_url
+        if not app_url:
+            port = _free_port()
+            process = _start_app(port, upstreams.url, data_dir.name, args.env)
+            app_url = f"http://127.0.0.1:{port}"
+        _wait_until_up(app_url, process)
+
+        test = LoadTest(app_url, upstreams, payloads, args.rate, args.requests, args.keep_ids, args.drain_timeout)
+        elapsed = asyncio.run(test.run())
+        summary = _summarize(test.stage_samples())
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        upstreams.stop()
+        data_dir.cleanup()
+
+    print(f"{args.requests} requests at {args.rate}/s in {elapsed:.1f}s, status codes {test.status_codes}, "
+          f"replies pending {test.pending_replies()}")
+    print(f"{'stage':<18}{'count':>8}{'p50 s':>10}{'p95 s':>10}{'p99 s':>10}{'per s':>10}")
+    for stage, stats in summary.items():
+        print(f"{stage:<18}{stats['count']:>8}{stats['p50']:>10.3f}{stats['p95']:>10.3f}"
+              f"{stats['p99']:>10.3f}{stats['throughput']:>10.2f}")
+    print(f"\n{'upstream':<22}{'calls':>8}{'errors':>8}{'mean latency s':>16}")
+    for endpoint, stats in upstreams.snapshot().items():
+        if stats["calls"]:
+            print(f"{endpoint:<22}{stats['calls']:>8}{stats['errors']:>8}{stats['mean_latency']:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
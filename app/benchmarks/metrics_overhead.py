@@ -0,0 +1,63 @@
+"""
+Hot-path cost of the metrics instrumentation.
+
+Times the operations _handle_message performs per message (stage timers, counters,
+in-flight gauge) against an empty loop, with metrics enabled and disabled, and
+reports the added cost per message.
+
+Usage (from the app folder):
+    python -m benchmarks.metrics_overhead --iterations 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import MetricsRegistry  # noqa: E402
+
+# Stage timers opened for an OCR'd image going through the LLM
+STAGES_PER_MESSAGE = ("total", "dedupe", "media_download", "ocr", "fast_path", "compaction", "llm",
+                      "save_json", "send_message")
+
+
+def _per_message(registry: MetricsRegistry):
+    stage_seconds = registry.histogram("bench_stage_seconds", "bench", ("stage", "message_type"))
+    messages = registry.counter("bench_messages", "bench", ("message_type", "outcome"))
+    in_flight = registry.gauge("bench_in_flight", "bench")
+
+    def handle() -> None:
+        in_flight.inc()
+        for stage in STAGES_PER_MESSAGE:
+            with stage_seconds.labels(stage, "image").time():
+                pass
+        messages.labels("image", "success").inc()
+        in_flight.dec()
+
+    return handle
+
+
+def _time(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure the per-message cost of metrics instrumentation")
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    baseline = _time(lambda: None, args.iterations)
+    print(f"{'mode':<10}{'us/message':>12}{'ns/operation':>14}")
+    operations = len(STAGES_PER_MESSAGE) + 3
+    for label, enabled in (("enabled", True), ("disabled", False)):
+        handle = _per_message(MetricsRegistry(enabled=enabled))
+        cost = _time(handle, args.iterations) - baseline
+        print(f"{label:<10}{cost * 1e6:>12.2f}{cost * 1e9 / operations:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
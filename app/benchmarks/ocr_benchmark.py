@@ -0,0 +1,112 @@
+"""
+OCR throughput/accuracy benchmark, with and without image preprocessing.
+
+Runs every image in a folder through OCREngine and reports throughput and, for
+images that have a ground-truth sidecar (receipt.jpg -> receipt.txt), the text
+similarity between the OCR output and the expected text.
+
+Usage (from the app folder):
+    python -m benchmarks.ocr_benchmark /path/to/receipts --pool-size 4
+"""
+import argparse
+import difflib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.ocr_engine import OCR_BACKENDS, OCREngine  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.split()).lower()
+
+
+def _load_samples(folder: str) -> List[Dict[str, Optional[str]]]:
+    samples = []
+    for name in sorted(os.listdir(folder)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        path = os.path.join(folder, name)
+        truth_path = os.path.splitext(path)[0] + ".txt"
+        truth = None
+        if os.path.exists(truth_path):
+            with open(truth_path, encoding="utf-8") as f:
+                truth = f.read()
+        samples.append({"path": path, "truth": truth})
+    return samples
+
+
+def run(samples: List[Dict[str, Optional[str]]], engine: OCREngine, concurrency: int, repeat: int) -> Dict[str, float]:
+    jobs = [sample for _ in range(repeat) for sample in samples]
+    latencies = []
+
+    def recognize(sample):
+        start = time.perf_counter()
+        text = engine.image_to_string(sample["path"])
+        latencies.append(time.perf_counter() - start)
+        return sample, text
+
+    # Warm the pool up so process startup is not measured
+    engine.image_to_string(samples[0]["path"])
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(recognize, jobs))
+    elapsed = time.perf_counter() - start
+
+    scores = [
+        difflib.SequenceMatcher(None, _normalize(sample["truth"]), _normalize(text)).ratio()
+        for sample, text in results[:len(samples)]
+        if sample["truth"] is not None
+    ]
+    latencies.sort()
+    return {
+        "images": len(jobs),
+        "seconds": elapsed,
+        "images_per_second": len(jobs) / elapsed if elapsed else 0.0,
+        "p50_latency": latencies[len(latencies) // 2],
+        "p95_latency": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "accuracy": sum(scores) / len(scores) if scores else float("nan"),
+        "scored_images": len(scores),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark OCR with and without image preprocessing")
+    parser.add_argument("folder", help="Folder with receipt images and optional .txt ground truth")
+    parser.add_argument("--pool-size", type=int, default=os.cpu_count() or 2, help="OCR worker processes")
+    parser.add_argument("--backend", choices=OCR_BACKENDS, default="pytesseract", help="Tesseract integration")
+    parser.add_argument("--repeat", type=int, default=1, help="Times each image is processed")
+    parser.add_argument("--target-dpi", type=int, default=300)
+    parser.add_argument("--document-width-inches", type=float, default=4.0)
+    args = parser.parse_args()
+
+    samples = _load_samples(args.folder)
+    if not samples:
+        parser.error(f"No images found in {args.folder}")
+
+    print(f"{len(samples)} images, backend {args.backend}, pool size {args.pool_size}, repeat {args.repeat}")
+    print(f"{'mode':<14}{'img/s':>10}{'p50 s':>10}{'p95 s':>10}{'accuracy':>10}")
+    for label, preprocess in (("raw", False), ("preprocessed", True)):
+        engine = OCREngine(
+            pool_size=args.pool_size,
+            backend=args.backend,
+            preprocess=preprocess,
+            target_dpi=args.target_dpi,
+            document_width_inches=args.document_width_inches,
+        )
+        try:
+            stats = run(samples, engine, concurrency=max(1, args.pool_size), repeat=args.repeat)
+        finally:
+            engine.shutdown()
+        print(f"{label:<14}{stats['images_per_second']:>10.2f}{stats['p50_latency']:>10.3f}"
+              f"{stats['p95_latency']:>10.3f}{stats['accuracy']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
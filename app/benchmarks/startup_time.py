@@ -0,0 +1,102 @@
+"""
+Startup-time benchmark: how long importing the app takes, and which modules it pulls in.
+
+Runs `python -X importtime -c "import app"` in fresh interpreters (with placeholder
+credentials when they are not set), reports the median import time, the slowest modules
+by cumulative import time, and whether any of the heavy modules that should load lazily
+(provider SDKs, langchain, OCR) were imported. Exits with status 1 when --max-ms is
+exceeded or a lazy module was imported, so it can guard against regressions in CI.
+
+Usage (from the app folder):
+    python -m benchmarks.startup_time --runs 5 --top 15 --max-ms 800
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Top-level packages that must not be imported by `import app`; they load on first use or during warm-up
+LAZY_MODULES = ("langchain", "langchain_core", "langchain_openai", "langchain_groq", "openai", "groq",
+                "pytesseract", "tesserocr", "PIL", "numpy")
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+PLACEHOLDER_ENV = {
+    "META_ACCESS_TOKEN": "startup-benchmark", "META_APP_ID": "startup-benchmark", "META_APP_SECRET": "startup-benchmark",
+    "META_API_VERSION": "v22.0", "META_PHONE_NUMBER_ID": "startup-benchmark", "META_VERIFY_TOKEN": "startup-benchmark",
+    "OPEN_AI_MODEL": "gpt-4o-mini", "OPEN_AI_API_KEY": "startup-benchmark",
+    "GROQ_MODEL": "llama-3.3-70b-versatile", "GROQ_API_KEY": "startup-benchmark",
+}
+
+
+def _import_once(module: str, env: Dict[str, str]) -> Tuple[float, Dict[str, int]]:
+    """Wall time of one import in a fresh interpreter and the cumulative microseconds per module."""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=APP_DIR, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"import {module} failed:\n" + "\n".join(errors[-20:]))
+    cumulative: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2))
+    return elapsed, cumulative
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure app import time")
+    parser.add_argument("--module", default="app", help="Module to import (default: app)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules to list")
+    parser.add_argument("--max-ms", type=float, help="Fail when the median import time exceeds this")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    for name, value in PLACEHOLDER_ENV.items():
+        env.setdefault(name, value)
+    data_dir = tempfile.TemporaryDirectory(prefix="loris-startup-")
+    env.setdefault("LOCAL_DATA_PATH", data_dir.name)
+
+    wall_times: List[float] = []
+    runs: List[Dict[str, int]] = []
+    try:
+        for _ in range(args.runs):
+            elapsed, cumulative = _import_once(args.module, env)
+            wall_times.append(elapsed)
+            runs.append(cumulative)
+    finally:
+        data_dir.cleanup()
+
+    modules = set().union(*runs)
+    median_us = {name: statistics.median(run.get(name, 0) for run in runs) for name in modules}
+    import_ms = median_us.get(args.module, 0) / 1000
+    print(f"import {args.module}: {import_ms:.1f} ms (median of {args.runs}, "
+          f"interpreter + import wall time {statistics.median(wall_times) * 1000:.1f} ms)")
+    print(f"\n{'module':<48}{'cumulative ms':>14}")
+    for name, value in sorted(median_us.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{name:<48}{value / 1000:>14.1f}")
+
+    imported_lazy = sorted(name for name in LAZY_MODULES if name in modules)
+    failed = False
+    if imported_lazy:
+        print(f"\nFAIL: imported at startup, expected to load lazily: {', '.join(imported_lazy)}")
+        failed = True
+    if args.max_ms is not None and import_ms > args.max_ms:
+        print(f"\nFAIL: import took {import_ms:.1f} ms, budget is {args.max_ms:.1f} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
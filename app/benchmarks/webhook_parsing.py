@@ -0,0 +1,86 @@
+"""
+Per-request webhook parsing cost: the old json -> fix_keys -> WhatsAppWebhook(**body)
+path against validating the raw bytes directly (helpers.parse_webhook).
+
+Usage (from the app folder):
+    python -m benchmarks.webhook_parsing --iterations 20000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers import parse_webhook  # noqa: E402
+from model.whatsapp_model import WhatsAppWebhook  # noqa: E402
+
+METADATA = {"display_phone_number": "5511999999999", "phone_number_id": "123456789012345"}
+
+PAYLOADS = {
+    "image message": {
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "987654321", "changes": [{"field": "messages", "value": {
+            "messaging_product": "whatsapp",
+            "metadata": METADATA,
+            "contacts": [{"profile": {"name": "Maria"}, "wa_id": "5511988887777"}],
+            "messages": [{
+                "from": "5511988887777", "id": "wamid.HBgNNTUxMTk4ODg4Nzc3NxUCABIYFDNBMjE", "timestamp": "1710240000",
+                "type": "image",
+                "image": {"mime_type": "image/jpeg", "sha256": "b1946ac92492d2347c6235b4d2611184", "id": "1234567890"},
+            }],
+        }}]}],
+    },
+    "status": {
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "987654321", "changes": [{"field": "messages", "value": {
+            "messaging_product": "whatsapp",
+            "metadata": METADATA,
+            "statuses": [{
+                "id": "wamid.HBgNNTUxMTk4ODg4Nzc3NxUCABEYEjQ1", "status": "delivered", "timestamp": "1710240005",
+                "recipient_id": "5511988887777",
+                "conversation": {"id": "c0nv3rsat10n", "origin": {"type": "service"}},
+                "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"},
+            }],
+        }}]}],
+    },
+}
+
+
+def legacy_fix_keys(data):
+    # The rename pass the webhook route used before validating into the models
+    if isinstance(data, dict):
+        return {("from_" if k == "from" else k): legacy_fix_keys(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [legacy_fix_keys(i) for i in data]
+    return data
+
+
+def legacy_parse(raw: bytes) -> WhatsAppWebhook:
+    return WhatsAppWebhook(**legacy_fix_keys(json.loads(raw)))
+
+
+def _time(fn, raw: bytes, iterations: int) -> float:
+    fn(raw)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(raw)
+    return (time.perf_counter() - start) / iterations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare webhook parsing paths")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'payload':<16}{'before us':>12}{'after us':>12}{'speedup':>10}")
+    for name, payload in PAYLOADS.items():
+        raw = json.dumps(payload).encode("utf-8")
+        before = _time(legacy_parse, raw, args.iterations)
+        after = _time(parse_webhook, raw, args.iterations)
+        print(f"{name:<16}{before * 1e6:>12.2f}{after * 1e6:>12.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -22,21 +23,218 @@ class Settings:
         self.local_document_path = os.path.join(self.local_data_path, 'document')
         self.local_text_path = os.path.join(self.local_data_path, 'text')
         self.local_json_output_path = os.path.join(self.local_data_path, 'json_output')
-        
-        # Ensure Local Directories exists
-        os.makedirs(self.local_image_path, exist_ok=True)
-        os.makedirs(self.local_ocr_text_path, exist_ok=True)
-        os.makedirs(self.localt_audio_path, exist_ok=True)
-        os.makedirs(self.local_document_path, exist_ok=True)
-        os.makedirs(self.local_text_path, exist_ok=True)
-        os.makedirs(self.local_json_output_path, exist_ok=True)
+        # Local directories are created by ensure_local_directories(), not at import
+        self._local_directories_ready = False
+
+        # Webhook processing: "sync" handles the message inside the request,
+        # "background" acknowledges immediately and hands it to the job queue
+        self.webhook_processing_mode = self._get_env_variable('WEBHOOK_PROCESSING_MODE', default='sync').lower()
+        self.worker_pool_type = self._get_env_variable('WORKER_POOL_TYPE', default='thread').lower()
+        self.worker_pool_size = self._get_int_env_variable('WORKER_POOL_SIZE', default=4)
+        self.job_queue_max_size = self._get_int_env_variable('JOB_QUEUE_MAX_SIZE', default=1000)
+        self.job_queue_drain_timeout = self._get_float_env_variable('JOB_QUEUE_DRAIN_TIMEOUT', default=30.0)
+        # Max messages from one batched webhook processed at the same time in sync mode
+        self.message_concurrency = self._get_int_env_variable('MESSAGE_CONCURRENCY', default=8)
+        # Messages are partitioned by sender: the same sender's messages are handled in order,
+        # different senders in parallel (job queue consumers in background mode, locks in sync mode)
+        self.message_partitions = self._get_int_env_variable('MESSAGE_PARTITIONS', default=16)
+
+        # Shared HTTP connection pools (one per upstream: Graph API, OpenAI, Groq)
+        self.http_pool_max_connections = self._get_int_env_variable('HTTP_POOL_MAX_CONNECTIONS', default=20)
+        self.http_pool_max_keepalive = self._get_int_env_variable('HTTP_POOL_MAX_KEEPALIVE', default=10)
+        self.http_pool_keepalive_expiry = self._get_float_env_variable('HTTP_POOL_KEEPALIVE_EXPIRY', default=30.0)
+        self.http_timeout = self._get_float_env_variable('HTTP_TIMEOUT', default=30.0)
+
+        # Idempotency index: "memory" (per process) or "sqlite" (durable, shared by worker processes)
+        self.idempotency_backend = self._get_env_variable('IDEMPOTENCY_BACKEND', default='memory').lower()
+        self.idempotency_db_path = self._get_env_variable(
+            'IDEMPOTENCY_DB_PATH', default=os.path.join(self.local_data_path, 'idempotency.db'))
+        self.idempotency_ttl = self._get_float_env_variable('IDEMPOTENCY_TTL', default=604800.0)
+        self.idempotency_lease_ttl = self._get_float_env_variable('IDEMPOTENCY_LEASE_TTL', default=900.0)
+        self.idempotency_max_entries = self._get_int_env_variable('IDEMPOTENCY_MAX_ENTRIES', default=100000)
+
+        # Media result cache keyed by the sha256 Meta sends with each image/audio
+        self.media_cache_max_entries = self._get_int_env_variable('MEDIA_CACHE_MAX_ENTRIES', default=1024)
+        self.media_cache_disk_enabled = self._get_bool_env_variable('MEDIA_CACHE_DISK_ENABLED', default=False)
+        self.media_cache_db_path = self._get_env_variable(
+            'MEDIA_CACHE_DB_PATH', default=os.path.join(self.local_data_path, 'cache.db'))
+        self.media_cache_disk_max_entries = self._get_int_env_variable('MEDIA_CACHE_DISK_MAX_ENTRIES', default=100000)
+
+        # OCR worker processes and image preprocessing before Tesseract (pool size 0 runs OCR inline)
+        self.ocr_pool_size = self._get_int_env_variable('OCR_POOL_SIZE', default=2)
+        # "pytesseract" runs the tesseract binary per image, "tesserocr" keeps a warm in-process API per worker
+        self.ocr_processor = self._get_env_variable('OCR_PROCESSOR', default='pytesseract').lower()
+        self.ocr_preprocess = self._get_bool_env_variable('OCR_PREPROCESS', default=True)
+        self.ocr_target_dpi = self._get_int_env_variable('OCR_TARGET_DPI', default=300)
+        self.ocr_document_width_inches = self._get_float_env_variable('OCR_DOCUMENT_WIDTH_INCHES', default=4.0)
+
+        # Media download: in-memory mode hands the download buffer straight to OCR/transcription
+        # and archives to disk in the background (if enabled)
+        self.media_in_memory = self._get_bool_env_variable('MEDIA_IN_MEMORY', default=False)
+        self.media_archive = self._get_bool_env_variable('MEDIA_ARCHIVE', default=True)
+        self.media_archive_workers = self._get_int_env_variable('MEDIA_ARCHIVE_WORKERS', default=2)
+        self.media_download_chunk_size = self._get_int_env_variable('MEDIA_DOWNLOAD_CHUNK_SIZE', default=262144)
+
+        # LLM provider routing: rolling stats window, circuit breaker and optional hedged requests
+        self.llm_router_window = self._get_int_env_variable('LLM_ROUTER_WINDOW', default=100)
+        self.llm_circuit_failure_threshold = self._get_int_env_variable('LLM_CIRCUIT_FAILURE_THRESHOLD', default=5)
+        self.llm_circuit_cooldown = self._get_float_env_variable('LLM_CIRCUIT_COOLDOWN', default=30.0)
+        self.llm_hedge_enabled = self._get_bool_env_variable('LLM_HEDGE_ENABLED', default=False)
+        self.llm_hedge_percentile = self._get_float_env_variable('LLM_HEDGE_PERCENTILE', default=0.95)
+        self.llm_hedge_min_samples = self._get_int_env_variable('LLM_HEDGE_MIN_SAMPLES', default=20)
+
+        # Rule-based receipt extraction; the LLM is only called below the confidence threshold
+        self.fast_path_enabled = self._get_bool_env_variable('FAST_PATH_ENABLED', default=True)
+        self.fast_path_confidence_threshold = self._get_float_env_variable('FAST_PATH_CONFIDENCE_THRESHOLD', default=0.8)
+
+        # LLM extraction cache keyed by normalized text + model + prompt version
+        self.llm_cache_enabled = self._get_bool_env_variable('LLM_CACHE_ENABLED', default=True)
+        self.llm_cache_max_entries = self._get_int_env_variable('LLM_CACHE_MAX_ENTRIES', default=4096)
+        self.llm_cache_ttl = self._get_float_env_variable('LLM_CACHE_TTL', default=86400.0)
+        self.llm_cache_disk_enabled = self._get_bool_env_variable('LLM_CACHE_DISK_ENABLED', default=False)
+        self.llm_cache_db_path = self._get_env_variable(
+            'LLM_CACHE_DB_PATH', default=os.path.join(self.local_data_path, 'cache.db'))
+        self.llm_cache_disk_max_entries = self._get_int_env_variable('LLM_CACHE_DISK_MAX_ENTRIES', default=100000)
+
+        # Micro-batching of concurrent LLM extractions (up to N items or M milliseconds per batch)
+        self.llm_batch_enabled = self._get_bool_env_variable('LLM_BATCH_ENABLED', default=False)
+        self.llm_batch_max_size = self._get_int_env_variable('LLM_BATCH_MAX_SIZE', default=8)
+        self.llm_batch_max_wait_ms = self._get_float_env_variable('LLM_BATCH_MAX_WAIT_MS', default=50.0)
+
+        # LLM extraction mode: "parser" (format instructions + output parser) or
+        # "structured" (provider-native JSON schema / tool calling, compact prompt)
+        self.llm_extraction_mode = self._get_env_variable('LLM_EXTRACTION_MODE', default='parser').lower()
+
+        # Relevance-ranked compaction of OCR text before it is sent to the LLM
+        self.ocr_compaction_enabled = self._get_bool_env_variable('OCR_COMPACTION_ENABLED', default=True)
+        self.ocr_compaction_token_budget = self._get_int_env_variable('OCR_COMPACTION_TOKEN_BUDGET', default=600)
+        self.ocr_compaction_chars_per_token = self._get_float_env_variable('OCR_COMPACTION_CHARS_PER_TOKEN', default=4.0)
+
+        # Upstream base URLs; overridden to point the app at local fakes in load tests
+        self.meta_graph_base_url = self._get_env_variable('META_GRAPH_BASE_URL', default='https://graph.facebook.com').rstrip('/')
+        self.openai_base_url = self._get_env_variable('OPENAI_BASE_URL', default='') or None
+        self.groq_base_url = self._get_env_variable('GROQ_BASE_URL', default='') or None
+
+        # Prometheus-format metrics exposed on /metrics
+        self.metrics_enabled = self._get_bool_env_variable('METRICS_ENABLED', default=True)
+
+        # Logging: records are formatted and written by a background listener thread
+        self.log_level = self._get_env_variable('LOG_LEVEL', default='INFO').upper()
+        self.log_format = self._get_env_variable('LOG_FORMAT', default='text').lower()
+
+        # Delivery/read status tracking: "off", "memory" (ring buffer) or "sqlite" (batch-flushed store)
+        self.status_tracking = self._get_env_variable('STATUS_TRACKING', default='off').lower()
+        self.status_buffer_size = self._get_int_env_variable('STATUS_BUFFER_SIZE', default=10000)
+        self.status_db_path = self._get_env_variable(
+            'STATUS_DB_PATH', default=os.path.join(self.local_data_path, 'statuses.db'))
+        self.status_flush_interval = self._get_float_env_variable('STATUS_FLUSH_INTERVAL', default=1.0)
+        self.status_flush_batch_size = self._get_int_env_variable('STATUS_FLUSH_BATCH_SIZE', default=500)
+
+        # Heavy modules (provider SDKs, langchain, OCR) load on first use; with warm-up enabled
+        # they are loaded in the background right after startup instead of on the first message
+        self.warm_up_on_startup = self._get_bool_env_variable('WARM_UP_ON_STARTUP', default=True)
+
+        # Voice notes: decode to 16 kHz mono, trim silence (energy VAD) and transcribe chunks in parallel.
+        # OGG/Opus decoding needs the ffmpeg binary; without it the original audio is sent
+        self.audio_preprocess_enabled = self._get_bool_env_variable('AUDIO_PREPROCESS_ENABLED', default=True)
+        self.audio_vad_energy_ratio = self._get_float_env_variable('AUDIO_VAD_ENERGY_RATIO', default=3.0)
+        self.audio_min_silence_ms = self._get_int_env_variable('AUDIO_MIN_SILENCE_MS', default=500)
+        self.audio_speech_padding_ms = self._get_int_env_variable('AUDIO_SPEECH_PADDING_MS', default=200)
+        self.audio_chunk_seconds = self._get_float_env_variable('AUDIO_CHUNK_SECONDS', default=30.0)
+        self.audio_transcription_concurrency = self._get_int_env_variable('AUDIO_TRANSCRIPTION_CONCURRENCY', default=4)
+        # Opus bitrate of the uploaded speech chunks (ffmpeg syntax); speech stays clear for Whisper at 24k
+        self.audio_chunk_bitrate = self._get_env_variable('AUDIO_CHUNK_BITRATE', default='24k')
+
+        # Storage: "sqlite" keeps metadata, text, OCR text and JSON output in one indexed database and media
+        # in a sharded content-addressed tree; "files" is the legacy one-file-per-message directory layout
+        self.storage_backend = self._get_env_variable('STORAGE_BACKEND', default='sqlite').lower()
+        self.storage_db_path = self._get_env_variable(
+            'STORAGE_DB_PATH', default=os.path.join(self.local_data_path, 'messages.db'))
+        self.storage_media_path = self._get_env_variable(
+            'STORAGE_MEDIA_PATH', default=os.path.join(self.local_data_path, 'media'))
+
+        # Ledger of extracted purchases per sender, with day/month/category rollups.
+        # The query API (/ledger/...) is only served when LEDGER_API_TOKEN is set
+        self.ledger_enabled = self._get_bool_env_variable('LEDGER_ENABLED', default=True)
+        self.ledger_db_path = self._get_env_variable(
+            'LEDGER_DB_PATH', default=os.path.join(self.local_data_path, 'ledger.db'))
+        self.ledger_api_token = self._get_env_variable('LEDGER_API_TOKEN', default='')
+
+        # Outbound replies: sent from a background queue paced to the number's throughput limit
+        # (Meta's default is 80 messages/second per number), retried on 429/5xx with jittered backoff
+        self.outbound_dispatcher_enabled = self._get_bool_env_variable('OUTBOUND_DISPATCHER_ENABLED', default=True)
+        self.outbound_rate_per_second = self._get_float_env_variable('OUTBOUND_RATE_PER_SECOND', default=80.0)
+        self.outbound_burst = self._get_float_env_variable('OUTBOUND_BURST', default=20.0)
+        self.outbound_concurrency = self._get_int_env_variable('OUTBOUND_CONCURRENCY', default=8)
+        self.outbound_max_attempts = self._get_int_env_variable('OUTBOUND_MAX_ATTEMPTS', default=5)
+        self.outbound_backoff_base = self._get_float_env_variable('OUTBOUND_BACKOFF_BASE', default=0.5)
+        self.outbound_backoff_max = self._get_float_env_variable('OUTBOUND_BACKOFF_MAX', default=30.0)
+        self.outbound_queue_max_size = self._get_int_env_variable('OUTBOUND_QUEUE_MAX_SIZE', default=10000)
+        self.outbound_reply_timeout = self._get_float_env_variable('OUTBOUND_REPLY_TIMEOUT', default=120.0)
+
+        if self.webhook_processing_mode not in ("sync", "background"):
+            raise ValueError(f"Unsupported WEBHOOK_PROCESSING_MODE: {self.webhook_processing_mode}")
+        if self.worker_pool_type not in ("thread", "process"):
+            raise ValueError(f"Unsupported WORKER_POOL_TYPE: {self.worker_pool_type}")
+        if self.storage_backend not in ("sqlite", "files"):
+            raise ValueError(f"Unsupported STORAGE_BACKEND: {self.storage_backend}")
+        if self.status_tracking not in ("off", "memory", "sqlite"):
+            raise ValueError(f"Unsupported STATUS_TRACKING: {self.status_tracking}")
+        if self.log_format not in ("text", "json"):
+            raise ValueError(f"Unsupported LOG_FORMAT: {self.log_format}")
+        if self.llm_extraction_mode not in ("parser", "structured"):
+            raise ValueError(f"Unsupported LLM_EXTRACTION_MODE: {self.llm_extraction_mode}")
+        if self.idempotency_backend not in ("memory", "sqlite"):
+            raise ValueError(f"Unsupported IDEMPOTENCY_BACKEND: {self.idempotency_backend}")
+        if (self.webhook_processing_mode == "background" and self.worker_pool_type == "process"
+                and self.idempotency_backend == "memory"):
+            # Each worker process would have its own index, so a redelivery could be processed again
+            raise ValueError("IDEMPOTENCY_BACKEND=memory cannot be used with WORKER_POOL_TYPE=process, use sqlite")
+        if self.message_partitions < 1:
+            raise ValueError("MESSAGE_PARTITIONS must be at least 1")
+        if self.outbound_rate_per_second <= 0:
+            raise ValueError("OUTBOUND_RATE_PER_SECOND must be positive")
+
+    def ensure_local_directories(self) -> None:
+        """Ensure Local Directories exists. Called once by the components that write there."""
+        if self._local_directories_ready:
+            return
+        for path in (self.local_image_path, self.local_ocr_text_path, self.localt_audio_path,
+                     self.local_document_path, self.local_text_path, self.local_json_output_path):
+            os.makedirs(path, exist_ok=True)
+        self._local_directories_ready = True
 
     @staticmethod
-    def _get_env_variable(name: str) -> str:
-        value = os.getenv(name)
+    def _get_env_variable(name: str, default: Optional[str] = None) -> str:
+        value = os.getenv(name, default)
         if value is None:
             raise ValueError(f"Required Env Var '{name}' not found.")
         return value
 
+    @classmethod
+    def _get_int_env_variable(cls, name: str, default: int) -> int:
+        value = cls._get_env_variable(name, default=str(default))
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"Env Var '{name}' must be an integer, got '{value}'.")
+
+    @classmethod
+    def _get_float_env_variable(cls, name: str, default: float) -> float:
+        value = cls._get_env_variable(name, default=str(default))
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"Env Var '{name}' must be a number, got '{value}'.")
+
+    @classmethod
+    def _get_bool_env_variable(cls, name: str, default: bool) -> bool:
+        value = cls._get_env_variable(name, default=str(default)).strip().lower()
+        if value in ("1", "true", "yes", "on"):
+            return True
+        if value in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(f"Env Var '{name}' must be a boolean, got '{value}'.")
+
 # Instância global das configurações
 settings = Settings()
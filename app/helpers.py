@@ -1,6 +1,8 @@
-from typing import Optional
+import re
+import zlib
+from typing import Iterator, Optional, Union
 
-from model.whatsapp_model import WhatsAppWebhook
+from model.whatsapp_model import WhatsAppWebhook, Message, StatusWebhook
 
 def get_message_type(webhook: WhatsAppWebhook) -> Optional[str]:
     for entry in webhook.entry:
@@ -9,9 +11,28 @@ def get_message_type(webhook: WhatsAppWebhook) -> Optional[str]:
                 return change.value.messages[0].type
     return None 
 
-def fix_keys(data):
-    if isinstance(data, dict):
-        return {("from_" if k == "from" else k): fix_keys(v) for k, v in data.items()}
-    elif isinstance(data, list):
-        return [fix_keys(i) for i in data]
-    return data
\ No newline at end of file
+def iter_messages(webhook: WhatsAppWebhook) -> Iterator[Message]:
+    """Yield every message in the webhook, across all entries and changes."""
+    for entry in webhook.entry:
+        for change in entry.changes:
+            if change.value.messages:
+                yield from change.value.messages
+
+def partition_for(key: str, partitions: int) -> int:
+    """Stable partition of a key (a sender's number), the same in every process and run."""
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+# "messages" also appears as a value ("field": "messages"); only the key means messages are present
+MESSAGES_KEY_RE = re.compile(rb'"messages"\s*:')
+STATUSES_KEY_RE = re.compile(rb'"statuses"\s*:')
+
+def parse_webhook(raw: Union[bytes, str]) -> Union[WhatsAppWebhook, StatusWebhook]:
+    """
+    Validate a raw webhook body straight into the models, without an intermediate dict.
+    Payloads carrying only statuses (no "messages" key) use the slimmer StatusWebhook.
+    Raises pydantic.ValidationError for malformed JSON or payloads.
+    """
+    raw_bytes = raw.encode("utf-8") if isinstance(raw, str) else raw
+    if not MESSAGES_KEY_RE.search(raw_bytes) and STATUSES_KEY_RE.search(raw_bytes):
+        return StatusWebhook.model_validate_json(raw_bytes)
+    return WhatsAppWebhook.model_validate_json(raw_bytes)
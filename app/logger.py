@@ -1,10 +1,14 @@
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
 import sys
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import json
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Union
+
+from config import settings
 
 # Create logs directory if it doesn't exist
 os.makedirs("logs", exist_ok=True)
@@ -13,73 +17,149 @@ os.makedirs("logs", exist_ok=True)
 log_format = "[%(asctime)s] [%(levelname)s] [%(name)s:%(lineno)d] [%(funcName)s] - %(message)s"
 date_format = "%Y-%m-%d %H:%M:%S"
 
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line; the structured context becomes top-level fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "location": f"{record.module}:{record.lineno}",
+            "function": record.funcName,
+            "message": record.getMessage(),
+        }
+        context = getattr(record, "context", None)
+        if context:
+            for key, value in context.items():
+                # Context never overwrites the standard fields
+                entry[key if key not in entry else f"context_{key}"] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic single-line format, with the context appended as JSON."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        context = getattr(record, "context", None)
+        if context:
+            text = f"{text} | Context: {json.dumps(context, ensure_ascii=False, default=str)}"
+        return text
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that hands the record over unformatted, so message and context formatting
+    happen on the listener thread. Only the traceback is rendered here, while it still exists.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _build_handlers():
+    file_handler = RotatingFileHandler("logs/app.log", maxBytes=1000000, backupCount=5, encoding='utf-8')
+    file_handler.setFormatter(JsonLinesFormatter())
+
+    # Add error file handler for critical errors
+    error_handler = RotatingFileHandler("logs/error.log", maxBytes=1000000, backupCount=5, encoding='utf-8')
+    error_handler.setLevel(logging.ERROR)
+    error_handler.setFormatter(JsonLinesFormatter())
+    error_handler.addFilter(logging.Filter("loris_app"))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonLinesFormatter() if settings.log_format == "json" else TextFormatter(log_format, date_format))
+    return [file_handler, error_handler, stream_handler]
+
+
+# File and stdout writes run on a listener thread; request threads only enqueue records
+_handlers = _build_handlers()
+_queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+_listener = QueueListener(_queue_handler.queue, *_handlers, respect_handler_level=True)
+_listener.start()
+atexit.register(_listener.stop)
+
+
+def _restart_listener_after_fork() -> None:
+    # The listener thread does not survive fork; forked workers drain their own queue
+    global _listener
+    _queue_handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(_queue_handler.queue, *_handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
 # Configure root logger
-logging.basicConfig(
-    level=logging.INFO,
-    format=log_format,
-    datefmt=date_format,
-    handlers=[
-        RotatingFileHandler(
-            "logs/app.log",
-            maxBytes=1000000,
-            backupCount=5,
-            encoding='utf-8'
-        ),
-        logging.StreamHandler(sys.stdout)
-    ],
-)
+root_logger = logging.getLogger()
+root_logger.handlers = [_queue_handler]
+root_logger.setLevel(settings.log_level)
 
 # Create logger instance
 logger = logging.getLogger("loris_app")
 
-# Add error file handler for critical errors
-error_handler = RotatingFileHandler(
-    "logs/error.log",
-    maxBytes=1000000,
-    backupCount=5,
-    encoding='utf-8'
-)
-error_handler.setLevel(logging.ERROR)
-error_handler.setFormatter(logging.Formatter(log_format, date_format))
-logger.addHandler(error_handler)
 
 class StructuredLogger:
-    """Helper class for structured logging"""
-    
+    """Helper class for structured logging. The level is checked before anything is formatted."""
+
     @staticmethod
-    def _format_context(context: Optional[Dict[str, Any]] = None) -> str:
-        """Format context dictionary into a string"""
-        if not context:
-            return ""
-        return f" | Context: {json.dumps(context, ensure_ascii=False)}"
+    def _log(level: int, message: str, context: Dict[str, Any], exc_info: Any = None) -> None:
+        # stacklevel=3 reports the caller of log.info/log.error, not this helper
+        logger.log(level, message, exc_info=exc_info, extra={"context": context}, stacklevel=3)
 
     @staticmethod
     def info(message: str, **context):
         """Log info message with context"""
-        logger.info(f"{message}{StructuredLogger._format_context(context)}")
+        if logger.isEnabledFor(logging.INFO):
+            StructuredLogger._log(logging.INFO, message, context)
 
     @staticmethod
-    def error(error: Exception, message: str = None, **context):
+    def error(error: Union[Exception, str], message: Optional[str] = None, **context):
         """Log error with context and stack trace"""
-        error_msg = f"{error.__class__.__name__}: {str(error)}"
+        if not logger.isEnabledFor(logging.ERROR):
+            return
+        if isinstance(error, BaseException):
+            error_msg = f"{error.__class__.__name__}: {str(error)}"
+            exc_info = error
+        else:
+            error_msg = str(error)
+            exc_info = sys.exc_info()[0] is not None
         if message:
             error_msg = f"{message} - {error_msg}"
-        logger.error(f"{error_msg}{StructuredLogger._format_context(context)}", exc_info=True)
+        StructuredLogger._log(logging.ERROR, error_msg, context, exc_info=exc_info)
 
     @staticmethod
     def warning(message: str, **context):
         """Log warning message with context"""
-        logger.warning(f"{message}{StructuredLogger._format_context(context)}")
+        if logger.isEnabledFor(logging.WARNING):
+            StructuredLogger._log(logging.WARNING, message, context)
 
     @staticmethod
     def debug(message: str, **context):
         """Log debug message with context"""
-        logger.debug(f"{message}{StructuredLogger._format_context(context)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            StructuredLogger._log(logging.DEBUG, message, context)
 
     @staticmethod
     def critical(message: str, **context):
         """Log critical message with context"""
-        logger.critical(f"{message}{StructuredLogger._format_context(context)}")
+        if logger.isEnabledFor(logging.CRITICAL):
+            StructuredLogger._log(logging.CRITICAL, message, context)
+
+    @staticmethod
+    def is_enabled_for(level: int) -> bool:
+        """Whether a level would be logged; lets callers skip building expensive context."""
+        return logger.isEnabledFor(level)
 
 # Create a global instance
 log = StructuredLogger()
@@ -0,0 +1,284 @@
+import bisect
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from config import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# A collector returns (name, type, help, [(labels, value), ...]) tuples, evaluated at scrape time
+Sample = Tuple[Dict[str, str], float]
+CollectorFn = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Sequence[str] = ()):
+        self._registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        # Children indexed by the label values callers pass (may be non-str), for a single dict lookup
+        self._lookup: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Get the child for a set of label values, creating it on first use."""
+        child = self._lookup.get(values)
+        if child is None:
+            key = tuple(str(value) for value in values)
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+                self._lookup[values] = child
+        return child
+
+    def _samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            children = list(self._children.items())
+        samples = []
+        for key, child in children:
+            labels = dict(zip(self.labelnames, key))
+            samples.extend(child._samples(self.name, labels))
+        return samples
+
+
+class _CounterChild:
+    __slots__ = ("_registry", "_value", "_lock")
+
+    def __init__(self, registry: "MetricsRegistry"):
+        self._registry = registry
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._value += amount
+
+    def _samples(self, name: str, labels: Dict[str, str]):
+        return [(f"{name}_total", labels, self._value)]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild(self._registry)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ("_registry", "_value", "_lock")
+
+    def __init__(self, registry: "MetricsRegistry"):
+        self._registry = registry
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        if self._registry.enabled:
+            self._value = value
+
+    def inc(self, amount: float = 1.0) -> None:
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.inc(-amount)
+
+    def _samples(self, name: str, labels: Dict[str, str]):
+        return [(name, labels, self._value)]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild(self._registry)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: "_HistogramChild"):
+        self._child = child
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class _HistogramChild:
+    __slots__ = ("_registry", "_buckets", "_counts", "_sum", "_count", "_lock")
+
+    def __init__(self, registry: "MetricsRegistry", buckets: Tuple[float, ...]):
+        self._registry = registry
+        self._buckets = buckets
+        # Per-bucket (non-cumulative) counts; the last slot is +Inf
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        if not self._registry.enabled:
+            return
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def time(self) -> _Timer:
+        """Context manager observing the duration of its block in seconds."""
+        return _Timer(self)
+
+    def _samples(self, name: str, labels: Dict[str, str]):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        samples, cumulative = [], 0
+        for bound, bucket_count in zip(self._buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            samples.append((f"{name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+        samples.append((f"{name}_sum", labels, total))
+        samples.append((f"{name}_count", labels, count))
+        return samples
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self._registry, self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+
+class MetricsRegistry:
+    """
+    Process-local counters, gauges and histograms rendered in the Prometheus text format.
+    Recording is a lock-protected add on a pre-resolved child; values that already live
+    elsewhere (queue sizes, cache stats) are read by collectors at scrape time instead.
+    With a process worker pool, metrics recorded inside the workers stay in those processes.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, CollectorFn] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(self, name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, help, labelnames, buckets))
+
+    def register_collector(self, key: str, collector: CollectorFn) -> None:
+        """Add (or replace) a scrape-time collector."""
+        with self._lock:
+            self._collectors[key] = collector
+
+    def unregister_collector(self, key: str) -> None:
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for sample_name, labels, value in metric._samples():
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in collectors:
+            for name, type_name, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type_name}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Global registry shared by the whole process
+metrics = MetricsRegistry(enabled=settings.metrics_enabled)
+
+STAGE_SECONDS = metrics.histogram(
+    "loris_stage_duration_seconds", "Time spent in each message handling stage", ("stage", "message_type"))
+MESSAGES = metrics.counter(
+    "loris_messages", "Messages handled, by type and outcome", ("message_type", "outcome"))
+MESSAGES_IN_FLIGHT = metrics.gauge(
+    "loris_messages_in_flight", "Messages currently being handled")
+UPSTREAM_REQUESTS = metrics.counter(
+    "loris_upstream_requests", "HTTP responses from upstream APIs, by status class", ("upstream", "status"))
+PROVIDER_CALL_SECONDS = metrics.histogram(
+    "loris_provider_call_duration_seconds", "LLM/transcription provider call latency", ("router", "provider", "outcome"))
+OUTBOUND_MESSAGES = metrics.counter(
+    "loris_outbound_messages", "Replies handed to the Graph API, by final outcome", ("outcome",))
+OUTBOUND_RETRIES = metrics.counter(
+    "loris_outbound_retries", "Reply send attempts retried, by reason", ("reason",))
@@ -0,0 +1,108 @@
+"""
+Imports the legacy flat file layout into the message store (STORAGE_BACKEND=sqlite).
+
+Reads <LOCAL_DATA_PATH>/{image,audio,document}/<message_id>.<ext> into the content-addressed
+media tree, text/<message_id>.txt as the message body, ocr_text/<message_id>.txt as OCR text
+and json_output/<message_id>.json as the output, in one transaction per --batch-size files.
+The files carry no sender, so imported messages have none, and their date is taken from
+the file modification time. Re-running is safe: writes are upserts
+and blobs are content-addressed. Files are kept unless --delete is given.
+
+Usage (from the app folder):
+    python -m migrations.import_flat_files --batch-size 1000 [--delete] [--dry-run]
+"""
+import argparse
+import os
+import sys
+import time
+from typing import Dict, Iterator, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings  # noqa: E402
+from tools.message_store import MessageStore  # noqa: E402
+
+# Folder -> message type for media; text, OCR text and output are handled separately
+MEDIA_FOLDERS = {"image": "image", "audio": "audio", "document": "document"}
+
+
+def _iter_files(folder: str) -> Iterator[Tuple[str, str, str]]:
+    """(message_id, extension, path) of every file in a folder; os.scandir avoids a stat per entry."""
+    if not os.path.isdir(folder):
+        return
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file():
+                message_id, _, extension = entry.name.rpartition(".")
+                if message_id:
+                    yield message_id, extension, entry.path
+
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        return file.read()
+
+
+def _import_file(store: MessageStore, kind: str, message_id: str, extension: str, path: str) -> None:
+    received_at = int(os.path.getmtime(path))
+    if kind in MEDIA_FOLDERS:
+        with open(path, "rb") as file:
+            blob = store.write_blob(file.read(), extension)
+        store.upsert(message_id, message_type=MEDIA_FOLDERS[kind], received_at=received_at,
+                     media_sha256=blob["sha256"], media_extension=extension, media_size=blob["size"])
+    elif kind == "text":
+        store.upsert(message_id, message_type="text", received_at=received_at, text=_read_text(path))
+    elif kind == "ocr_text":
+        store.upsert(message_id, ocr_text=_read_text(path))
+    elif kind == "json_output":
+        store.upsert(message_id, output_json=_read_text(path))
+
+
+def migrate(data_path: str, store: MessageStore, batch_size: int = 1000, delete: bool = False,
+            dry_run: bool = False) -> Dict[str, int]:
+    """Import every flat file under data_path. Returns the number of files imported per folder."""
+    counts: Dict[str, int] = {}
+    for kind in (*MEDIA_FOLDERS, "text", "ocr_text", "json_output"):
+        files = _iter_files(os.path.join(data_path, kind))
+        imported = 0
+        while True:
+            batch = [item for _, item in zip(range(batch_size), files)]
+            if not batch:
+                break
+            if not dry_run:
+                with store.batch():
+                    for message_id, extension, path in batch:
+                        _import_file(store, kind, message_id, extension, path)
+                if delete:
+                    for _, _, path in batch:
+                        os.remove(path)
+            imported += len(batch)
+            print(f"{kind}: {imported} files", flush=True)
+        counts[kind] = imported
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import the flat file layout into the message store")
+    parser.add_argument("--data-path", default=settings.local_data_path, help="Folder with the legacy layout")
+    parser.add_argument("--db-path", default=settings.storage_db_path)
+    parser.add_argument("--media-path", default=settings.storage_media_path)
+    parser.add_argument("--batch-size", type=int, default=1000, help="Files per transaction")
+    parser.add_argument("--delete", action="store_true", help="Delete the files once imported")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the files")
+    args = parser.parse_args()
+
+    store = MessageStore(db_path=args.db_path, media_path=args.media_path)
+    started = time.perf_counter()
+    try:
+        counts = migrate(args.data_path, store, batch_size=args.batch_size, delete=args.delete, dry_run=args.dry_run)
+    finally:
+        store.close()
+    elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    print(f"{'Counted' if args.dry_run else 'Imported'} {total} files in {elapsed:.1f}s "
+          f"({', '.join(f'{kind}: {count}' for kind, count in counts.items())})")
+
+
+if __name__ == "__main__":
+    main()
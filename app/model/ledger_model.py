@@ -0,0 +1,25 @@
+from pydantic import BaseModel, Field
+
+from typing import List, Optional
+
+class PeriodTotal(BaseModel):
+    """Spending of a sender in one currency over a period"""
+    currency: str
+    total: float = 0.0
+    count: int = Field(description="Number of purchases", default=0)
+
+class CategoryTotal(PeriodTotal):
+    """Spending of a sender in one category and currency over a period"""
+    category: str
+
+class LedgerTotals(BaseModel):
+    sender: str
+    granularity: str = Field(description="day, month or all")
+    period: Optional[str] = Field(description="YYYY-MM-DD for days, YYYY-MM for months, None for all time", default=None)
+    totals: List[PeriodTotal] = Field(default_factory=list)
+
+class LedgerCategories(BaseModel):
+    sender: str
+    granularity: str = Field(description="day, month or all")
+    period: Optional[str] = Field(description="YYYY-MM-DD for days, YYYY-MM for months, None for all time", default=None)
+    categories: List[CategoryTotal] = Field(default_factory=list)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 
 class PurchaseInfo(BaseModel):
@@ -28,3 +28,47 @@ class PurchaseInfo(BaseModel):
         description="Category of purchase (e.g., groceries, utilities, entertainment)",
         default="Unknown"
     )
+
+
+class PurchaseInfoBatch(BaseModel):
+    """Schema for batched purchase information extraction"""
+    items: List[PurchaseInfo] = Field(
+        description="Purchase information for each text, in the same order as the texts",
+        default_factory=list
+    )
+
+
+class FastPathExtraction(BaseModel):
+    """Result of the rule-based receipt extractor"""
+    purchase_info: PurchaseInfo
+    field_confidence: Dict[str, float] = Field(
+        description="Confidence (0-1) for each extracted field",
+        default_factory=dict
+    )
+    confidence: float = Field(
+        description="Overall confidence: the lowest confidence among the required fields",
+        default=0.0
+    )
+
+
+class CompactedText(BaseModel):
+    """OCR text trimmed to the LLM token budget, with its size before and after"""
+    text: str
+    original_chars: int = 0
+    compacted_chars: int = 0
+    original_tokens: int = Field(description="Estimated tokens of the original text", default=0)
+    compacted_tokens: int = Field(description="Estimated tokens of the compacted text", default=0)
+    total_lines: int = 0
+    kept_lines: int = 0
+
+
+class PreprocessedAudio(BaseModel):
+    """Voice note decoded, trimmed to its speech and split into chunks for transcription"""
+    chunks: List[bytes] = Field(description="Mono encoded chunks, in order", default_factory=list, exclude=True)
+    chunk_format: str = Field(description="File extension of the chunks: ogg (Opus) or wav", default="ogg")
+    chunk_bytes: int = Field(description="Size of all chunks, as uploaded", default=0)
+    sample_rate: int = 16000
+    original_seconds: float = 0.0
+    speech_seconds: float = Field(description="Audio left after silence trimming", default=0.0)
+    saved_seconds: float = Field(description="Audio not sent for transcription", default=0.0)
+    chunk_count: int = 0
@@ -1,6 +1,5 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
-from pydantic import BaseModel
 from typing import List, Optional
 
 class Profile(BaseModel):
@@ -53,7 +52,10 @@ class Status(BaseModel):
     pricing: Optional[Pricing] = None
 
 class Message(BaseModel):
-    from_: str
+    # Meta sends "from"; the alias lets raw payloads validate directly, populate_by_name keeps from_ usable
+    model_config = ConfigDict(populate_by_name=True)
+
+    from_: str = Field(alias="from")
     id: str
     timestamp: str
     type: str
@@ -81,10 +83,44 @@ class WhatsAppWebhook(BaseModel):
     object: str
     entry: List[Entry]
 
+# Slim models for status-only webhooks (delivery/read receipts): only what we track is validated
+class StatusUpdate(BaseModel):
+    id: str
+    status: str
+    timestamp: str
+    recipient_id: str
+
+class StatusValue(BaseModel):
+    statuses: Optional[List[StatusUpdate]] = None
+
+class StatusChange(BaseModel):
+    value: StatusValue
+    field: str
+
+class StatusEntry(BaseModel):
+    id: str
+    changes: List[StatusChange]
+
+class StatusWebhook(BaseModel):
+    object: str
+    entry: List[StatusEntry]
+
 class WhatsAppMedia(BaseModel):
     messaging_product:  str
     url: str
     mime_type: str
     sha256: str
     file_size: int
-    id: str
\ No newline at end of file
+    id: str
+
+
+class DeliveryOutcome(BaseModel):
+    """Result of sending a reply through the outbound dispatcher"""
+    message_id: str = Field(description="Id of the message being replied to")
+    recipient: str
+    status: str = Field(description="sent or failed")
+    attempts: int = 0
+    reply_id: Optional[str] = Field(description="WhatsApp id of the reply, when sent", default=None)
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+    latency: float = Field(description="Seconds from submission to the final attempt", default=0.0)
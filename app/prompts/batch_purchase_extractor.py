@@ -0,0 +1,52 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from model.output_models import PurchaseInfoBatch
+
+if TYPE_CHECKING:
+    from langchain.prompts import PromptTemplate
+    from langchain.output_parsers import PydanticOutputParser
+
+# langchain is imported and the parser/prompt are built on first use, not at import
+
+batch_purchase_extractor_template = """
+You are a specialized assistant that extracts purchase information from receipts, invoices, and financial documents.
+Below are {count} independent texts, each starting with a "### Text N" header.
+Extract the purchase information of each text separately and return exactly {count} items in the "items" list,
+in the same order as the texts (item 1 for Text 1, item 2 for Text 2, and so on).
+
+For each text:
+- store_name: business, store or merchant name
+- amount: total amount paid, numeric value only (look for "Total", "Valor Total", "Amount", "Final Value")
+- currency: currency symbol or code (R$, $, €)
+- date: date in YYYY-MM-DD format (look for "Data", "Date", "Emissão")
+- payment_method: credit card, debit card, cash, PIX
+- category: infer from the text context
+If a value is not found, use the default value from the schema. NEVER return null values.
+
+{format_instructions}
+
+{texts}
+
+JSON Output:
+"""
+
+def format_batch_texts(texts: list) -> str:
+    """Number the texts with the headers the batch prompt refers to"""
+    return "\n\n".join(f"### Text {index}\n{text}" for index, text in enumerate(texts, start=1))
+
+@lru_cache(maxsize=None)
+def get_batch_purchase_parser() -> "PydanticOutputParser":
+    """Get the batch purchase information parser"""
+    from langchain.output_parsers import PydanticOutputParser
+    return PydanticOutputParser(pydantic_object=PurchaseInfoBatch)
+
+@lru_cache(maxsize=None)
+def get_batch_purchase_extractor_prompt() -> "PromptTemplate":
+    """Get the batch purchase extractor prompt template"""
+    from langchain.prompts import PromptTemplate
+    return PromptTemplate(
+        template=batch_purchase_extractor_template,
+        input_variables=["count", "texts"],
+        partial_variables={"format_instructions": get_batch_purchase_parser().get_format_instructions()}
+    )
@@ -1,12 +1,16 @@
-from langchain.prompts import PromptTemplate
-from langchain.output_parsers import PydanticOutputParser
+import hashlib
+import json
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
 from model.output_models import PurchaseInfo
 
-# Create the output parser
-parser = PydanticOutputParser(pydantic_object=PurchaseInfo)
+if TYPE_CHECKING:
+    from langchain.prompts import PromptTemplate
+    from langchain.output_parsers import PydanticOutputParser
+
+# langchain is imported and the parser/prompt are built on first use, not at import
 
-# Create the prompt template
 purchase_extractor_template = """
 You are a specialized assistant that extracts purchase information from receipts, invoices, and financial documents.
 Your task is to carefully analyze the text and extract all relevant purchase information.
@@ -48,17 +52,43 @@ Remember:
 JSON Output:
 """
 
-# Create the prompt template
-purchase_extractor_prompt = PromptTemplate(
-    template=purchase_extractor_template,
-    input_variables=["text"],
-    partial_variables={"format_instructions": parser.get_format_instructions()}
+# Compact system prompt for the providers' native structured output: the schema travels
+# in the API request (JSON schema / tool definition), not in the prompt text
+structured_system_prompt = (
+    "Extract the purchase from the receipt text. "
+    "amount: total paid, number only. date: YYYY-MM-DD. "
+    "payment_method: Credit Card, Debit Card, Cash or PIX. "
+    "category: infer from context. Use the schema defaults for fields not found."
 )
 
-def get_purchase_extractor_prompt() -> PromptTemplate:
+@lru_cache(maxsize=None)
+def get_purchase_parser() -> "PydanticOutputParser":
+    """Get the purchase information parser"""
+    from langchain.output_parsers import PydanticOutputParser
+    return PydanticOutputParser(pydantic_object=PurchaseInfo)
+
+@lru_cache(maxsize=None)
+def get_purchase_extractor_prompt() -> "PromptTemplate":
     """Get the purchase extractor prompt template"""
-    return purchase_extractor_prompt
+    from langchain.prompts import PromptTemplate
+    return PromptTemplate(
+        template=purchase_extractor_template,
+        input_variables=["text"],
+        partial_variables={"format_instructions": get_purchase_parser().get_format_instructions()}
+    )
 
-def get_purchase_parser() -> PydanticOutputParser:
-    """Get the purchase information parser"""
-    return parser 
\ No newline at end of file
+def get_structured_system_prompt() -> str:
+    """Get the compact system prompt used with native structured output"""
+    return structured_system_prompt
+
+@lru_cache(maxsize=None)
+def get_prompt_version(mode: str = "parser") -> str:
+    """
+    Get the version identifier of the purchase extractor prompt for an extraction mode.
+    Changes whenever the prompt or the output schema changes, so cached extractions are invalidated.
+    """
+    if mode == "structured":
+        source = structured_system_prompt + json.dumps(PurchaseInfo.model_json_schema(), sort_keys=True)
+    else:
+        source = purchase_extractor_template + get_purchase_parser().get_format_instructions()
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
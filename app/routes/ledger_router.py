@@ -0,0 +1,58 @@
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+
+from config import settings
+from model.ledger_model import LedgerCategories, LedgerTotals
+from tools.ledger import Ledger, get_ledger
+
+router = APIRouter()
+
+
+def _authorized_ledger(authorization: Optional[str]) -> Ledger:
+    """
+    The ledger, if enabled and the request carries the LEDGER_API_TOKEN bearer token.
+    Without a configured token the API is disabled: it exposes spending per phone number.
+    """
+    ledger = get_ledger()
+    if ledger is None or not settings.ledger_api_token:
+        raise HTTPException(status_code=404, detail="Ledger API disabled")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.ledger_api_token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return ledger
+
+
+@router.get("/ledger/{sender}/totals", response_model=LedgerTotals)
+def get_totals(
+    sender: str,
+    granularity: str = Query("month", pattern="^(day|month|all)$"),
+    period: Optional[str] = Query(None, description="YYYY-MM-DD for days, YYYY-MM for months"),
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Total spent by a sender in a day, a month or all time, per currency.
+    """
+    ledger = _authorized_ledger(authorization)
+    try:
+        return ledger.totals(sender, granularity, period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/ledger/{sender}/categories", response_model=LedgerCategories)
+def get_categories(
+    sender: str,
+    granularity: str = Query("month", pattern="^(day|month|all)$"),
+    period: Optional[str] = Query(None, description="YYYY-MM-DD for days, YYYY-MM for months"),
+    authorization: Optional[str] = Header(None),
+):
+    """
+    Total spent by a sender per category in a day, a month or all time.
+    """
+    ledger = _authorized_ledger(authorization)
+    try:
+        return ledger.by_category(sender, granularity, period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from metrics import metrics
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Prometheus scrape endpoint (text exposition format 0.0.4).
+    """
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(content=metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,13 +1,13 @@
-import logging
-
 from fastapi import APIRouter, Request, Query, HTTPException
 from fastapi.responses import PlainTextResponse, JSONResponse
 from pydantic import ValidationError
 
 from config import settings
-from helpers import fix_keys
-from service.whatsapp_service import WhatsAppService
-from model.whatsapp_model import WhatsAppWebhook
+from helpers import iter_messages, parse_webhook
+from service.whatsapp_service import get_whatsapp_service
+from service.job_queue import QueueFullError
+from tools.status_tracker import get_status_tracker
+from model.whatsapp_model import StatusWebhook
 from logger import log
 
 router = APIRouter()
@@ -53,22 +53,53 @@ async def handle_wpp_message(request: Request):
     Validates and parses the webhook, then delegates to WhatsAppService.
     """
     try:
-        # Parse and fix incoming JSON body
-        body = fix_keys(await request.json())
-        log.info("Received webhook request", body_type=str(type(body).__name__))
+        # Validate the raw body straight into the webhook models
+        raw_body = await request.body()
+        log.info("Received webhook request", body_length=len(raw_body))
         
         try:
-            # Validate and parse webhook model
-            webhook = WhatsAppWebhook(**body)
+            webhook = parse_webhook(raw_body)
         except ValidationError as e:
             log.error(e, "Invalid webhook format", errors=str(e.errors()))
             raise HTTPException(
                 status_code=400,
                 detail={"status": "error", "message": f"Invalid Webhook Format: {e.errors()}"}
             )
+
+        # Delivery/read receipts: acknowledged here, before the service or any tool is touched
+        if isinstance(webhook, StatusWebhook):
+            tracker = get_status_tracker()
+            if tracker is not None:
+                tracker.record(
+                    status for entry in webhook.entry for change in entry.changes
+                    for status in change.value.statuses or ()
+                )
+            return JSONResponse(
+                status_code=200,
+                content={"status": "ok", "message": "Processed message_status_update webhook"}
+            )
         
+        # In background mode acknowledge right away and let the workers process each message
+        if settings.webhook_processing_mode == "background":
+            job_queue = request.app.state.job_queue
+            results = []
+            for message in iter_messages(webhook):
+                try:
+                    job_queue.enqueue(message.model_dump(), key=message.from_)
+                    results.append({"message_id": message.id, "status": "queued"})
+                except QueueFullError as e:
+                    log.warning("Job queue full, rejecting message", message_id=message.id, error=str(e))
+                    results.append({"message_id": message.id, "status": "rejected", "message": "Server busy, try again later"})
+            rejected = any(result["status"] == "rejected" for result in results)
+            log.info("Webhook queued for background processing", message_count=len(results), rejected=rejected)
+            return JSONResponse(
+                # 503 makes Meta redeliver; already queued messages are deduplicated on retry
+                status_code=503 if rejected else 200,
+                content={"status": "busy" if rejected else "accepted", "results": results}
+            )
+
         # Process webhook with WhatsAppService
-        wpp = WhatsAppService()
+        wpp = get_whatsapp_service()
         log.debug("Delegating webhook to WhatsAppService", webhook_type=getattr(webhook, 'type', None))
         response = await wpp.handle_webhook(webhook=webhook)
         log.info("Webhook processed successfully")
@@ -0,0 +1,131 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from helpers import partition_for
+from logger import log
+
+
+class QueueFullError(Exception):
+    """Raised when a job cannot be enqueued because the queue is at capacity."""
+
+
+class JobQueue:
+    """
+    In-process job queue drained by a pool of thread or process workers.
+    Jobs are enqueued from the event loop and executed off-loop, so webhooks can be
+    acknowledged as soon as they are validated.
+    Jobs are split into partitions by key (the sender), each drained one job at a time by its own
+    consumer: jobs with the same key run in the order they were enqueued, jobs with different keys
+    run in parallel up to the pool size.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], Any],
+        pool_type: str = "thread",
+        pool_size: int = 4,
+        max_size: int = 1000,
+        partitions: Optional[int] = None,
+    ):
+        if pool_type not in ("thread", "process"):
+            raise ValueError(f"Unsupported worker pool type: {pool_type}")
+        if pool_size < 1:
+            raise ValueError("Worker pool size must be at least 1")
+        if partitions is not None and partitions < 1:
+            raise ValueError("Partitions must be at least 1")
+        # With a process pool the handler and its payload must be picklable,
+        # so handlers are module-level functions taking plain dicts.
+        self.handler = handler
+        self.pool_type = pool_type
+        self.pool_size = pool_size
+        self.max_size = max_size
+        # More partitions than workers keeps a slow sender from holding up the others in its partition
+        self.partitions = partitions or pool_size
+        self._queues: List[asyncio.Queue] = []
+        # Round robin for jobs enqueued without a key
+        self._next_partition = 0
+        self._executor: Optional[Executor] = None
+        self._workers: List[asyncio.Task] = []
+        # Jobs currently running in the executor; only touched from the event loop
+        self.in_flight = 0
+
+    async def start(self) -> None:
+        """Create the executor and start one consumer task per worker."""
+        if self._workers:
+            return
+        # Capacity is enforced across partitions in enqueue
+        self._queues = [asyncio.Queue() for _ in range(self.partitions)]
+        if self.pool_type == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="loris-worker")
+        self._workers = [
+            asyncio.create_task(self._consume(partition), name=f"loris-job-consumer-{partition}")
+            for partition in range(self.partitions)
+        ]
+        log.info("JobQueue started", pool_type=self.pool_type, pool_size=self.pool_size, max_size=self.max_size,
+                 partitions=self.partitions)
+
+    def enqueue(self, payload: Dict[str, Any], key: Optional[str] = None) -> None:
+        """
+        Put a job on the queue without waiting. Jobs with the same key run in order; jobs without
+        one are spread round robin. Raises QueueFullError when at capacity.
+        """
+        if not self._queues:
+            raise RuntimeError("JobQueue is not started")
+        if self.qsize() >= self.max_size:
+            raise QueueFullError(f"Job queue is full ({self.max_size} jobs)")
+        if key is None:
+            partition = self._next_partition
+            self._next_partition = (partition + 1) % self.partitions
+        else:
+            partition = partition_for(key, self.partitions)
+        self._queues[partition].put_nowait(payload)
+        log.debug("Job enqueued", partition=partition, partition_depth=self._queues[partition].qsize())
+
+    def qsize(self) -> int:
+        """Number of jobs waiting to be picked up by a worker."""
+        return sum(queue.qsize() for queue in self._queues)
+
+    def partition_sizes(self) -> List[int]:
+        """Number of jobs waiting in each partition."""
+        return [queue.qsize() for queue in self._queues]
+
+    def collect_metrics(self):
+        """Scrape-time queue depth per partition and running jobs."""
+        yield ("loris_job_queue_depth", "gauge", "Jobs waiting for a worker, per partition",
+               [({"partition": str(partition)}, size) for partition, size in enumerate(self.partition_sizes())])
+        yield ("loris_job_queue_in_flight", "gauge", "Jobs running in the worker pool", [({}, self.in_flight)])
+
+    async def _consume(self, partition: int) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._queues[partition]
+        while True:
+            payload = await queue.get()
+            self.in_flight += 1
+            try:
+                # Awaited before the next get, so a partition never runs two jobs at once
+                await loop.run_in_executor(self._executor, self.handler, payload)
+            except Exception as e:
+                log.error(e, "Background job failed", partition=partition)
+            finally:
+                self.in_flight -= 1
+                queue.task_done()
+
+    async def stop(self, drain_timeout: float = 30.0) -> None:
+        """Wait up to drain_timeout seconds for queued jobs, then stop the workers."""
+        if not self._queues:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self._queues)), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            log.warning("JobQueue drain timed out, dropping pending jobs", pending=self.qsize())
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._executor = None
+        self._queues = []
+        log.info("JobQueue stopped")
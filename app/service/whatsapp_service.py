@@ -1,31 +1,65 @@
-from glob import glob
+import asyncio
 import os
-from functools import wraps
+import threading
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 import json
 
-from model.whatsapp_model import WhatsAppWebhook, Message
+from model.whatsapp_model import WhatsAppWebhook, Message, DeliveryOutcome
 from tools.whatsapp_tools import WhatsAppTools
-from tools.transformer_tools import OCRTools, LLMTools
+from tools.transformer_tools import OCRTools, LLMTools, fill_missing_date
+from tools.idempotency_index import build_idempotency_index, DONE, FAILED
+from tools.cache_tools import build_media_result_cache
+from tools.receipt_extractor import ReceiptFastPathExtractor
+from tools.text_compactor import OCRTextCompactor
+from tools.status_tracker import get_status_tracker
+from tools.message_store import build_message_store
+from tools.ledger import get_ledger
+from tools.outbound_dispatcher import build_outbound_dispatcher
 from config import settings
+from helpers import iter_messages, partition_for
 from logger import log
+from metrics import metrics, STAGE_SECONDS, MESSAGES, MESSAGES_IN_FLIGHT
 
 class WhatsAppService:
     def __init__(self):
-        self.wpp_tools = WhatsAppTools()
-        self.ocr_tools = OCRTools()
+        self.store = build_message_store()
+        if self.store is None:
+            settings.ensure_local_directories()
+        self.wpp_tools = WhatsAppTools(store=self.store)
+        self.ocr_tools = OCRTools(processor=settings.ocr_processor, save_text_files=self.store is None)
         self.llm_tools = LLMTools(default_provider="openai")
+        self.idempotency = build_idempotency_index()
+        self.media_cache = build_media_result_cache()
+        self.receipt_extractor = ReceiptFastPathExtractor(confidence_threshold=settings.fast_path_confidence_threshold)
+        self.text_compactor = OCRTextCompactor(
+            token_budget=settings.ocr_compaction_token_budget,
+            chars_per_token=settings.ocr_compaction_chars_per_token,
+        )
+        self.outbound = None
+        if settings.outbound_dispatcher_enabled:
+            self.outbound = build_outbound_dispatcher(
+                url=self.wpp_tools.url, headers=self.wpp_tools.headers, on_result=self._record_reply)
+            metrics.register_collector("outbound_dispatcher", self.outbound.collect_metrics)
+        # Sync mode: one lock per sender partition keeps a sender's messages in order across webhooks
+        self._partition_locks = [asyncio.Lock() for _ in range(settings.message_partitions)]
+        metrics.register_collector("whatsapp_service", self.collect_metrics)
         log.info("WhatsAppService initialized")
 
     def _extract_text_from_message(self, message: Message) -> str:
         """
         Save original Message to Local FS and extract text from a Message, handling different types of messages.
         Supported types: text, image, audio.
+        With settings.media_in_memory the media goes straight from the download buffer to OCR/transcription.
         """
         try:
+            if settings.media_in_memory:
+                return self._extract_text_from_message_in_memory(message)
+
             # Save media locally and get local path
-            local_media_path = self.wpp_tools.download_and_save_whatsapp_media_to_local_fs(message=message)
+            with STAGE_SECONDS.labels("media_download", message.type).time():
+                local_media_path = self.wpp_tools.download_and_save_whatsapp_media_to_local_fs(message=message)
             log.debug("Media saved locally", local_media_path=local_media_path, message_type=message.type)
 
             # Extract text based on message type
@@ -34,10 +68,10 @@ class WhatsAppService:
                 return message.text.body
             elif message.type == "image":
                 log.debug("Extracting text from image message using OCR", message_id=message.id)
-                return self.ocr_tools.extract_text_from_image_with_ocr(local_media_path)
+                return self._ocr_image(message, local_media_path)
             elif message.type == "audio":
                 log.debug("Extracting text from audio message using LLMTools", message_id=message.id)
-                return self.llm_tools.get_text_from_audio(local_media_path)["text"]
+                return self._transcribe_audio(message, local_media_path)
             else:
                 log.warning("Unsupported message type for text extraction", message_type=message.type)
                 return ""
@@ -45,28 +79,128 @@ class WhatsAppService:
             log.error(e, "Error extracting text from message", message_id=getattr(message, 'id', None))
             return ""
 
-    def _get_text_info(self, text: str) -> str:
+    def _extract_text_from_message_in_memory(self, message: Message) -> str:
+        """
+        Extract text without touching the disk on the critical path; archiving is an optional background write.
         """
-        Extract structured information from text using LLMTools and ensure output is a string.
+        if message.type == "text":
+            # The message store keeps text bodies with the message metadata
+            if settings.media_archive and self.store is None:
+                self.wpp_tools.archive_media_async(message, message.text.body.encode("utf-8"))
+            return message.text.body
+        if message.type not in ("image", "audio"):
+            log.warning("Unsupported message type for text extraction", message_type=message.type)
+            return ""
+
+        with STAGE_SECONDS.labels("media_download", message.type).time():
+            media = self.wpp_tools.download_whatsapp_media_to_memory(message=message)
+        if settings.media_archive:
+            self.wpp_tools.archive_media_async(message, media)
+        file_name = self.wpp_tools.get_media_filename(message)
+
+        if message.type == "image":
+            log.debug("Extracting text from in-memory image using OCR", message_id=message.id)
+            return self._ocr_image(message, media, file_name=file_name)
+        log.debug("Extracting text from in-memory audio using LLMTools", message_id=message.id)
+        return self._transcribe_audio(message, media, file_name=file_name)
+
+    def _ocr_image(self, message: Message, image, file_name: Optional[str] = None) -> str:
+        """
+        OCR an image given as a path or bytes, keeping the text in the message store if there is one.
+        """
+        with STAGE_SECONDS.labels("ocr", message.type).time():
+            text = self.ocr_tools.extract_text_from_image_with_ocr(image, file_name=file_name)
+        if self.store is not None:
+            self.store.save_ocr_text(message.id, text)
+        return text
+
+    def _transcribe_audio(self, message: Message, audio, file_name: Optional[str] = None) -> str:
+        """
+        Transcribe a voice note, logging how much audio silence trimming kept out of the upload.
+        """
+        with STAGE_SECONDS.labels("transcription", message.type).time():
+            result = self.llm_tools.get_text_from_audio(audio, file_name=file_name)
+        audio_stats = result.get("audio")
+        if audio_stats:
+            log.info("Audio preprocessed", message_id=message.id, **audio_stats)
+        return result["text"]
+
+    def _get_text_info(self, text: str) -> Dict[str, Any]:
+        """
+        Extract structured information from text using LLMTools.
         """
         try:
             log.debug("Extracting structured info from text", text_length=len(text))
-            text_info = self.llm_tools.get_text_info(text)
-            # Ensure output is a string
-            if isinstance(text_info, dict):
-                text_info = json.dumps(text_info)
-            elif not isinstance(text_info, str):
-                text_info = str(text_info)
-            log.debug("Structured info extracted", info_length=len(text_info))
+            # The date fallback is applied by the caller, after the result is cached
+            text_info = self.llm_tools.get_text_info(text, fill_date=False)
+            log.debug("Structured info extracted", info_keys=list(text_info))
             return text_info
         except Exception as e:
             log.error(e, "Error extracting structured info from text")
-            return ""
-    
+            return {"error": "Failed to extract structured info", "message": str(e)}
+
+    def _get_purchase_info(self, message: Message, text: str) -> Dict[str, Any]:
+        """
+        Get structured info for a message: OCR'd receipts go through the rule-based fast path first,
+        and the LLM is only called when it is not confident enough, with the OCR text compacted
+        to the token budget.
+        """
+        if settings.fast_path_enabled and message.type == "image" and text:
+            with STAGE_SECONDS.labels("fast_path", message.type).time():
+                purchase_info = self.receipt_extractor.try_extract(text)
+            if purchase_info is not None:
+                log.info("Receipt extracted by fast path, skipping LLM", message_id=message.id)
+                return purchase_info.model_dump()
+        if settings.ocr_compaction_enabled and message.type == "image" and text:
+            with STAGE_SECONDS.labels("compaction", message.type).time():
+                compacted = self.text_compactor.compact(text)
+            log.info("OCR text compacted", message_id=message.id,
+                     original_chars=compacted.original_chars, compacted_chars=compacted.compacted_chars,
+                     original_tokens=compacted.original_tokens, compacted_tokens=compacted.compacted_tokens,
+                     kept_lines=compacted.kept_lines, total_lines=compacted.total_lines)
+            text = compacted.text
+        with STAGE_SECONDS.labels("llm", message.type).time():
+            return self._get_text_info(text)
+
+    @staticmethod
+    def _get_media_sha256(message: Message) -> Optional[str]:
+        """
+        Get the content hash Meta sends for image and audio messages.
+        """
+        media = message.image if message.type == "image" else message.audio if message.type == "audio" else None
+        return media.sha256 if media and media.sha256 else None
+
+    def _get_cached_media_result(self, message: Message) -> Optional[Dict[str, Any]]:
+        """
+        Look up a previous result for the same media content (e.g. a forwarded receipt).
+        """
+        sha256 = self._get_media_sha256(message)
+        if not sha256:
+            return None
+        cached = self.media_cache.get(sha256)
+        log.debug("Media cache lookup", message_id=message.id, sha256=sha256, hit=cached is not None)
+        return cached
+
+    def _cache_media_result(self, message: Message, text: str, text_info: Dict[str, Any]) -> None:
+        """
+        Store the extracted text and purchase info for the media content. Failed extractions are not cached.
+        """
+        sha256 = self._get_media_sha256(message)
+        if not sha256 or not text or "error" in text_info:
+            return
+        self.media_cache.set(sha256, {"text": text, "text_info": text_info})
+
     def _save_output_json(self, result: str, message_id: str) -> None:
         """
-        Save the output JSON to a file for later analysis or auditing.
+        Save the output JSON to the message store, or to a file, for later analysis or auditing.
         """
+        if self.store is not None:
+            try:
+                self.store.save_output(message_id, result)
+                log.info("Output JSON saved successfully", message_id=message_id)
+            except Exception as e:
+                log.error(e, "Error saving output JSON", message_id=message_id)
+            return
         try:
             output_path = os.path.join(settings.local_json_output_path, f"{message_id}.json")
             with open(output_path, "w", encoding="utf-8") as f:
@@ -75,57 +209,201 @@ class WhatsAppService:
         except Exception as e:
             log.error(e, "Error saving output JSON", file_path=output_path)
 
-    def _handle_message(self, message: Message) -> JSONResponse:
+    def _handle_message(self, message: Message) -> Dict[str, Any]:
         """
-        Main handler for incoming WhatsApp messages. Checks if already processed, extracts text, gets info, saves output, and sends response.
+        Main handler for incoming WhatsApp messages. Claims the message in the idempotency index, extracts text, gets info, saves output, and sends response.
+        Returns a status dict for the message.
         """
+        message_type = getattr(message, "type", None) or "unknown"
+        MESSAGES_IN_FLIGHT.inc()
+        try:
+            with STAGE_SECONDS.labels("total", message_type).time():
+                result = self._process_message(message)
+            MESSAGES.labels(message_type, result["status"]).inc()
+            return result
+        finally:
+            MESSAGES_IN_FLIGHT.dec()
+
+    def _process_message(self, message: Message) -> Dict[str, Any]:
+        claimed = False
         try:
             if not message or not message.type:
                 log.error("Invalid message format received")
                 raise ValueError("Invalid message format")
             
-            # Check if message was already processed
-            if self.wpp_tools.is_message_already_processed(message):
+            # Claim the message, skipping redeliveries that are in-flight or already processed
+            with STAGE_SECONDS.labels("dedupe", message.type).time():
+                claimed = self.idempotency.claim(message.id)
+            if not claimed:
                 log.info("Message already processed", message_id=message.id)
-                return JSONResponse(
-                    status_code=200,
-                    content={"status": "skipped", "message": "Message already processed"}
-                )
+                return {"message_id": message.id, "status": "skipped", "message": "Message already processed"}
 
             log.info("Handling message", message_type=message.type, message_id=message.id)
+            if self.store is not None:
+                self.store.save_message(message)
 
-            # Extract text from message
-            msg_text = self._extract_text_from_message(message)
-            log.debug("Text extracted from message", message_id=message.id, text_length=len(msg_text))
-            
-            # Get structured info from text
-            text_info = self._get_text_info(msg_text)
-            log.debug("Structured info obtained", message_id=message.id, info_length=len(text_info))
+            # Same media content seen before: skip download, OCR/transcription and LLM
+            cached = self._get_cached_media_result(message)
+            if cached is not None:
+                log.info("Media result served from cache", message_id=message.id)
+                purchase_info = fill_missing_date(cached["text_info"])
+                text_info = json.dumps(purchase_info)
+            else:
+                # Extract text from message
+                msg_text = self._extract_text_from_message(message)
+                log.debug("Text extracted from message", message_id=message.id, text_length=len(msg_text))
+
+                # Get structured info from text
+                purchase_info = self._get_purchase_info(message, msg_text)
+                self._cache_media_result(message, msg_text, purchase_info)
+                # Cached with an "Unknown" date left as is, so every replay gets its own timestamp
+                purchase_info = fill_missing_date(purchase_info)
+                text_info = json.dumps(purchase_info)
+                log.debug("Structured info obtained", message_id=message.id, info_length=len(text_info))
 
             # Save output JSON
-            self._save_output_json(text_info, message.id)
+            with STAGE_SECONDS.labels("save_json", message.type).time():
+                self._save_output_json(text_info, message.id)
+            self._record_purchase(message, purchase_info)
             log.info("Message handled successfully", message_id=message.id)
 
-            # Prepare and send WhatsApp response
+            # Prepare and send WhatsApp response; with the dispatcher it is queued and sent in the background
             data = self.wpp_tools.get_data_to_send(message.from_, text_info)
-            self.wpp_tools.send_message(data)
-            log.info("Message sent successfully", message_id=message.id)
+            with STAGE_SECONDS.labels("send_message", message.type).time():
+                if self.outbound is not None:
+                    self.outbound.submit(message.id, message.from_, data)
+                    reply = "queued"
+                else:
+                    self._record_sent(self.wpp_tools.send_message(data))
+                    reply = "sent"
+            log.info("Reply queued" if reply == "queued" else "Message sent successfully", message_id=message.id)
+            self.idempotency.complete(message.id, DONE)
 
-            return JSONResponse(
-                status_code=200,
-                content={"status": "success", "message": "Message handled successfully", "data": text_info}
-            )
+            return {"message_id": message.id, "status": "success", "message": "Message handled successfully",
+                    "data": text_info, "reply": reply}
 
         except Exception as e:
             log.error(e, "Error handling message", message_id=getattr(message, 'id', 'unknown'))
-            return JSONResponse(
-                status_code=500,
-                content={"status": "error", "message": str(e)}
-            )
+            if claimed:
+                # Let Meta's redelivery retry the message
+                self.idempotency.complete(message.id, FAILED)
+            return {"message_id": getattr(message, 'id', None), "status": "error", "message": str(e)}
+
+    def _record_purchase(self, message: Message, purchase_info: Dict[str, Any]) -> None:
+        """
+        Add the purchase to the sender's ledger, once per media content: a forwarded receipt is not
+        counted again. A ledger failure does not fail the message.
+        """
+        ledger = get_ledger()
+        if ledger is None:
+            return
+        try:
+            with STAGE_SECONDS.labels("ledger", message.type).time():
+                ledger.record(message.id, message.from_, purchase_info,
+                              fallback_timestamp=int(message.timestamp) if message.timestamp.isdigit() else None,
+                              media_sha256=self._get_media_sha256(message))
+        except Exception as e:
+            log.error(e, "Error recording purchase in ledger", message_id=message.id)
+
+    @staticmethod
+    def _record_sent(response: Optional[Dict[str, Any]]) -> None:
+        """
+        Remember the reply's WhatsApp message id so its delivery/read statuses can be timed.
+        """
+        tracker = get_status_tracker()
+        if tracker is None or not response:
+            return
+        for sent_message in response.get("messages") or ():
+            if sent_message.get("id"):
+                tracker.record_sent(sent_message["id"])
+
+    def _record_reply(self, outcome: DeliveryOutcome) -> None:
+        """
+        Record the final outcome of a dispatched reply: its id for delivery status timing and,
+        with the message store, the reply status and attempts next to the message.
+        """
+        if outcome.reply_id:
+            self._record_sent({"messages": [{"id": outcome.reply_id}]})
+        if self.store is not None:
+            self.store.save_reply(outcome.message_id, outcome.status, outcome.attempts, reply_id=outcome.reply_id)
+        log.info("Reply outcome recorded", message_id=outcome.message_id, status=outcome.status,
+                 attempts=outcome.attempts, latency=round(outcome.latency, 3))
+
+    def flush_replies(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for queued replies to be sent."""
+        return self.outbound.flush(timeout) if self.outbound is not None else True
+
+    def collect_metrics(self):
+        """
+        Scrape-time metrics read from the tools' own counters: cache hit ratios, fast-path hit rate,
+        provider error rates and circuit states, LLM token usage and voice note seconds saved.
+        """
+        caches = [self.media_cache]
+        if self.llm_tools.extraction_cache is not None:
+            caches.append(self.llm_tools.extraction_cache)
+        cache_stats = [cache.stats() for cache in caches]
+        yield ("loris_cache_hits", "gauge", "Cache hits since start",
+               [({"cache": stats["cache"]}, stats["hits"]) for stats in cache_stats])
+        yield ("loris_cache_misses", "gauge", "Cache misses since start",
+               [({"cache": stats["cache"]}, stats["misses"]) for stats in cache_stats])
+        yield ("loris_cache_hit_ratio", "gauge", "Cache hit ratio since start",
+               [({"cache": stats["cache"]}, stats["hit_ratio"]) for stats in cache_stats])
+
+        fast_path = self.receipt_extractor.stats()
+        yield ("loris_fast_path_hit_ratio", "gauge", "Receipts extracted without the LLM",
+               [({}, fast_path["hit_rate"])])
+
+        routers = [self.llm_tools.chat_router, self.llm_tools.audio_router]
+        yield ("loris_provider_error_rate", "gauge", "Provider error rate over the router's rolling window",
+               [({"router": router.name, "provider": provider}, snapshot["error_rate"])
+                for router in routers for provider, snapshot in router.snapshot().items()])
+        yield ("loris_provider_circuit_open", "gauge", "1 when the provider's circuit breaker is open",
+               [({"router": router.name, "provider": provider}, int(snapshot["circuit"] == "open"))
+                for router in routers for provider, snapshot in router.snapshot().items()])
+
+        token_usage = self.llm_tools.token_usage_stats()
+        samples = []
+        for key, usage in token_usage.items():
+            mode, provider = key.split(":", 1)
+            samples.append(({"mode": mode, "provider": provider, "kind": "prompt"}, usage["prompt_tokens"]))
+            samples.append(({"mode": mode, "provider": provider, "kind": "completion"}, usage["completion_tokens"]))
+        yield ("loris_llm_tokens", "gauge", "LLM tokens used since start", samples)
+
+        audio_preprocessor = self.llm_tools.audio_preprocessor
+        if audio_preprocessor is not None:
+            audio = audio_preprocessor.stats()
+            yield ("loris_audio_seconds", "gauge", "Voice note audio since start: received, sent for transcription and trimmed",
+                   [({"kind": "received"}, audio["original_seconds"]), ({"kind": "transcribed"}, audio["speech_seconds"]),
+                    ({"kind": "saved"}, audio["saved_seconds"])])
+
+    def warm_up(self) -> None:
+        """
+        Load the provider SDKs, prompts and OCR workers ahead of the first message.
+        """
+        self.ocr_tools.warm_up()
+        self.llm_tools.warm_up()
+        log.info("WhatsAppService warmed up")
+
+    def close(self) -> None:
+        """
+        Release resources held by the tools (queued replies, OCR worker processes, pending media archive writes,
+        hedging threads).
+        """
+        if self.outbound is not None:
+            self.outbound.close(drain_timeout=settings.outbound_reply_timeout)
+        self.ocr_tools.close()
+        self.wpp_tools.close()
+        self.llm_tools.close()
+        if self.store is not None:
+            self.store.close()
+        log.info("WhatsAppService closed")
 
     async def handle_webhook(self, webhook: WhatsAppWebhook) -> JSONResponse:
         """
         Main entrypoint for WhatsApp webhook events. Handles message and status update events.
+        Every message in a batched webhook is processed, concurrently up to settings.message_concurrency:
+        messages from different senders run in parallel, messages from the same sender one after the
+        other, in the order received.
         """
         try:
             if not webhook or not webhook.entry:
@@ -136,8 +414,28 @@ class WhatsAppService:
             log.info("Processing webhook", webhook_type=webhook_type)
 
             if webhook_type == "message":
-                message = webhook.entry[0].changes[0].value.messages[0]
-                return self._handle_message(message=message)
+                messages = list(iter_messages(webhook))
+                semaphore = asyncio.Semaphore(settings.message_concurrency)
+                partitions: Dict[int, List[Tuple[int, Message]]] = {}
+                for index, message in enumerate(messages):
+                    partition = partition_for(message.from_, len(self._partition_locks))
+                    partitions.setdefault(partition, []).append((index, message))
+                results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+
+                async def handle_partition(partition: int, group: List[Tuple[int, Message]]) -> None:
+                    async with self._partition_locks[partition]:
+                        for index, message in group:
+                            async with semaphore:
+                                # Media download, OCR and LLM calls are blocking, keep them off the event loop
+                                results[index] = await run_in_threadpool(self._handle_message, message=message)
+
+                await asyncio.gather(*(handle_partition(partition, group) for partition, group in partitions.items()))
+                failed = any(result["status"] == "error" for result in results)
+                log.info("Webhook messages processed", message_count=len(results), failed=failed)
+                return JSONResponse(
+                    status_code=500 if failed else 200,
+                    content={"status": "error" if failed else "success", "results": results}
+                )
             else:
                 log.info("Webhook processed (not a message)", webhook_type=webhook_type)
                 return JSONResponse(
@@ -149,4 +447,57 @@ class WhatsAppService:
             return JSONResponse(
                 status_code=500,
                 content={"status": "error", "message": str(e)}
-            )
\ No newline at end of file
+            )
+
+_service: Optional[WhatsAppService] = None
+_service_lock = threading.Lock()
+
+
+def get_whatsapp_service() -> WhatsAppService:
+    """
+    Get the process-wide WhatsAppService, building it on first use.
+    Tools and their HTTP/LLM clients live as long as the application.
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = WhatsAppService()
+    return _service
+
+
+def warm_up_whatsapp_service() -> None:
+    """Build the process-wide service and warm up its tools."""
+    get_whatsapp_service().warm_up()
+
+
+def close_whatsapp_service() -> None:
+    """Close the process-wide service if it was built."""
+    global _service
+    with _service_lock:
+        service, _service = _service, None
+    if service is not None:
+        service.close()
+
+
+def _reset_service_after_fork() -> None:
+    # Forked workers build their own service so they get their own HTTP clients
+    global _service, _service_lock
+    _service = None
+    _service_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_service_after_fork)
+
+
+def process_message_job(payload: Dict[str, Any]) -> None:
+    """
+    Background job entrypoint used by the JobQueue workers.
+    Takes a plain message dict so it can cross a process boundary.
+    """
+    message = Message.model_validate(payload)
+    service = get_whatsapp_service()
+    service._handle_message(message=message)
+    if settings.worker_pool_type == "process":
+        # Process pool workers exit without running shutdown hooks, so do not leave replies queued
+        service.flush_replies(settings.outbound_reply_timeout)
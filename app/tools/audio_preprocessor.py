@@ -0,0 +1,255 @@
+import io
+import math
+import shutil
+import subprocess
+import threading
+import wave
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from model.output_models import PreprocessedAudio
+
+# Whisper resamples everything to 16 kHz mono; sending more is wasted upload and decoding
+WHISPER_SAMPLE_RATE = 16000
+
+AudioSource = Union[str, bytes, memoryview]
+
+
+class AudioDecodeError(Exception):
+    """Raised when an audio file cannot be decoded to PCM."""
+
+
+def ffmpeg_available() -> bool:
+    """Whether the ffmpeg binary (needed to decode OGG/Opus voice notes) is on the PATH."""
+    return shutil.which("ffmpeg") is not None
+
+
+def _decode_wav(data: bytes, sample_rate: int) -> np.ndarray:
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise AudioDecodeError(f"Unsupported WAV sample width: {wav.getsampwidth()} bytes")
+        channels, rate = wav.getnchannels(), wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    samples = np.frombuffer(frames, dtype="<i2").reshape(-1, channels).mean(axis=1)
+    if rate != sample_rate and len(samples):
+        # Linear interpolation is enough for speech going down to 16 kHz
+        positions = np.arange(0, len(samples), rate / sample_rate)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return samples.astype(np.int16)
+
+
+def _decode_with_ffmpeg(source: AudioSource, sample_rate: int, timeout: float) -> np.ndarray:
+    in_memory = not isinstance(source, str)
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0" if in_memory else source,
+               "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "pipe:1"]
+    try:
+        result = subprocess.run(command, input=bytes(source) if in_memory else None, capture_output=True,
+                                timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise AudioDecodeError(f"ffmpeg failed: {e}") from e
+    if result.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return np.frombuffer(result.stdout, dtype="<i2")
+
+
+def decode_audio(source: AudioSource, sample_rate: int = WHISPER_SAMPLE_RATE, timeout: float = 60.0) -> np.ndarray:
+    """
+    Decode an audio file (path or encoded bytes) to mono 16-bit PCM at sample_rate.
+    WAV is decoded in-process; everything else (WhatsApp sends OGG/Opus) goes through ffmpeg.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as audio_file:
+            header = audio_file.read(12)
+    else:
+        header = bytes(source[:12])
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        if isinstance(source, str):
+            with open(source, "rb") as audio_file:
+                return _decode_wav(audio_file.read(), sample_rate)
+        return _decode_wav(bytes(source), sample_rate)
+    if not ffmpeg_available():
+        raise AudioDecodeError("ffmpeg is not installed")
+    return _decode_with_ffmpeg(source, sample_rate, timeout)
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def encode_opus(samples: np.ndarray, sample_rate: int, bitrate: str = "24k", timeout: float = 60.0) -> bytes:
+    """
+    Encode mono 16-bit PCM as Opus in an OGG container with ffmpeg, about a tenth of the size of
+    the same audio as WAV. Raises AudioDecodeError when ffmpeg fails.
+    """
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error", "-f", "s16le", "-ar", str(sample_rate), "-ac", "1",
+               "-i", "pipe:0", "-c:a", "libopus", "-b:a", bitrate, "-application", "voip", "-f", "ogg", "pipe:1"]
+    try:
+        result = subprocess.run(command, input=samples.astype("<i2").tobytes(), capture_output=True, timeout=timeout)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise AudioDecodeError(f"ffmpeg failed: {e}") from e
+    if result.returncode != 0:
+        raise AudioDecodeError(f"ffmpeg failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return result.stdout
+
+
+class AudioPreprocessor:
+    """
+    Prepares voice notes for Whisper: decodes to 16 kHz mono, finds speech with an energy-based
+    voice activity detector and drops the silence around it, then packs the speech into chunks of
+    at most chunk_seconds, cut at pauses, so they can be transcribed in parallel.
+    A frame is speech when its RMS energy is above energy_ratio times the noise floor (10th
+    percentile of the frame energies), capped at half the 90th percentile so a note without
+    pauses is kept whole. Pauses shorter than min_silence_ms are kept, and every speech
+    segment keeps padding_ms of context on each side.
+    Chunks are encoded as Opus at chunk_bitrate for upload, or as WAV when ffmpeg is not
+    available (WAV input) or cannot encode Opus.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = WHISPER_SAMPLE_RATE,
+        frame_ms: int = 30,
+        energy_ratio: float = 3.0,
+        min_energy: float = 50.0,
+        min_silence_ms: int = 500,
+        padding_ms: int = 200,
+        chunk_seconds: float = 30.0,
+        chunk_bitrate: str = "24k",
+    ):
+        if chunk_seconds <= 0:
+            raise ValueError("chunk_seconds must be positive")
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.energy_ratio = energy_ratio
+        self.min_energy = min_energy
+        self.min_silence_ms = min_silence_ms
+        self.padding_ms = padding_ms
+        self.chunk_seconds = chunk_seconds
+        self.chunk_bitrate = chunk_bitrate
+        self.messages = 0
+        self.original_seconds = 0.0
+        self.speech_seconds = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def frame_size(self) -> int:
+        return max(1, self.sample_rate * self.frame_ms // 1000)
+
+    def _frame_energy(self, samples: np.ndarray) -> np.ndarray:
+        count = len(samples) // self.frame_size
+        frames = samples[:count * self.frame_size].astype(np.float32).reshape(count, self.frame_size)
+        return np.sqrt(np.mean(frames * frames, axis=1))
+
+    def _speech_segments(self, energy: np.ndarray) -> List[Tuple[int, int]]:
+        """Speech as (start, end) frame ranges, padded and with short pauses bridged."""
+        if not len(energy):
+            return []
+        noise_floor = float(np.percentile(energy, 10))
+        threshold = max(self.min_energy, min(noise_floor * self.energy_ratio, float(np.percentile(energy, 90)) / 2))
+        speech = np.flatnonzero(energy > threshold)
+        if not len(speech):
+            return []
+        padding = math.ceil(self.padding_ms / self.frame_ms)
+        min_gap = math.ceil(self.min_silence_ms / self.frame_ms)
+        segments: List[Tuple[int, int]] = []
+        start = previous = int(speech[0])
+        for frame in speech[1:]:
+            frame = int(frame)
+            if frame - previous > min_gap:
+                segments.append((start, previous + 1))
+                start = frame
+            previous = frame
+        segments.append((start, previous + 1))
+        padded = []
+        for start, end in segments:
+            start, end = max(0, start - padding), min(len(energy), end + padding)
+            if padded and start <= padded[-1][1]:
+                padded[-1] = (padded[-1][0], end)
+            else:
+                padded.append((start, end))
+        return padded
+
+    def _split_long(self, start: int, end: int, energy: np.ndarray, max_frames: int) -> List[Tuple[int, int]]:
+        # A segment longer than a chunk is cut at its quietest frame in the last quarter of each window
+        pieces = []
+        while end - start > max_frames:
+            window_start = start + max_frames * 3 // 4
+            cut = window_start + int(np.argmin(energy[window_start:start + max_frames]))
+            pieces.append((start, cut))
+            start = cut
+        pieces.append((start, end))
+        return pieces
+
+    def _chunk(self, segments: List[Tuple[int, int]], energy: np.ndarray) -> List[List[Tuple[int, int]]]:
+        """Group consecutive segments into chunks of at most chunk_seconds."""
+        max_frames = max(1, int(self.chunk_seconds * 1000 / self.frame_ms))
+        chunks: List[List[Tuple[int, int]]] = []
+        current: List[Tuple[int, int]] = []
+        current_frames = 0
+        for start, end in segments:
+            for piece_start, piece_end in self._split_long(start, end, energy, max_frames):
+                length = piece_end - piece_start
+                if current and current_frames + length > max_frames:
+                    chunks.append(current)
+                    current, current_frames = [], 0
+                current.append((piece_start, piece_end))
+                current_frames += length
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def _encode(self, pcm_chunks: List[np.ndarray]) -> Tuple[List[bytes], str]:
+        """Chunks encoded for upload and their file extension: Opus when ffmpeg can, WAV otherwise."""
+        if pcm_chunks and ffmpeg_available():
+            try:
+                return [encode_opus(pcm, self.sample_rate, self.chunk_bitrate) for pcm in pcm_chunks], "ogg"
+            except AudioDecodeError:
+                # e.g. an ffmpeg build without libopus
+                pass
+        return [encode_wav(pcm, self.sample_rate) for pcm in pcm_chunks], "wav"
+
+    def process(self, source: AudioSource) -> PreprocessedAudio:
+        """
+        Decode, trim and chunk an audio file given as a path or encoded bytes.
+        Raises AudioDecodeError when the audio cannot be decoded.
+        """
+        samples = decode_audio(source, self.sample_rate)
+        energy = self._frame_energy(samples)
+        frame_size = self.frame_size
+        pcm_chunks = [np.concatenate([samples[start * frame_size:end * frame_size] for start, end in chunk])
+                      for chunk in self._chunk(self._speech_segments(energy), energy)]
+        speech_samples = sum(len(pcm) for pcm in pcm_chunks)
+        chunks, chunk_format = self._encode(pcm_chunks)
+        original_seconds = len(samples) / self.sample_rate
+        speech_seconds = speech_samples / self.sample_rate
+        with self._lock:
+            self.messages += 1
+            self.original_seconds += original_seconds
+            self.speech_seconds += speech_seconds
+        return PreprocessedAudio(
+            chunks=chunks,
+            chunk_format=chunk_format,
+            chunk_bytes=sum(len(chunk) for chunk in chunks),
+            sample_rate=self.sample_rate,
+            original_seconds=round(original_seconds, 3),
+            speech_seconds=round(speech_seconds, 3),
+            saved_seconds=round(original_seconds - speech_seconds, 3),
+            chunk_count=len(chunks),
+        )
+
+    def stats(self) -> Dict[str, float]:
+        """Voice notes preprocessed and their audio seconds before and after silence trimming."""
+        with self._lock:
+            return {
+                "messages": self.messages,
+                "original_seconds": self.original_seconds,
+                "speech_seconds": self.speech_seconds,
+                "saved_seconds": self.original_seconds - self.speech_seconds,
+            }
@@ -0,0 +1,204 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import settings
+from logger import log
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU cache with optional per-entry TTL.
+    Keeps hit/miss counters so callers can report cache effectiveness.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # key -> (value, expires_at)
+        self._entries: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheTier:
+    """
+    On-disk cache tier storing JSON values in a SQLite table, so entries survive restarts.
+    Bounded to max_entries, evicting the least recently used rows.
+    """
+    EVICT_EVERY = 100
+
+    def __init__(self, db_path: str, table: str, max_entries: int = 100000, ttl: Optional[float] = None):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid cache table name: {table}")
+        self.db_path = db_path
+        self.table = table
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not shared with forked worker processes
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " expires_at REAL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_accessed_at ON {self.table} (accessed_at)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                f"SELECT value FROM {self.table} WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl else None
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at, now),
+            )
+            self._writes += 1
+            if self._writes % self.EVICT_EVERY == 0:
+                self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute(f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        conn.execute(
+            f"DELETE FROM {self.table} WHERE key IN ("
+            f" SELECT key FROM {self.table} ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+
+class TieredCache:
+    """
+    Memory LRU in front of an optional SQLite tier.
+    Disk hits are promoted to memory; writes go to both tiers.
+    """
+
+    def __init__(self, name: str, memory: LRUCache, disk: Optional[SQLiteCacheTier] = None):
+        self.name = name
+        self.memory = memory
+        self.disk = disk
+        self.disk_hits = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+        try:
+            value = self.disk.get(key)
+        except Exception as e:
+            log.error(e, "Error reading from disk cache", cache=self.name)
+            return None
+        if value is not None:
+            self.disk_hits += 1
+            self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except Exception as e:
+                log.error(e, "Error writing to disk cache", cache=self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters across both tiers."""
+        lookups = self.memory.hits + self.memory.misses
+        hits = self.memory.hits + self.disk_hits
+        return {
+            "cache": self.name,
+            "entries": len(self.memory),
+            "hits": hits,
+            "memory_hits": self.memory.hits,
+            "disk_hits": self.disk_hits,
+            "misses": lookups - hits,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+        }
+
+
+def build_media_result_cache() -> TieredCache:
+    """
+    Content-addressed cache from media sha256 to extracted text and PurchaseInfo.
+    The SQLite tier is enabled with settings.media_cache_disk_enabled.
+    """
+    disk = None
+    if settings.media_cache_disk_enabled:
+        disk = SQLiteCacheTier(
+            db_path=settings.media_cache_db_path,
+            table="media_results",
+            max_entries=settings.media_cache_disk_max_entries,
+        )
+    return TieredCache("media_results", LRUCache(max_entries=settings.media_cache_max_entries), disk)
+
+
+def build_llm_extraction_cache() -> TieredCache:
+    """
+    Cache of LLM purchase extractions keyed by normalized text, model and prompt version.
+    Entries expire after settings.llm_cache_ttl; the SQLite tier is enabled with settings.llm_cache_disk_enabled.
+    """
+    disk = None
+    if settings.llm_cache_disk_enabled:
+        disk = SQLiteCacheTier(
+            db_path=settings.llm_cache_db_path,
+            table="llm_extractions",
+            max_entries=settings.llm_cache_disk_max_entries,
+            ttl=settings.llm_cache_ttl,
+        )
+    memory = LRUCache(max_entries=settings.llm_cache_max_entries, ttl=settings.llm_cache_ttl)
+    return TieredCache("llm_extractions", memory, disk)
@@ -0,0 +1,128 @@
+import os
+import threading
+from typing import Dict
+
+import httpx
+
+from config import settings
+from logger import log
+from metrics import UPSTREAM_REQUESTS
+
+
+class CountingTransport(httpx.HTTPTransport):
+    """Counts responses per upstream by status class ("2xx", "5xx", ...) and transport errors."""
+
+    def __init__(self, upstream: str, **kwargs):
+        super().__init__(**kwargs)
+        self.upstream = upstream
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            response = super().handle_request(request)
+        except Exception:
+            UPSTREAM_REQUESTS.labels(self.upstream, "error").inc()
+            raise
+        UPSTREAM_REQUESTS.labels(self.upstream, f"{response.status_code // 100}xx").inc()
+        return response
+
+
+class AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    """Async counterpart of CountingTransport."""
+
+    def __init__(self, upstream: str, **kwargs):
+        super().__init__(**kwargs)
+        self.upstream = upstream
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            response = await super().handle_async_request(request)
+        except Exception:
+            UPSTREAM_REQUESTS.labels(self.upstream, "error").inc()
+            raise
+        UPSTREAM_REQUESTS.labels(self.upstream, f"{response.status_code // 100}xx").inc()
+        return response
+
+
+class HTTPClientPool:
+    """
+    Long-lived httpx clients, one per upstream, so requests to the Graph API and
+    the LLM providers reuse keep-alive connections instead of paying a new
+    TCP+TLS handshake each time.
+    """
+    UPSTREAMS = ("graph", "openai", "groq")
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 30.0,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = httpx.Timeout(timeout)
+        self._clients: Dict[str, httpx.Client] = {}
+        self._async_clients: Dict[str, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()
+        # Sockets must not be shared with forked worker processes
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self) -> None:
+        self._clients = {}
+        self._async_clients = {}
+        self._lock = threading.Lock()
+
+    def _check_upstream(self, upstream: str) -> None:
+        if upstream not in self.UPSTREAMS:
+            raise ValueError(f"Unsupported upstream: {upstream}")
+
+    def get(self, upstream: str) -> httpx.Client:
+        """Get the shared synchronous client for an upstream, creating it on first use."""
+        client = self._clients.get(upstream)
+        if client is not None:
+            return client
+        self._check_upstream(upstream)
+        with self._lock:
+            if upstream not in self._clients:
+                self._clients[upstream] = httpx.Client(
+                    transport=CountingTransport(upstream, limits=self.limits), timeout=self.timeout)
+                log.info("HTTP client pool created", upstream=upstream, mode="sync")
+            return self._clients[upstream]
+
+    def get_async(self, upstream: str) -> httpx.AsyncClient:
+        """Get the shared asynchronous client for an upstream, creating it on first use."""
+        client = self._async_clients.get(upstream)
+        if client is not None:
+            return client
+        self._check_upstream(upstream)
+        with self._lock:
+            if upstream not in self._async_clients:
+                self._async_clients[upstream] = httpx.AsyncClient(
+                    transport=AsyncCountingTransport(upstream, limits=self.limits), timeout=self.timeout)
+                log.info("HTTP client pool created", upstream=upstream, mode="async")
+            return self._async_clients[upstream]
+
+    async def aclose(self) -> None:
+        """Close every client in the pool. Called on application shutdown."""
+        with self._lock:
+            clients = list(self._clients.values())
+            async_clients = list(self._async_clients.values())
+            self._clients = {}
+            self._async_clients = {}
+        for client in clients:
+            client.close()
+        for async_client in async_clients:
+            await async_client.aclose()
+        log.info("HTTP client pools closed")
+
+
+# Global pool shared by every tool in the process
+http_clients = HTTPClientPool(
+    max_connections=settings.http_pool_max_connections,
+    max_keepalive_connections=settings.http_pool_max_keepalive,
+    keepalive_expiry=settings.http_pool_keepalive_expiry,
+    timeout=settings.http_timeout,
+)
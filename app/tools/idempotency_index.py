@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from config import settings
+from logger import log
+
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+
+class IdempotencyIndex:
+    """
+    In-memory idempotency index keyed by message id.
+    A message is claimed atomically as in-flight before processing and marked done or
+    failed afterwards, so a redelivery arriving mid-processing is skipped.
+    In-flight claims expire after lease_ttl (a crashed worker does not block retries forever),
+    terminal states after ttl. Failed messages can be claimed again.
+    Past max_entries the oldest done and failed entries are evicted; in-flight claims never are.
+    """
+    EVICT_SCAN_LIMIT = 64
+
+    def __init__(self, ttl: float = 604800.0, lease_ttl: float = 900.0, max_entries: int = 100000):
+        self.ttl = ttl
+        self.lease_ttl = lease_ttl
+        self.max_entries = max_entries
+        # message_id -> (state, expires_at), oldest update first
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float) -> None:
+        # Oldest first: expired entries go, and while over max_entries so do done and failed ones.
+        # In-flight claims stay until their lease expires, even over the cap, or a redelivery could
+        # claim them again. At most EVICT_SCAN_LIMIT entries are looked at per call, so a run of
+        # in-flight claims at the head does not turn every claim into a full scan
+        excess = len(self._entries) - self.max_entries
+        evicted = []
+        for scanned, (message_id, (state, expires_at)) in enumerate(self._entries.items()):
+            if scanned >= self.EVICT_SCAN_LIMIT:
+                break
+            if expires_at <= now or (excess > 0 and state != IN_FLIGHT):
+                evicted.append(message_id)
+                excess -= 1
+            elif excess <= 0:
+                break
+        for message_id in evicted:
+            del self._entries[message_id]
+
+    def _set(self, message_id: str, state: str, expires_at: float) -> None:
+        self._entries[message_id] = (state, expires_at)
+        self._entries.move_to_end(message_id)
+
+    def get_state(self, message_id: str) -> Optional[str]:
+        """Return the current state of a message, or None if unknown or expired."""
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is None or entry[1] <= time.time():
+                return None
+            return entry[0]
+
+    def claim(self, message_id: str) -> bool:
+        """Atomically mark a message as in-flight. Returns False if it is in-flight or done."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is not None and entry[1] > now and entry[0] != FAILED:
+                log.debug("Message claim rejected", message_id=message_id, state=entry[0])
+                return False
+            self._set(message_id, IN_FLIGHT, now + self.lease_ttl)
+            self._evict(now)
+            return True
+
+    def complete(self, message_id: str, state: str = DONE) -> None:
+        """Record the terminal state (done or failed) of a claimed message."""
+        if state not in (DONE, FAILED):
+            raise ValueError(f"Unsupported terminal state: {state}")
+        now = time.time()
+        with self._lock:
+            self._set(message_id, state, now + self.ttl)
+            self._evict(now)
+
+
+class SQLiteIdempotencyIndex(IdempotencyIndex):
+    """
+    Durable idempotency index backed by SQLite, shared by every process using the same file.
+    Claims are a single upsert, so they stay atomic across worker processes and restarts.
+    """
+    EVICT_EVERY = 1000
+
+    def __init__(self, db_path: str, ttl: float = 604800.0, lease_ttl: float = 900.0):
+        super().__init__(ttl=ttl, lease_ttl=lease_ttl)
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._writes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not shared with forked worker processes
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS idempotency ("
+                " message_id TEXT PRIMARY KEY,"
+                " state TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_expires_at ON idempotency (expires_at)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _maybe_evict(self, conn: sqlite3.Connection, now: float) -> None:
+        self._writes += 1
+        if self._writes % self.EVICT_EVERY == 0:
+            deleted = conn.execute("DELETE FROM idempotency WHERE expires_at <= ?", (now,)).rowcount
+            log.debug("Expired idempotency records evicted", deleted=deleted)
+
+    def get_state(self, message_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT state FROM idempotency WHERE message_id = ? AND expires_at > ?",
+                (message_id, time.time()),
+            ).fetchone()
+            return row[0] if row else None
+
+    def claim(self, message_id: str) -> bool:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            claimed = conn.execute(
+                "INSERT INTO idempotency (message_id, state, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (message_id) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at "
+                "WHERE idempotency.expires_at <= ? OR idempotency.state = ?",
+                (message_id, IN_FLIGHT, now + self.lease_ttl, now, FAILED),
+            ).rowcount == 1
+            self._maybe_evict(conn, now)
+        if not claimed:
+            log.debug("Message claim rejected", message_id=message_id)
+        return claimed
+
+    def complete(self, message_id: str, state: str = DONE) -> None:
+        if state not in (DONE, FAILED):
+            raise ValueError(f"Unsupported terminal state: {state}")
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO idempotency (message_id, state, expires_at) VALUES (?, ?, ?)",
+                (message_id, state, now + self.ttl),
+            )
+            self._maybe_evict(conn, now)
+
+
+def build_idempotency_index() -> IdempotencyIndex:
+    """Build the idempotency index selected by settings.idempotency_backend."""
+    if settings.idempotency_backend == "sqlite":
+        log.info("Using SQLite idempotency index", db_path=settings.idempotency_db_path)
+        return SQLiteIdempotencyIndex(
+            db_path=settings.idempotency_db_path,
+            ttl=settings.idempotency_ttl,
+            lease_ttl=settings.idempotency_lease_ttl,
+        )
+    return IdempotencyIndex(
+        ttl=settings.idempotency_ttl,
+        lease_ttl=settings.idempotency_lease_ttl,
+        max_entries=settings.idempotency_max_entries,
+    )
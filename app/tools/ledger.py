@@ -0,0 +1,254 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from logger import log
+from model.ledger_model import CategoryTotal, LedgerCategories, LedgerTotals, PeriodTotal
+
+GRANULARITIES = ("day", "month", "all")
+# Category key of the rollup rows that sum every category
+ALL_CATEGORIES = "*"
+# Period key of the all-time rollup rows
+ALL_TIME = "*"
+
+ISO_DATE_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+NUMERIC_DATE_RE = re.compile(r"(\d{2})/(\d{2})/(\d{4})")
+
+
+def normalize_date(value: Optional[str], fallback_timestamp: Optional[int] = None) -> str:
+    """
+    Purchase date as YYYY-MM-DD. Accepts ISO dates (with or without time) and DD/MM/YYYY;
+    anything else ("Unknown") falls back to the message timestamp, or today.
+    """
+    if value:
+        match = ISO_DATE_RE.search(value)
+        parts = (match.group(1), match.group(2), match.group(3)) if match else None
+        if parts is None:
+            match = NUMERIC_DATE_RE.search(value)
+            parts = (match.group(3), match.group(2), match.group(1)) if match else None
+        if parts is not None:
+            try:
+                return datetime(int(parts[0]), int(parts[1]), int(parts[2])).strftime("%Y-%m-%d")
+            except ValueError:
+                pass
+    timestamp = fallback_timestamp if fallback_timestamp is not None else time.time()
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def normalize_category(value: Optional[str]) -> str:
+    category = (value or "").strip().lower()
+    return category if category and category != ALL_CATEGORIES else "unknown"
+
+
+class Ledger:
+    """
+    Purchases per sender (WhatsApp number) in SQLite, with rollups by day, month and all time,
+    per category and across categories, kept up to date on every insert. A totals or
+    by-category query reads a handful of rollup rows by primary key, however long the history.
+    Recording the same message again replaces its previous contribution.
+    Shared by every process using the same file.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not shared with forked worker processes
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS transactions ("
+                " message_id TEXT PRIMARY KEY,"
+                " sender TEXT NOT NULL,"
+                " purchase_date TEXT NOT NULL,"
+                " amount REAL NOT NULL,"
+                " currency TEXT NOT NULL,"
+                " category TEXT NOT NULL,"
+                " store_name TEXT,"
+                " payment_method TEXT,"
+                " created_at REAL NOT NULL,"
+                " media_sha256 TEXT)"
+            )
+            # Ledgers created before media deduplication lack the column
+            if "media_sha256" not in {row[1] for row in conn.execute("PRAGMA table_info(transactions)")}:
+                conn.execute("ALTER TABLE transactions ADD COLUMN media_sha256 TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_sender_date ON transactions (sender, purchase_date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_sender_media ON transactions (sender, media_sha256)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rollups ("
+                " sender TEXT NOT NULL,"
+                " granularity TEXT NOT NULL,"
+                " period TEXT NOT NULL,"
+                " category TEXT NOT NULL,"
+                " currency TEXT NOT NULL,"
+                " total REAL NOT NULL,"
+                " count INTEGER NOT NULL,"
+                " PRIMARY KEY (sender, granularity, period, category, currency))"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _rollup_keys(purchase_date: str, category: str) -> List[Tuple[str, str, str]]:
+        periods = (("day", purchase_date), ("month", purchase_date[:7]), ("all", ALL_TIME))
+        return [(granularity, period, key) for granularity, period in periods for key in (category, ALL_CATEGORIES)]
+
+    @classmethod
+    def _apply(cls, conn: sqlite3.Connection, sender: str, purchase_date: str, category: str, currency: str,
+               amount: float, count: int) -> None:
+        conn.executemany(
+            "INSERT INTO rollups (sender, granularity, period, category, currency, total, count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (sender, granularity, period, category, currency) "
+            "DO UPDATE SET total = total + excluded.total, count = count + excluded.count",
+            [(sender, granularity, period, key, currency, amount, count)
+             for granularity, period, key in cls._rollup_keys(purchase_date, category)],
+        )
+
+    def record(self, message_id: str, sender: str, purchase: Dict[str, Any],
+               fallback_timestamp: Optional[int] = None, media_sha256: Optional[str] = None) -> bool:
+        """
+        Add an extracted purchase to the sender's ledger. Purchases without a positive amount
+        (failed extractions) are skipped, and so is media the sender already had recorded under
+        another message (a forwarded receipt). Returns whether the purchase was recorded.
+        """
+        try:
+            amount = float(purchase.get("amount") or 0.0)
+        except (TypeError, ValueError):
+            amount = 0.0
+        if "error" in purchase or amount <= 0:
+            return False
+        row = (
+            message_id,
+            sender,
+            normalize_date(purchase.get("date"), fallback_timestamp),
+            amount,
+            (purchase.get("currency") or "R$").strip(),
+            normalize_category(purchase.get("category")),
+            purchase.get("store_name"),
+            purchase.get("payment_method"),
+            time.time(),
+            media_sha256,
+        )
+        with self._lock:
+            conn = self._connection()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if media_sha256 is not None and conn.execute(
+                        "SELECT 1 FROM transactions WHERE sender = ? AND media_sha256 = ? AND message_id != ?",
+                        (sender, media_sha256, message_id)).fetchone() is not None:
+                    conn.execute("COMMIT")
+                    log.info("Purchase already recorded for this media, skipping", message_id=message_id,
+                             media_sha256=media_sha256)
+                    return False
+                previous = conn.execute(
+                    "SELECT sender, purchase_date, category, currency, amount FROM transactions WHERE message_id = ?",
+                    (message_id,)).fetchone()
+                if previous is not None:
+                    # Reprocessed message: take its old values out of the rollups first
+                    self._apply(conn, previous[0], previous[1], previous[2], previous[3], -previous[4], -1)
+                conn.execute(
+                    "INSERT OR REPLACE INTO transactions (message_id, sender, purchase_date, amount, currency, category,"
+                    " store_name, payment_method, created_at, media_sha256) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+                self._apply(conn, sender, row[2], row[5], row[4], amount, 1)
+                conn.execute("COMMIT")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        log.info("Purchase recorded in ledger", message_id=message_id, purchase_date=row[2], category=row[5])
+        return True
+
+    @staticmethod
+    def _period_key(granularity: str, period: Optional[str]) -> str:
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unsupported granularity: {granularity}")
+        if granularity == "all":
+            return ALL_TIME
+        pattern = r"\d{4}-\d{2}-\d{2}" if granularity == "day" else r"\d{4}-\d{2}"
+        if not period or not re.fullmatch(pattern, period):
+            raise ValueError(f"Period for granularity '{granularity}' must look like "
+                             f"{'YYYY-MM-DD' if granularity == 'day' else 'YYYY-MM'}")
+        return period
+
+    def _rollup_rows(self, sender: str, granularity: str, period_key: str, category: Optional[str]) -> List[tuple]:
+        with self._lock:
+            if category is None:
+                return self._connection().execute(
+                    "SELECT category, currency, total, count FROM rollups "
+                    "WHERE sender = ? AND granularity = ? AND period = ? AND category != ? AND count > 0 "
+                    "ORDER BY total DESC",
+                    (sender, granularity, period_key, ALL_CATEGORIES)).fetchall()
+            return self._connection().execute(
+                "SELECT category, currency, total, count FROM rollups "
+                "WHERE sender = ? AND granularity = ? AND period = ? AND category = ? AND count > 0 ORDER BY currency",
+                (sender, granularity, period_key, category)).fetchall()
+
+    def totals(self, sender: str, granularity: str = "month", period: Optional[str] = None) -> LedgerTotals:
+        """Total spent per currency in a day (YYYY-MM-DD), a month (YYYY-MM) or all time."""
+        period_key = self._period_key(granularity, period)
+        rows = self._rollup_rows(sender, granularity, period_key, ALL_CATEGORIES)
+        return LedgerTotals(
+            sender=sender,
+            granularity=granularity,
+            period=None if granularity == "all" else period,
+            totals=[PeriodTotal(currency=currency, total=round(total, 2), count=count)
+                    for _, currency, total, count in rows],
+        )
+
+    def by_category(self, sender: str, granularity: str = "month", period: Optional[str] = None) -> LedgerCategories:
+        """Total spent per category and currency in a day, a month or all time, largest first."""
+        period_key = self._period_key(granularity, period)
+        rows = self._rollup_rows(sender, granularity, period_key, None)
+        return LedgerCategories(
+            sender=sender,
+            granularity=granularity,
+            period=None if granularity == "all" else period,
+            categories=[CategoryTotal(category=category, currency=currency, total=round(total, 2), count=count)
+                        for category, currency, total, count in rows],
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+_ledger: Optional[Ledger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_ledger() -> Optional[Ledger]:
+    """Get the process-wide ledger, or None when settings.ledger_enabled is off."""
+    global _ledger
+    if not settings.ledger_enabled:
+        return None
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = Ledger(db_path=settings.ledger_db_path)
+                log.info("Ledger enabled", db_path=settings.ledger_db_path)
+    return _ledger
+
+
+def _reset_ledger_after_fork() -> None:
+    # Forked workers open their own connection
+    global _ledger, _ledger_lock
+    _ledger = None
+    _ledger_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_ledger_after_fork)
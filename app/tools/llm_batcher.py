@@ -0,0 +1,149 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from logger import log
+
+BatchFn = Callable[[List[str]], List[Dict[str, Any]]]
+SingleFn = Callable[[str], Dict[str, Any]]
+
+
+class ExtractionMicroBatcher:
+    """
+    Collects concurrent extraction requests for up to max_batch_size items or max_wait_ms
+    milliseconds and sends them as one batched LLM call, then hands each caller its own result.
+    If the batch call fails or returns the wrong number of items, every item falls back to an
+    individual call. Once closed, texts are extracted with individual calls on the caller's thread.
+    """
+
+    def __init__(
+        self,
+        batch_fn: BatchFn,
+        single_fn: SingleFn,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 50.0,
+        max_concurrent_batches: int = 4,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.batch_fn = batch_fn
+        self.single_fn = single_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix="loris-llm-batch")
+        self._collector: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.batched_items = 0
+        self.fallbacks = 0
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for extraction. The Future resolves to its PurchaseInfo dict."""
+        future: Future = Future()
+        with self._lock:
+            # Queued under the lock, so nothing can land behind the sentinel close() puts
+            closed = self._closed
+            if not closed:
+                if self._collector is None:
+                    self._collector = threading.Thread(target=self._collect, name="loris-llm-batch-collector", daemon=True)
+                    self._collector.start()
+                self._queue.put((text, future))
+        if closed:
+            self._run_single(text, future)
+        return future
+
+    def extract(self, text: str) -> Dict[str, Any]:
+        """Queue a text and wait for its result."""
+        return self.submit(text).result()
+
+    def _collect(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._dispatch(batch)
+                    return
+                batch.append(item)
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Tuple[str, Future]]) -> None:
+        try:
+            self._executor.submit(self._run_batch, batch)
+        except RuntimeError:
+            # The executor is already shut down; answer the batch here rather than drop it
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: List[Tuple[str, Future]]) -> None:
+        texts = [text for text, _ in batch]
+        results: Optional[List[Dict[str, Any]]] = None
+        if len(batch) > 1:
+            try:
+                results = self.batch_fn(texts)
+                if len(results) != len(batch):
+                    raise ValueError(f"Batch returned {len(results)} items for {len(batch)} texts")
+                with self._lock:
+                    self.batches += 1
+                    self.batched_items += len(batch)
+                log.info("LLM extraction batch processed", batch_size=len(batch))
+            except Exception as e:
+                log.warning("LLM extraction batch failed, falling back to individual calls",
+                            batch_size=len(batch), error=str(e))
+                results = None
+                with self._lock:
+                    self.fallbacks += 1
+        for index, (text, future) in enumerate(batch):
+            if results is not None:
+                future.set_result(results[index])
+            else:
+                self._run_single(text, future)
+
+    def _run_single(self, text: str, future: Future) -> None:
+        try:
+            future.set_result(self.single_fn(text))
+        except Exception as e:
+            future.set_exception(e)
+
+    def stats(self) -> Dict[str, Any]:
+        """Batches sent, items they carried and batches that fell back to individual calls."""
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "batched_items": self.batched_items,
+                "fallbacks": self.fallbacks,
+                "average_batch_size": self.batched_items / self.batches if self.batches else 0.0,
+            }
+
+    def close(self) -> None:
+        """Send what is queued, then stop batching. Later submits are extracted individually."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            collector = self._collector
+        if collector is not None:
+            self._queue.put(None)
+            collector.join(timeout=5)
+        self._executor.shutdown(wait=True)
+        # Whatever the collector did not pick up is still waited on by someone; answer it directly
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._run_single(*item)
@@ -0,0 +1,195 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from config import settings
+from logger import log
+from model.whatsapp_model import Message
+
+# Columns of the messages table that can be written by upsert
+MESSAGE_COLUMNS = ("sender", "message_type", "received_at", "text", "media_sha256", "media_extension",
+                   "media_size", "ocr_text", "output_json", "reply_id", "reply_status", "reply_attempts")
+
+
+class MessageStore:
+    """
+    Message storage: one SQLite database (WAL) for metadata, text, OCR text and JSON output,
+    indexed by message id, sender and date, and a content-addressed media tree where a blob
+    lives at <media_path>/<sha[:2]>/<sha[2:4]>/<sha>.<extension>. Identical media (forwarded
+    receipts) is stored once, and no directory grows past a few thousand entries.
+    Shared by every process using the same files.
+    """
+
+    def __init__(self, db_path: str, media_path: str):
+        self.db_path = db_path
+        self.media_path = media_path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        # Reentrant so the writes of a batch() run inside its transaction
+        self._lock = threading.RLock()
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not shared with forked worker processes
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " message_id TEXT PRIMARY KEY,"
+                " sender TEXT,"
+                " message_type TEXT,"
+                " received_at INTEGER,"
+                " text TEXT,"
+                " media_sha256 TEXT,"
+                " media_extension TEXT,"
+                " media_size INTEGER,"
+                " ocr_text TEXT,"
+                " output_json TEXT,"
+                " reply_id TEXT,"
+                " reply_status TEXT,"
+                " reply_attempts INTEGER,"
+                " updated_at REAL NOT NULL)"
+            )
+            # Databases created before reply tracking lack its columns
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+            for column, column_type in (("reply_id", "TEXT"), ("reply_status", "TEXT"), ("reply_attempts", "INTEGER")):
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE messages ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_sender_received_at ON messages (sender, received_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_received_at ON messages (received_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_media_sha256 ON messages (media_sha256)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Run several writes in one transaction (used by the flat file migration)."""
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN")
+            try:
+                yield
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def upsert(self, message_id: str, **fields: Any) -> None:
+        """Insert a message row or update the given columns; columns passed as None keep their value."""
+        columns = [column for column in MESSAGE_COLUMNS if column in fields]
+        assignments = ", ".join(f"{column} = COALESCE(excluded.{column}, {column})" for column in columns)
+        sql = (f"INSERT INTO messages (message_id, {', '.join(columns)}, updated_at) "
+               f"VALUES (?, {', '.join('?' for _ in columns)}, ?) "
+               f"ON CONFLICT(message_id) DO UPDATE SET {assignments}, updated_at = excluded.updated_at")
+        with self._lock:
+            self._connection().execute(sql, (message_id, *(fields[column] for column in columns), time.time()))
+
+    def save_message(self, message: Message) -> None:
+        """Record who sent a message, when, and its type (and body, for text messages)."""
+        self.upsert(
+            message.id,
+            sender=message.from_,
+            message_type=message.type,
+            received_at=int(message.timestamp) if message.timestamp and message.timestamp.isdigit() else None,
+            text=message.text.body if message.type == "text" and message.text else None,
+        )
+
+    def blob_path(self, sha256: str, extension: str) -> str:
+        """Path of a media blob in the content-addressed tree."""
+        return os.path.join(self.media_path, sha256[:2], sha256[2:4], f"{sha256}.{extension}")
+
+    def write_blob(self, data: Union[bytes, memoryview], extension: str) -> Dict[str, Any]:
+        """
+        Write a media blob unless the same content is already stored. Returns its sha256, size and path.
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(sha256, extension)
+        if not os.path.exists(path):
+            directory = os.path.dirname(path)
+            os.makedirs(directory, exist_ok=True)
+            # Write to a temporary file and rename, so readers never see a partial blob
+            fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as blob:
+                    blob.write(data)
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        return {"sha256": sha256, "size": len(data), "path": path}
+
+    def save_media(self, message_id: str, data: Union[bytes, memoryview], extension: str) -> str:
+        """Store the media of a message. Returns the blob path."""
+        blob = self.write_blob(data, extension)
+        self.upsert(message_id, media_sha256=blob["sha256"], media_extension=extension, media_size=blob["size"])
+        log.info("Media stored", message_id=message_id, sha256=blob["sha256"], size=blob["size"])
+        return blob["path"]
+
+    def save_ocr_text(self, message_id: str, text: str) -> None:
+        self.upsert(message_id, ocr_text=text)
+
+    def save_output(self, message_id: str, output_json: str) -> None:
+        self.upsert(message_id, output_json=output_json)
+
+    def save_reply(self, message_id: str, status: str, attempts: int, reply_id: Optional[str] = None) -> None:
+        """Record how the reply to a message went: sent or failed, after how many attempts."""
+        self.upsert(message_id, reply_id=reply_id, reply_status=status, reply_attempts=attempts)
+
+    @staticmethod
+    def _row_to_dict(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+        return {description[0]: value for description, value in zip(cursor.description, row)}
+
+    def get(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """The stored record of a message, with the path of its media blob."""
+        with self._lock:
+            cursor = self._connection().execute("SELECT * FROM messages WHERE message_id = ?", (message_id,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        record = self._row_to_dict(cursor, row)
+        record["media_path"] = (self.blob_path(record["media_sha256"], record["media_extension"])
+                                if record["media_sha256"] else None)
+        return record
+
+    def find(self, sender: Optional[str] = None, since: Optional[int] = None, until: Optional[int] = None,
+             limit: int = 100) -> List[Dict[str, Any]]:
+        """Messages of a sender and/or a time range (unix seconds, until exclusive), newest first."""
+        conditions, params = [], []
+        if sender is not None:
+            conditions.append("sender = ?")
+            params.append(sender)
+        if since is not None:
+            conditions.append("received_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("received_at < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        with self._lock:
+            cursor = self._connection().execute(
+                f"SELECT * FROM messages {where}ORDER BY received_at DESC LIMIT ?", (*params, limit))
+            rows = cursor.fetchall()
+        return [self._row_to_dict(cursor, row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None and self._pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+def build_message_store() -> Optional[MessageStore]:
+    """Build the message store selected by settings.storage_backend, or None for the flat file layout."""
+    if settings.storage_backend != "sqlite":
+        return None
+    log.info("Using SQLite message store", db_path=settings.storage_db_path, media_path=settings.storage_media_path)
+    return MessageStore(db_path=settings.storage_db_path, media_path=settings.storage_media_path)
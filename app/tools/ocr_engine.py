@@ -0,0 +1,266 @@
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+# This module is imported by the OCR worker processes, keep it free of app config/logging imports.
+# PIL and pytesseract are imported on first use: the web process only submits image bytes
+
+ImageSource = Union[str, bytes]
+
+OCR_BACKENDS = ("pytesseract", "tesserocr")
+
+# One initialized Tesseract API per worker process/thread; the API object is not thread-safe
+_tesseract_apis = threading.local()
+
+_log = logging.getLogger(__name__)
+
+
+def tesserocr_available() -> bool:
+    """Whether the tesserocr bindings (in-process Tesseract API) can be imported."""
+    try:
+        import tesserocr  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _get_tesseract_api(lang: str = "eng"):
+    api = getattr(_tesseract_apis, "api", None)
+    if api is None:
+        # A failed initialization (e.g. missing tessdata) is not retried for every image
+        error = getattr(_tesseract_apis, "error", None)
+        if error is not None:
+            raise error
+        import tesserocr
+        try:
+            # Loads the language data once; later images reuse the warm handle
+            api = tesserocr.PyTessBaseAPI(lang=lang)
+        except Exception as e:
+            _tesseract_apis.error = e
+            raise
+        _tesseract_apis.api = api
+    return api
+
+
+def _init_worker(backend: str) -> None:
+    from PIL import Image  # noqa: F401
+    if backend == "tesserocr":
+        try:
+            _get_tesseract_api()
+            return
+        except Exception as e:
+            # An initializer error would break the whole pool; recognize with pytesseract instead
+            _log.warning("tesserocr could not be initialized, falling back to pytesseract: %s", e)
+    import pytesseract  # noqa: F401
+
+
+def _worker_ready() -> bool:
+    return True
+
+
+def _load_image(source: ImageSource, min_side: Optional[int] = None) -> "Image.Image":
+    from PIL import Image
+    image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source)
+    if min_side and image.format == "JPEG":
+        # Let the JPEG decoder skip detail we are going to throw away anyway
+        scale = min_side / min(image.size)
+        if scale < 1:
+            image.draft("L", (int(image.width * scale), int(image.height * scale)))
+    return image
+
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    background_count, background_sum = 0, 0
+    best_threshold, best_variance = 127, 0.0
+    for level, count in enumerate(histogram):
+        background_count += count
+        if background_count == 0:
+            continue
+        foreground_count = total - background_count
+        if foreground_count == 0:
+            break
+        background_sum += level * count
+        background_mean = background_sum / background_count
+        foreground_mean = (weighted_total - background_sum) / foreground_count
+        variance = background_count * foreground_count * (background_mean - foreground_mean) ** 2
+        if variance > best_variance:
+            best_variance, best_threshold = variance, level
+    return best_threshold
+
+
+def _document_bbox(binary: "Image.Image", margin: int) -> Optional[Tuple[int, int, int, int]]:
+    from PIL import ImageFilter
+    # Paper is the bright region; find it on a small, denoised copy so specks don't count
+    factor = 8
+    small = binary.resize((max(1, binary.width // factor), max(1, binary.height // factor)))
+    bbox = small.filter(ImageFilter.MedianFilter(5)).getbbox()
+    if bbox is None:
+        return None
+    left, top, right, bottom = (value * factor for value in bbox)
+    return (
+        max(0, left - margin),
+        max(0, top - margin),
+        min(binary.width, right + margin),
+        min(binary.height, bottom + margin),
+    )
+
+
+def preprocess_image(
+    image: "Image.Image",
+    target_dpi: int = 300,
+    document_width_inches: float = 4.0,
+    binarize: bool = True,
+    crop: bool = True,
+) -> "Image.Image":
+    """
+    Prepare a receipt photo for Tesseract: EXIF-rotate, grayscale, downscale so the
+    document's short side is about target_dpi * document_width_inches pixels,
+    binarize with Otsu's threshold and crop to the paper region.
+    """
+    from PIL import Image, ImageOps
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L")
+    max_short_side = int(target_dpi * document_width_inches)
+    short_side = min(image.size)
+    if short_side > max_short_side:
+        scale = max_short_side / short_side
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+    if binarize:
+        threshold = _otsu_threshold(image.histogram())
+        image = image.point([0 if level <= threshold else 255 for level in range(256)])
+        if crop:
+            bbox = _document_bbox(image, margin=target_dpi // 10)
+            if bbox is not None:
+                image = image.crop(bbox)
+    return image
+
+
+def _recognize(image: "Image.Image", backend: str, dpi: Optional[int]) -> str:
+    if backend == "tesserocr":
+        try:
+            api = _get_tesseract_api()
+            if dpi:
+                api.SetVariable("user_defined_dpi", str(dpi))
+            api.SetImage(image)
+            return api.GetUTF8Text()
+        except Exception as e:
+            _log.warning("tesserocr failed, falling back to pytesseract: %s", e)
+    import pytesseract
+    return pytesseract.image_to_string(image, config=f"--dpi {dpi}" if dpi else "")
+
+
+def run_ocr(source: ImageSource, options: Dict[str, Any]) -> str:
+    """
+    Recognize text in an image. Runs inside the OCR worker processes.
+    """
+    backend = options.get("backend", "pytesseract")
+    if not options.get("preprocess"):
+        return _recognize(_load_image(source), backend, dpi=None)
+    min_side = int(options["target_dpi"] * options["document_width_inches"])
+    image = preprocess_image(
+        _load_image(source, min_side=min_side),
+        target_dpi=options["target_dpi"],
+        document_width_inches=options["document_width_inches"],
+        binarize=options.get("binarize", True),
+        crop=options.get("crop", True),
+    )
+    return _recognize(image, backend, dpi=options["target_dpi"])
+
+
+class OCREngine:
+    """
+    Runs Tesseract in a pool of worker processes so OCR does not hold the
+    request thread's core, optionally preprocessing images first.
+    A pool_size of 0 (or running inside a daemonic worker process, which cannot
+    have children) runs OCR inline.
+    The "pytesseract" backend runs the tesseract binary per image; "tesserocr" keeps
+    one initialized Tesseract API per worker and feeds it in-memory images, falling back
+    to pytesseract when the API cannot be initialized or fails on an image.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 2,
+        backend: str = "pytesseract",
+        preprocess: bool = True,
+        target_dpi: int = 300,
+        document_width_inches: float = 4.0,
+        binarize: bool = True,
+        crop: bool = True,
+    ):
+        if backend not in OCR_BACKENDS:
+            raise ValueError(f"Unsupported OCR backend: {backend}")
+        self.pool_size = pool_size
+        self.backend = backend
+        self.options = {
+            "backend": backend,
+            "preprocess": preprocess,
+            "target_dpi": target_dpi,
+            "document_width_inches": document_width_inches,
+            "binarize": binarize,
+            "crop": crop,
+        }
+        self.inline = pool_size < 1 or multiprocessing.current_process().daemon
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: forking a process that already runs threads can deadlock the child
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.pool_size,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.backend,),
+                    )
+        return self._executor
+
+    def _discard_executor(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            # Another thread may already have replaced the broken pool
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, submit: Callable[[ProcessPoolExecutor], List[Any]]) -> List[Any]:
+        """
+        Submit work to the pool and wait for the results. A dead worker (OOM kill, Tesseract crash,
+        failed initializer) breaks the whole pool, so it is replaced and the work retried once.
+        """
+        executor = self._get_executor()
+        try:
+            return [future.result() for future in submit(executor)]
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+        return [future.result() for future in submit(self._get_executor())]
+
+    def warm_up(self) -> None:
+        """Spawn the worker processes now, so the first image does not wait for them."""
+        if self.inline:
+            return
+        self._run(lambda executor: [executor.submit(_worker_ready) for _ in range(self.pool_size)])
+
+    def image_to_string(self, source: ImageSource) -> str:
+        """Recognize text in an image given as a file path or encoded bytes."""
+        if self.inline:
+            return run_ocr(source, self.options)
+        if isinstance(source, memoryview):
+            source = source.tobytes()
+        return self._run(lambda executor: [executor.submit(run_ocr, source, self.options)])[0]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
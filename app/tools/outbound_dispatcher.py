@@ -0,0 +1,280 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+import httpx
+
+from config import settings
+from logger import log
+from metrics import OUTBOUND_MESSAGES, OUTBOUND_RETRIES
+from model.whatsapp_model import DeliveryOutcome
+from tools.http_clients import AsyncCountingTransport, http_clients
+
+# Graph API error codes for throttling and temporary failures, sent with HTTP 400
+# (4: app request limit, 80007: WABA rate limit, 130429: throughput limit, 131056: pair rate limit)
+RETRYABLE_GRAPH_ERRORS = {4, 80007, 130429, 131056}
+
+
+class OutboundQueueFullError(Exception):
+    """Raised when a reply cannot be queued because the outbound queue is at capacity."""
+
+
+class TokenBucket:
+    """
+    Token bucket for the event loop: rate tokens per second, up to capacity banked for bursts.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class OutboundDispatcher:
+    """
+    Sends replies to the Graph API from a background event loop, so message handling does not
+    wait for them. Replies go through a bounded queue to concurrency sender tasks sharing one
+    keep-alive HTTP client, paced by a token bucket matched to the number's throughput limit.
+    429s, 5xx, transport errors and Meta's throttling error codes are retried with jittered
+    exponential backoff (or the Retry-After the API asks for); the final outcome of every reply
+    is passed to on_result. The rate applies per process.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        headers: Dict[str, str],
+        rate: float = 80.0,
+        burst: float = 20.0,
+        concurrency: int = 8,
+        max_attempts: int = 5,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        max_queue_size: int = 10000,
+        on_result: Optional[Callable[[DeliveryOutcome], None]] = None,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.url = url
+        self.headers = headers
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_queue_size = max_queue_size
+        self.on_result = on_result
+        self.in_flight = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._bucket: Optional[TokenBucket] = None
+        self._workers = []
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        # The loop thread does not survive fork; a forked worker starts its own
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(target=loop.run_forever, name="loris-outbound", daemon=True)
+                    self._thread.start()
+                    asyncio.run_coroutine_threadsafe(self._start_workers(), loop).result()
+                    self._loop = loop
+                    self._pid = os.getpid()
+                    log.info("Outbound dispatcher started", rate=self.rate, burst=self.burst,
+                             concurrency=self.concurrency)
+        return self._loop
+
+    async def _start_workers(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._bucket = TokenBucket(self.rate, self.burst)
+        # One client for every sender task: replies reuse its keep-alive connections
+        self._client = httpx.AsyncClient(
+            transport=AsyncCountingTransport("graph", limits=http_clients.limits), timeout=http_clients.timeout)
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+
+    def submit(self, message_id: str, recipient: str, payload: str) -> "Future[DeliveryOutcome]":
+        """
+        Queue a reply from any thread. Returns a Future resolved with its DeliveryOutcome once it
+        is sent or has failed for good. Raises OutboundQueueFullError when the queue is full.
+        """
+        loop = self._ensure_started()
+        outcome: "Future[DeliveryOutcome]" = Future()
+        asyncio.run_coroutine_threadsafe(self._enqueue((message_id, recipient, payload, time.monotonic(), outcome)),
+                                         loop).result()
+        return outcome
+
+    async def _enqueue(self, item: tuple) -> None:
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            raise OutboundQueueFullError(f"Outbound queue is full ({self.max_queue_size} replies)")
+
+    async def _work(self) -> None:
+        while True:
+            message_id, recipient, payload, submitted, done = await self._queue.get()
+            self.in_flight += 1
+            try:
+                outcome = await self._deliver(message_id, recipient, payload, submitted)
+                OUTBOUND_MESSAGES.labels(outcome.status).inc()
+                if self.on_result is not None:
+                    # Outcome recording may touch disk; keep it off the loop
+                    await asyncio.get_running_loop().run_in_executor(None, self._notify, outcome)
+                done.set_result(outcome)
+            except asyncio.CancelledError:
+                done.set_exception(RuntimeError("Outbound dispatcher closed"))
+                raise
+            except Exception as e:
+                log.error(e, "Outbound dispatcher error", message_id=message_id)
+                done.set_exception(e)
+            finally:
+                self.in_flight -= 1
+                self._queue.task_done()
+
+    def _notify(self, outcome: DeliveryOutcome) -> None:
+        try:
+            self.on_result(outcome)
+        except Exception as e:
+            log.error(e, "Error recording reply outcome", message_id=outcome.message_id)
+
+    @staticmethod
+    def _retry_reason(response: httpx.Response) -> Optional[str]:
+        """Why a failed response is worth retrying, or None if it is not."""
+        if response.status_code == 429:
+            return "429"
+        if response.status_code >= 500:
+            return "5xx"
+        try:
+            code = response.json().get("error", {}).get("code")
+        except ValueError:
+            return None
+        return "throttled" if code in RETRYABLE_GRAPH_ERRORS else None
+
+    def _backoff(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        # Exponential with equal jitter: half fixed, half random, so retries of a burst spread out
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _deliver(self, message_id: str, recipient: str, payload: str, submitted: float) -> DeliveryOutcome:
+        status_code, error = None, None
+        for attempt in range(1, self.max_attempts + 1):
+            await self._bucket.acquire()
+            retry_after = None
+            try:
+                response = await self._client.post(self.url, headers=self.headers, content=payload)
+            except httpx.TransportError as e:
+                status_code, error, reason = None, f"{e.__class__.__name__}: {e}", "transport"
+            else:
+                status_code = response.status_code
+                if status_code == 200:
+                    reply_ids = [sent.get("id") for sent in response.json().get("messages") or ()]
+                    log.info("Reply sent", message_id=message_id, attempts=attempt)
+                    return DeliveryOutcome(message_id=message_id, recipient=recipient, status="sent", attempts=attempt,
+                                           reply_id=reply_ids[0] if reply_ids else None, status_code=status_code,
+                                           latency=time.monotonic() - submitted)
+                error = response.text[:500]
+                reason = self._retry_reason(response)
+                retry_after = response.headers.get("Retry-After")
+                if reason is None:
+                    break
+            if attempt < self.max_attempts:
+                OUTBOUND_RETRIES.labels(reason).inc()
+                delay = self._backoff(attempt, retry_after)
+                log.warning("Reply send failed, retrying", message_id=message_id, attempt=attempt,
+                            reason=reason, status_code=status_code, retry_in=round(delay, 3))
+                await asyncio.sleep(delay)
+        log.error("Reply could not be sent", message_id=message_id, status_code=status_code, details=error)
+        return DeliveryOutcome(message_id=message_id, recipient=recipient, status="failed", attempts=attempt,
+                               status_code=status_code, error=error, latency=time.monotonic() - submitted)
+
+    def flush(self, timeout: float) -> bool:
+        """Wait up to timeout seconds for every queued reply to be sent or given up on."""
+        with self._lock:
+            loop = self._loop if self._pid == os.getpid() else None
+        if loop is None:
+            return True
+        try:
+            asyncio.run_coroutine_threadsafe(asyncio.wait_for(self._queue.join(), timeout=timeout), loop).result()
+            return True
+        except asyncio.TimeoutError:
+            log.warning("Timed out waiting for replies to be sent", pending=self.qsize() + self.in_flight)
+            return False
+
+    def qsize(self) -> int:
+        """Number of replies waiting for a sender task."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def collect_metrics(self):
+        """Scrape-time outbound queue depth and replies being sent."""
+        yield ("loris_outbound_queue_depth", "gauge", "Replies waiting to be sent", [({}, self.qsize())])
+        yield ("loris_outbound_in_flight", "gauge", "Replies being sent or retried", [({}, self.in_flight)])
+
+    async def _drain(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            log.warning("Outbound drain timed out, dropping pending replies", pending=self._queue.qsize())
+            while not self._queue.empty():
+                self._queue.get_nowait()[-1].set_exception(RuntimeError("Outbound dispatcher closed"))
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        await self._client.aclose()
+
+    def close(self, drain_timeout: float = 30.0) -> None:
+        """Wait up to drain_timeout seconds for queued replies, then stop the loop."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+            if loop is None or self._pid != os.getpid():
+                return
+            asyncio.run_coroutine_threadsafe(self._drain(drain_timeout), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            self._thread.join(timeout=5)
+            loop.close()
+        log.info("Outbound dispatcher stopped")
+
+
+def build_outbound_dispatcher(url: str, headers: Dict[str, str],
+                              on_result: Optional[Callable[[DeliveryOutcome], None]] = None) -> OutboundDispatcher:
+    """Build the reply dispatcher with the outbound settings."""
+    return OutboundDispatcher(
+        url=url,
+        headers=headers,
+        rate=settings.outbound_rate_per_second,
+        burst=settings.outbound_burst,
+        concurrency=settings.outbound_concurrency,
+        max_attempts=settings.outbound_max_attempts,
+        backoff_base=settings.outbound_backoff_base,
+        backoff_max=settings.outbound_backoff_max,
+        max_queue_size=settings.outbound_queue_max_size,
+        on_result=on_result,
+    )
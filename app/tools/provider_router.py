@@ -0,0 +1,249 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from logger import log
+from metrics import PROVIDER_CALL_SECONDS
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for cooldown seconds.
+    After the cooldown a single trial call is let through (half-open); its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._trial_in_progress = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+                self._trial_in_progress = False
+            if self.state == HALF_OPEN and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self) -> bool:
+        """Record a failure. Returns True if this failure opened the circuit."""
+        with self._lock:
+            self.consecutive_failures += 1
+            self._trial_in_progress = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.consecutive_failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class ProviderStats:
+    """
+    Rolling latency and error-rate window for one provider.
+    """
+
+    def __init__(self, window: int = 100):
+        self._latencies = deque(maxlen=window)
+        self._outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, success: bool) -> None:
+        with self._lock:
+            if success:
+                self._latencies.append(latency)
+            self._outcomes.append(success)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        with self._lock:
+            if not self._latencies:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+    def error_rate(self) -> float:
+        with self._lock:
+            if not self._outcomes:
+                return 0.0
+            return self._outcomes.count(False) / len(self._outcomes)
+
+    def samples(self) -> int:
+        return len(self._latencies)
+
+
+class ProviderRouter:
+    """
+    Routes calls across LLM providers using rolling latency and error rate, with a circuit
+    breaker per provider. Providers are tried in preference order (healthiest and fastest first),
+    falling back to the next on failure. With hedging enabled, if the first provider has not
+    answered within its hedge_percentile latency, the next one is called too and the first
+    successful answer wins.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        providers: List[str],
+        window: int = 100,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+        min_samples: int = 10,
+    ):
+        if not providers:
+            raise ValueError("At least one provider is required")
+        self.name = name
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.min_samples = min_samples
+        self.stats = {provider: ProviderStats(window) for provider in self.providers}
+        self.breakers = {provider: CircuitBreaker(failure_threshold, cooldown) for provider in self.providers}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _score(self, provider: str) -> Optional[float]:
+        stats = self.stats[provider]
+        if stats.samples() < self.min_samples:
+            return None
+        # Median latency, inflated by the error rate: a fast provider that fails half the time is not fast
+        return stats.percentile(0.5) / max(1.0 - stats.error_rate(), 0.05)
+
+    def _is_available(self, provider: str) -> bool:
+        breaker = self.breakers[provider]
+        return breaker.state != OPEN or time.monotonic() - breaker.opened_at >= breaker.cooldown
+
+    def order(self) -> List[str]:
+        """Providers in the order they should be tried; providers with an open circuit are left out."""
+        available = [provider for provider in self.providers if self._is_available(provider)]
+        if not available:
+            return []
+        scores = {provider: self._score(provider) for provider in available}
+        if all(score is not None for score in scores.values()):
+            available.sort(key=lambda provider: scores[provider])
+        return available
+
+    def _run(self, provider: str, fn: Callable[[str], T], bypass_breaker: bool = False) -> T:
+        if not bypass_breaker and not self.breakers[provider].allow():
+            raise RuntimeError(f"Circuit open for provider {provider}")
+        start = time.perf_counter()
+        try:
+            result = fn(provider)
+        except Exception:
+            latency = time.perf_counter() - start
+            self.stats[provider].record(latency, success=False)
+            PROVIDER_CALL_SECONDS.labels(self.name, provider, "error").observe(latency)
+            if self.breakers[provider].record_failure():
+                log.warning("Circuit breaker opened", router=self.name, provider=provider,
+                            cooldown=self.breakers[provider].cooldown)
+            raise
+        latency = time.perf_counter() - start
+        self.stats[provider].record(latency, success=True)
+        PROVIDER_CALL_SECONDS.labels(self.name, provider, "success").observe(latency)
+        self.breakers[provider].record_success()
+        return result
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(thread_name_prefix=f"loris-hedge-{self.name}")
+        return self._executor
+
+    def _hedge_delay(self, provider: str) -> Optional[float]:
+        stats = self.stats[provider]
+        if stats.samples() < self.hedge_min_samples:
+            return None
+        return stats.percentile(self.hedge_percentile)
+
+    def _call_hedged(self, primary: str, secondary: str, fn: Callable[[str], T]) -> T:
+        executor = self._get_executor()
+        primary_future = executor.submit(self._run, primary, fn)
+        try:
+            return primary_future.result(timeout=self._hedge_delay(primary))
+        except FutureTimeoutError:
+            log.info("Primary provider slow, sending hedged request", router=self.name,
+                     primary=primary, secondary=secondary)
+            futures = [primary_future, executor.submit(self._run, secondary, fn)]
+        except Exception as e:
+            log.warning(f"{primary.capitalize()} call failed, trying fallback if available",
+                        router=self.name, error=str(e))
+            return self._run(secondary, fn)
+        # Take whichever answers first; the slower call keeps running and still feeds the stats
+        last_exception: Optional[Exception] = None
+        for future in as_completed(futures):
+            try:
+                return future.result()
+            except Exception as e:
+                last_exception = e
+        raise last_exception
+
+    def call(self, fn: Callable[[str], T]) -> T:
+        """
+        Call fn(provider) on the best provider, falling back (or hedging) to the others.
+        Raises the last provider error if every provider fails.
+        """
+        ordered = self.order()
+        bypass_breaker = not ordered
+        if bypass_breaker:
+            # Every circuit is open: keep trying in preference order rather than failing without a call
+            log.warning("All provider circuits open", router=self.name)
+            ordered = list(self.providers)
+        last_exception: Optional[Exception] = None
+        start_index = 0
+        if self.hedge and not bypass_breaker and len(ordered) > 1 and self._hedge_delay(ordered[0]) is not None:
+            try:
+                return self._call_hedged(ordered[0], ordered[1], fn)
+            except Exception as e:
+                last_exception = e
+                start_index = 2
+        for provider in ordered[start_index:]:
+            try:
+                return self._run(provider, fn, bypass_breaker=bypass_breaker)
+            except Exception as e:
+                log.warning(f"{provider.capitalize()} call failed, trying fallback if available",
+                            router=self.name, error=str(e))
+                last_exception = e
+        raise last_exception
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-provider latency, error rate and circuit state."""
+        return {
+            provider: {
+                "p50_latency": self.stats[provider].percentile(0.5),
+                "p95_latency": self.stats[provider].percentile(0.95),
+                "error_rate": self.stats[provider].error_rate(),
+                "circuit": self.breakers[provider].state,
+            }
+            for provider in self.providers
+        }
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
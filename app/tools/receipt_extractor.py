@@ -0,0 +1,245 @@
+import re
+import threading
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+from model.output_models import FastPathExtraction, PurchaseInfo
+from logger import log
+
+# OCR output is cleaned to printable ASCII, so accented letters are dropped
+# ("Crédito" -> "Crdito", "Cartão" -> "Carto"); patterns make them optional.
+
+AMOUNT_PATTERN = r"(\d{1,3}(?:\.\d{3})*,\d{2}|\d+,\d{2})"
+CURRENCY_AMOUNT_RE = re.compile(r"R\s?\$\s*" + AMOUNT_PATTERN)
+TOTAL_LINE_RE = re.compile(r"(?i)^(?:valor\s*total|total|valor(?::\s*)?(?:pago|da\s+compra|do\s+pagamento)?)\b[^\d]*" + AMOUNT_PATTERN)
+IGNORED_AMOUNT_LINE_RE = re.compile(r"(?i)\b(?:troco|desconto|subtotal|tarifa|saldo|limite)\b")
+
+NUMERIC_DATE_RE = re.compile(r"\b(\d{2})[/.-](\d{2})[/.-](\d{4}|\d{2})\b")
+TEXT_DATE_RE = re.compile(
+    r"(?i)\b(\d{1,2})\s+(?:de\s+)?(jan|fev|mar|abr|mai|jun|jul|ago|set|out|nov|dez)[a-z]*\.?\s+(?:de\s+)?(\d{4})\b"
+)
+DATE_LABEL_RE = re.compile(r"(?i)^(?:data|emiss?o|emitido em)\b")
+MONTHS = {"jan": 1, "fev": 2, "mar": 3, "abr": 4, "mai": 5, "jun": 6,
+          "jul": 7, "ago": 8, "set": 9, "out": 10, "nov": 11, "dez": 12}
+
+PAYMENT_METHODS: List[Tuple[re.Pattern, str, float]] = [
+    (re.compile(r"(?i)\bpix\b"), "PIX", 0.95),
+    (re.compile(r"(?i)\bcr[e]?dito\b"), "Credit Card", 0.9),
+    (re.compile(r"(?i)\bd[e]?bito\b"), "Debit Card", 0.9),
+    (re.compile(r"(?i)\b(?:dinheiro|especie)\b"), "Cash", 0.85),
+    (re.compile(r"(?i)\bboleto\b"), "Boleto", 0.9),
+]
+
+# Known merchant headers: pattern, canonical name, category
+KNOWN_MERCHANTS: List[Tuple[re.Pattern, str, str]] = [
+    (re.compile(r"(?i)\bifood\b"), "iFood", "food"),
+    (re.compile(r"(?i)\buber\s*eats\b"), "Uber Eats", "food"),
+    (re.compile(r"(?i)\buber\b"), "Uber", "transport"),
+    (re.compile(r"(?i)\b99\s*(?:app|pop|taxi)\b"), "99", "transport"),
+    (re.compile(r"(?i)\bmercado\s*livre\b"), "Mercado Livre", "shopping"),
+    (re.compile(r"(?i)\bamazon\b"), "Amazon", "shopping"),
+    (re.compile(r"(?i)\bcarrefour\b"), "Carrefour", "groceries"),
+    (re.compile(r"(?i)\bp[a]?o\s+de\s+a[c]?[u]?car\b"), "Pao de Acucar", "groceries"),
+    (re.compile(r"(?i)\bassa[i]\b"), "Assai", "groceries"),
+    (re.compile(r"(?i)\batacad[a]?o\b"), "Atacadao", "groceries"),
+    (re.compile(r"(?i)\bdrogasil\b"), "Drogasil", "health"),
+    (re.compile(r"(?i)\bdroga\s*raia\b"), "Droga Raia", "health"),
+    (re.compile(r"(?i)\bmc\s*donald'?s\b"), "McDonald's", "food"),
+    (re.compile(r"(?i)\bshell\b"), "Shell", "fuel"),
+    (re.compile(r"(?i)\bpetrobras\b|\bposto\s+br\b"), "Petrobras", "fuel"),
+]
+
+CATEGORY_KEYWORDS: List[Tuple[re.Pattern, str]] = [
+    (re.compile(r"(?i)\b(?:supermercado|mercado|hortifruti|atacad)"), "groceries"),
+    (re.compile(r"(?i)\b(?:farm[a]?cia|drogaria)"), "health"),
+    (re.compile(r"(?i)\b(?:posto|combust[i]?vel|gasolina|etanol)"), "fuel"),
+    (re.compile(r"(?i)\b(?:restaurante|lanchonete|padaria|pizzaria|bar)\b"), "food"),
+    (re.compile(r"(?i)\b(?:energia|eletricidade|saneamento|internet|telefonia)\b"), "utilities"),
+]
+
+RECIPIENT_LABEL_RE = re.compile(
+    r"(?i)^(?:para|destino|recebedor|favorecido|benefici[a]?rio|nome do recebedor|estabelecimento|loja)\b\s*:?\s*(.*)$"
+)
+NAME_LABEL_RE = re.compile(r"(?i)^nome\b\s*:?\s*(.*)$")
+CNPJ_RE = re.compile(r"(?i)\bcnpj\b|\b\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\b")
+HEADER_NOISE_RE = re.compile(
+    r"(?i)\b(?:comprovante|transfer[e]?ncia|pagamento|recibo|cupom|fiscal|cnpj|cpf|data|hora|valor|total|via)\b"
+)
+
+REQUIRED_FIELDS = ("store_name", "amount", "date", "payment_method")
+
+
+def parse_brl_amount(value: str) -> float:
+    """Parse a BRL formatted amount ("1.234,56") into a float."""
+    return float(value.replace(".", "").replace(",", "."))
+
+
+class ReceiptFastPathExtractor:
+    """
+    Rule-based extractor for the regular layouts of Brazilian PIX and card receipts.
+    Works on OCR text already cleaned by OCRTools and returns a PurchaseInfo with a confidence
+    per field, so the LLM is only needed when the rules are not sure.
+    Keeps hit/miss counters for the fast-path hit rate.
+    """
+
+    def __init__(self, confidence_threshold: float = 0.8):
+        self.confidence_threshold = confidence_threshold
+        self.attempts = 0
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _extract_amount(lines: List[str]) -> Tuple[Optional[float], float]:
+        labelled = []
+        for line in lines:
+            if IGNORED_AMOUNT_LINE_RE.search(line):
+                continue
+            match = TOTAL_LINE_RE.search(line)
+            if match:
+                labelled.append(parse_brl_amount(match.group(1)))
+        if labelled:
+            # Receipts repeat the total (e.g. "Total" and "Valor pago"); disagreement lowers confidence
+            return labelled[-1], 0.95 if len(set(labelled)) == 1 else 0.6
+        amounts = [parse_brl_amount(value) for line in lines if not IGNORED_AMOUNT_LINE_RE.search(line)
+                   for value in CURRENCY_AMOUNT_RE.findall(line)]
+        if len(set(amounts)) == 1:
+            return amounts[0], 0.85
+        if amounts:
+            return max(amounts), 0.4
+        return None, 0.0
+
+    @staticmethod
+    def _to_iso_date(day: int, month: int, year: int) -> Optional[str]:
+        if year < 100:
+            year += 2000
+        try:
+            return date(year, month, day).isoformat()
+        except ValueError:
+            return None
+
+    def _extract_date(self, lines: List[str]) -> Tuple[Optional[str], float]:
+        found = []
+        for line in lines:
+            labelled = bool(DATE_LABEL_RE.search(line))
+            for day, month, year in NUMERIC_DATE_RE.findall(line):
+                iso = self._to_iso_date(int(day), int(month), int(year))
+                if iso:
+                    found.append((iso, labelled))
+            for day, month, year in TEXT_DATE_RE.findall(line):
+                iso = self._to_iso_date(int(day), MONTHS[month.lower()[:3]], int(year))
+                if iso:
+                    found.append((iso, labelled))
+        if not found:
+            return None, 0.0
+        for iso, labelled in found:
+            if labelled:
+                return iso, 0.95
+        return found[0][0], 0.85 if len({iso for iso, _ in found}) == 1 else 0.6
+
+    @staticmethod
+    def _extract_payment_method(text: str) -> Tuple[Optional[str], float]:
+        for pattern, method, confidence in PAYMENT_METHODS:
+            if pattern.search(text):
+                return method, confidence
+        return None, 0.0
+
+    @staticmethod
+    def _extract_store(lines: List[str]) -> Tuple[Optional[str], float, Optional[str]]:
+        for line in lines[:15]:
+            for pattern, name, category in KNOWN_MERCHANTS:
+                if pattern.search(line):
+                    return name, 0.95, category
+        # PIX receipts: the recipient name follows a "Destino"/"Para" label, possibly under a "Nome" line
+        for index, line in enumerate(lines):
+            match = RECIPIENT_LABEL_RE.match(line)
+            if not match:
+                continue
+            candidates = [match.group(1)] + lines[index + 1:index + 3]
+            for candidate in candidates:
+                name_match = NAME_LABEL_RE.match(candidate)
+                if name_match:
+                    candidate = name_match.group(1)
+                candidate = candidate.strip(" :-")
+                if len(candidate) > 2 and re.search(r"[A-Za-z]{3}", candidate) and not HEADER_NOISE_RE.search(candidate):
+                    return candidate, 0.85, None
+        # Card receipts: the merchant header is usually the first text line, followed by its CNPJ
+        for index, line in enumerate(lines[:5]):
+            if re.search(r"[A-Za-z]{3}", line) and not HEADER_NOISE_RE.search(line) and not re.search(r"\d{3}", line):
+                has_cnpj = any(CNPJ_RE.search(following) for following in lines[index + 1:index + 3])
+                return line.strip(), 0.85 if has_cnpj else 0.5, None
+        return None, 0.0, None
+
+    @staticmethod
+    def _extract_category(text: str) -> Tuple[Optional[str], float]:
+        for pattern, category in CATEGORY_KEYWORDS:
+            if pattern.search(text):
+                return category, 0.7
+        return None, 0.0
+
+    def extract(self, text: str) -> FastPathExtraction:
+        """
+        Extract purchase information from cleaned OCR text.
+        """
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        amount, amount_confidence = self._extract_amount(lines)
+        iso_date, date_confidence = self._extract_date(lines)
+        payment_method, payment_confidence = self._extract_payment_method(text)
+        store_name, store_confidence, merchant_category = self._extract_store(lines)
+        if merchant_category:
+            category, category_confidence = merchant_category, 0.9
+        else:
+            category, category_confidence = self._extract_category(text)
+
+        info = PurchaseInfo()
+        if store_name:
+            info.store_name = store_name
+        if amount is not None:
+            info.amount = amount
+        if CURRENCY_AMOUNT_RE.search(text) or amount is not None:
+            info.currency = "R$"
+        if iso_date:
+            info.date = iso_date
+        if payment_method:
+            info.payment_method = payment_method
+        if category:
+            info.category = category
+
+        field_confidence = {
+            "store_name": store_confidence,
+            "amount": amount_confidence,
+            "date": date_confidence,
+            "payment_method": payment_confidence,
+            "category": category_confidence,
+        }
+        return FastPathExtraction(
+            purchase_info=info,
+            field_confidence=field_confidence,
+            confidence=min(field_confidence[field] for field in REQUIRED_FIELDS),
+        )
+
+    def try_extract(self, text: str) -> Optional[PurchaseInfo]:
+        """
+        Return the rule-based PurchaseInfo if it reaches the confidence threshold, otherwise None
+        (the caller falls back to the LLM). Updates the hit-rate counters.
+        """
+        try:
+            result = self.extract(text)
+        except Exception as e:
+            log.error(e, "Fast-path extraction failed")
+            result = None
+        hit = result is not None and result.confidence >= self.confidence_threshold
+        with self._lock:
+            self.attempts += 1
+            if hit:
+                self.hits += 1
+        log.info("Fast-path extraction", hit=hit,
+                 confidence=result.confidence if result else None,
+                 field_confidence=result.field_confidence if result else None)
+        return result.purchase_info if hit else None
+
+    def stats(self) -> Dict[str, float]:
+        """Fast-path attempts, hits and hit rate."""
+        with self._lock:
+            attempts, hits = self.attempts, self.hits
+        return {"attempts": attempts, "hits": hits, "misses": attempts - hits,
+                "hit_rate": hits / attempts if attempts else 0.0}
@@ -0,0 +1,278 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+from logger import log
+from model.whatsapp_model import StatusUpdate
+
+# Statuses that close the loop on a sent message; their latency is tracked
+LATENCY_STATUSES = ("delivered", "read")
+
+
+def _percentile(ordered: List[float], fraction: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class StatusTracker:
+    """
+    Compact in-memory record of delivery/read receipts.
+    Statuses are kept in a fixed-size ring buffer of tuples; the send time of our replies
+    (by WhatsApp message id) is kept in a bounded map so the delivery and read latency of
+    each reply can be computed when its status arrives.
+    Process-local: with a process worker pool, replies are sent from the workers, so use the
+    SQLite store to match them with statuses received by the web process.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        # (message_id, status, status_timestamp, recipient_id)
+        self._statuses: "deque[Tuple[str, str, int, str]]" = deque(maxlen=capacity)
+        self._sent: "OrderedDict[str, float]" = OrderedDict()
+        self._latencies: Dict[str, "deque[float]"] = {status: deque(maxlen=capacity) for status in LATENCY_STATUSES}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record_sent(self, message_id: str, sent_at: Optional[float] = None) -> None:
+        """Remember when a reply was sent, to measure its delivery latency."""
+        with self._lock:
+            self._sent[message_id] = sent_at if sent_at is not None else time.time()
+            while len(self._sent) > self.capacity:
+                self._sent.popitem(last=False)
+
+    def record(self, statuses: Iterable[StatusUpdate]) -> None:
+        """Record the statuses of a webhook."""
+        with self._lock:
+            for status in statuses:
+                timestamp = int(status.timestamp)
+                self._statuses.append((status.id, status.status, timestamp, status.recipient_id))
+                self._counts[status.status] = self._counts.get(status.status, 0) + 1
+                sent_at = self._sent.get(status.id)
+                if sent_at is not None and status.status in self._latencies:
+                    self._latencies[status.status].append(max(0.0, timestamp - sent_at))
+
+    def recent(self, limit: int = 100) -> List[Dict[str, object]]:
+        """The most recent statuses, newest first."""
+        with self._lock:
+            rows = list(self._statuses)[-limit:]
+        return [
+            {"message_id": message_id, "status": status, "timestamp": timestamp, "recipient_id": recipient_id}
+            for message_id, status, timestamp, recipient_id in reversed(rows)
+        ]
+
+    def _latency_samples(self) -> Dict[str, List[float]]:
+        with self._lock:
+            return {status: sorted(latencies) for status, latencies in self._latencies.items()}
+
+    def stats(self) -> Dict[str, object]:
+        """Status counts and delivery/read latency percentiles (seconds)."""
+        latencies = self._latency_samples()
+        with self._lock:
+            counts = dict(self._counts)
+        return {
+            "counts": counts,
+            "latency": {
+                status: {"samples": len(values), "p50": _percentile(values, 0.5), "p95": _percentile(values, 0.95)}
+                for status, values in latencies.items()
+            },
+        }
+
+    def collect_metrics(self):
+        """Scrape-time status counts and latency percentiles."""
+        stats = self.stats()
+        yield ("loris_message_statuses", "gauge", "Status updates received since start, by status",
+               [({"status": status}, count) for status, count in stats["counts"].items()])
+        samples = []
+        for status, latency in stats["latency"].items():
+            for quantile in ("p50", "p95"):
+                if latency[quantile] is not None:
+                    samples.append(({"status": status, "quantile": quantile}, latency[quantile]))
+        yield ("loris_reply_status_latency_seconds", "gauge", "Time from sending a reply to its delivery/read status",
+               samples)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteStatusStore(StatusTracker):
+    """
+    Status store backed by SQLite, shared by every process using the same file.
+    Rows are buffered in memory and written in batches by a background thread
+    (every flush_interval seconds or flush_batch_size rows), so recording a status
+    costs an append on the request path.
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 1.0, flush_batch_size: int = 500,
+                 latency_window: int = 10000):
+        super().__init__(capacity=latency_window)
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.flush_batch_size = flush_batch_size
+        self._pending_statuses: List[Tuple[str, str, int, str, float]] = []
+        self._pending_sent: List[Tuple[str, float]] = []
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._db_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not shared with forked worker processes
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS message_statuses ("
+                " message_id TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " timestamp INTEGER NOT NULL,"
+                " recipient_id TEXT NOT NULL,"
+                " received_at REAL NOT NULL,"
+                " PRIMARY KEY (message_id, status))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sent_messages ("
+                " message_id TEXT PRIMARY KEY,"
+                " sent_at REAL NOT NULL)"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or not self._flusher.is_alive():
+            with self._lock:
+                if self._flusher is None or not self._flusher.is_alive():
+                    self._stopped.clear()
+                    self._flusher = threading.Thread(target=self._run_flusher, name="loris-status-flush", daemon=True)
+                    self._flusher.start()
+
+    def record_sent(self, message_id: str, sent_at: Optional[float] = None) -> None:
+        self._ensure_flusher()
+        with self._lock:
+            self._pending_sent.append((message_id, sent_at if sent_at is not None else time.time()))
+            pending = len(self._pending_sent)
+        if pending >= self.flush_batch_size:
+            self._wakeup.set()
+
+    def record(self, statuses: Iterable[StatusUpdate]) -> None:
+        self._ensure_flusher()
+        now = time.time()
+        with self._lock:
+            for status in statuses:
+                self._pending_statuses.append(
+                    (status.id, status.status, int(status.timestamp), status.recipient_id, now))
+                self._counts[status.status] = self._counts.get(status.status, 0) + 1
+            pending = len(self._pending_statuses)
+        if pending >= self.flush_batch_size:
+            self._wakeup.set()
+
+    def _run_flusher(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows in one transaction per table."""
+        with self._lock:
+            statuses, self._pending_statuses = self._pending_statuses, []
+            sent, self._pending_sent = self._pending_sent, []
+        if not statuses and not sent:
+            return
+        with self._db_lock:
+            conn = self._connection()
+            try:
+                conn.execute("BEGIN")
+                if sent:
+                    conn.executemany("INSERT OR REPLACE INTO sent_messages (message_id, sent_at) VALUES (?, ?)", sent)
+                if statuses:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO message_statuses "
+                        "(message_id, status, timestamp, recipient_id, received_at) VALUES (?, ?, ?, ?, ?)",
+                        statuses,
+                    )
+                conn.execute("COMMIT")
+            except Exception as e:
+                log.error(e, "Error flushing message statuses", statuses=len(statuses), sent=len(sent))
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+
+    def recent(self, limit: int = 100) -> List[Dict[str, object]]:
+        self.flush()
+        with self._db_lock:
+            rows = self._connection().execute(
+                "SELECT message_id, status, timestamp, recipient_id FROM message_statuses "
+                "ORDER BY received_at DESC, rowid DESC LIMIT ?", (limit,)).fetchall()
+        return [
+            {"message_id": message_id, "status": status, "timestamp": timestamp, "recipient_id": recipient_id}
+            for message_id, status, timestamp, recipient_id in rows
+        ]
+
+    def _latency_samples(self) -> Dict[str, List[float]]:
+        # Latest statuses joined with the send time recorded by whichever process sent the reply
+        with self._db_lock:
+            conn = self._connection()
+            samples = {}
+            for status in LATENCY_STATUSES:
+                rows = conn.execute(
+                    "SELECT MAX(0, s.timestamp - m.sent_at) FROM message_statuses s "
+                    "JOIN sent_messages m ON m.message_id = s.message_id "
+                    "WHERE s.status = ? ORDER BY s.received_at DESC LIMIT ?",
+                    (status, self.capacity),
+                ).fetchall()
+                samples[status] = sorted(row[0] for row in rows)
+        return samples
+
+    def close(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+        self.flush()
+
+
+_tracker: Optional[StatusTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_status_tracker() -> Optional[StatusTracker]:
+    """
+    Get the process-wide status tracker selected by settings.status_tracking
+    ("off", "memory" or "sqlite"), or None when tracking is off.
+    """
+    global _tracker
+    if settings.status_tracking == "off":
+        return None
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                if settings.status_tracking == "sqlite":
+                    _tracker = SQLiteStatusStore(
+                        db_path=settings.status_db_path,
+                        flush_interval=settings.status_flush_interval,
+                        flush_batch_size=settings.status_flush_batch_size,
+                        latency_window=settings.status_buffer_size,
+                    )
+                else:
+                    _tracker = StatusTracker(capacity=settings.status_buffer_size)
+                log.info("Status tracking enabled", backend=settings.status_tracking)
+    return _tracker
+
+
+def _reset_tracker_after_fork() -> None:
+    # Buffers and the flusher thread belong to the parent; forked workers build their own
+    global _tracker, _tracker_lock
+    _tracker = None
+    _tracker_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_tracker_after_fork)
@@ -0,0 +1,143 @@
+import math
+import re
+import threading
+from typing import Dict, List
+
+from model.output_models import CompactedText
+from tools.receipt_extractor import (CNPJ_RE, CURRENCY_AMOUNT_RE, NUMERIC_DATE_RE, PAYMENT_METHODS,
+                                     RECIPIENT_LABEL_RE, TEXT_DATE_RE, TOTAL_LINE_RE)
+
+HEADER_LINES = 5
+GAP_MARKER = "[...]"
+
+TOTAL_KEYWORD_RE = re.compile(r"(?i)\b(?:total|valor\s+(?:pago|a\s+pagar|da\s+compra)|a\s+pagar)\b")
+PAYMENT_KEYWORD_RE = re.compile(r"(?i)\b(?:cart[a]?o|visa|master(?:card)?|elo|hipercard|amex|parcela|forma\s+de\s+pagamento)\b")
+DATE_KEYWORD_RE = re.compile(r"(?i)\b(?:data|emiss?o|emitido|hor[a]?rio)\b")
+
+# Relevance of a line for the fields we extract (store, total, date, payment method, category)
+TOTAL_SCORE = 10
+PAYMENT_SCORE = 8
+DATE_SCORE = 8
+RECIPIENT_SCORE = 7
+HEADER_SCORE = 6
+AMOUNT_SCORE = 1
+
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    """Rough token count (OpenAI/Llama tokenizers average about 4 characters per token)."""
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+class OCRTextCompactor:
+    """
+    Shrinks OCR text before it is sent to the LLM. Lines are ranked by how likely they are to carry
+    the store name, total, date or payment method (header, totals, date and payment keywords); item
+    lines rank lowest. The best lines are kept, in their original order, until the token budget is
+    used up. Text already under the budget is returned unchanged.
+    """
+
+    def __init__(self, token_budget: int = 600, chars_per_token: float = 4.0):
+        if token_budget < 1:
+            raise ValueError("token_budget must be at least 1")
+        self.token_budget = token_budget
+        self.chars_per_token = chars_per_token
+        self.messages = 0
+        self.compacted_messages = 0
+        self.original_tokens = 0
+        self.compacted_tokens = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _score_lines(lines: List[str]) -> List[int]:
+        scores = []
+        follows_label = 0
+        for index, line in enumerate(lines):
+            score = 0
+            if TOTAL_LINE_RE.search(line) or TOTAL_KEYWORD_RE.search(line):
+                score = max(score, TOTAL_SCORE)
+            if any(pattern.search(line) for pattern, _, _ in PAYMENT_METHODS) or PAYMENT_KEYWORD_RE.search(line):
+                score = max(score, PAYMENT_SCORE)
+            if NUMERIC_DATE_RE.search(line) or TEXT_DATE_RE.search(line) or DATE_KEYWORD_RE.search(line):
+                score = max(score, DATE_SCORE)
+            # PIX recipients: the label line and the two lines after it carry the name
+            if RECIPIENT_LABEL_RE.match(line):
+                score = max(score, RECIPIENT_SCORE)
+                follows_label = 2
+            elif follows_label:
+                score = max(score, RECIPIENT_SCORE)
+                follows_label -= 1
+            if index < HEADER_LINES or CNPJ_RE.search(line):
+                score = max(score, HEADER_SCORE)
+            if not score and CURRENCY_AMOUNT_RE.search(line):
+                score = AMOUNT_SCORE
+            scores.append(score)
+        return scores
+
+    @staticmethod
+    def _join(lines: List[str], selected: List[int]) -> str:
+        # Dropped runs of lines are replaced by a single marker so the model knows text was cut
+        parts, previous = [], -1
+        for index in selected:
+            if index != previous + 1:
+                parts.append(GAP_MARKER)
+            parts.append(lines[index])
+            previous = index
+        if previous != len(lines) - 1:
+            parts.append(GAP_MARKER)
+        return "\n".join(parts)
+
+    def _select(self, lines: List[str]) -> List[int]:
+        scores = self._score_lines(lines)
+        # Best lines first; among equals, earlier lines win (headers and totals come before item noise)
+        ranked = sorted(range(len(lines)), key=lambda index: (-scores[index], index))
+        selected, used = [], 0
+        for index in ranked:
+            cost = estimate_tokens(lines[index] + "\n", self.chars_per_token)
+            if used + cost > self.token_budget:
+                continue
+            selected.append(index)
+            used += cost
+        # Gap markers were not counted above; give back the least relevant lines until they fit
+        while selected and estimate_tokens(self._join(lines, sorted(selected)), self.chars_per_token) > self.token_budget:
+            selected.pop()
+        return sorted(selected)
+
+    def compact(self, text: str) -> CompactedText:
+        """
+        Trim text to the token budget, keeping the most relevant lines.
+        """
+        original_tokens = estimate_tokens(text, self.chars_per_token)
+        compacted = text
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        kept_lines = len(lines)
+        if original_tokens > self.token_budget:
+            selected = self._select(lines)
+            kept_lines = len(selected)
+            compacted = self._join(lines, selected)
+        result = CompactedText(
+            text=compacted,
+            original_chars=len(text),
+            compacted_chars=len(compacted),
+            original_tokens=original_tokens,
+            compacted_tokens=estimate_tokens(compacted, self.chars_per_token),
+            total_lines=len(lines),
+            kept_lines=kept_lines,
+        )
+        with self._lock:
+            self.messages += 1
+            self.original_tokens += result.original_tokens
+            self.compacted_tokens += result.compacted_tokens
+            if compacted is not text:
+                self.compacted_messages += 1
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        """Messages seen and compacted, and the estimated tokens before and after compaction."""
+        with self._lock:
+            return {
+                "messages": self.messages,
+                "compacted_messages": self.compacted_messages,
+                "original_tokens": self.original_tokens,
+                "compacted_tokens": self.compacted_tokens,
+                "reduction": 1 - self.compacted_tokens / self.original_tokens if self.original_tokens else 0.0,
+            }
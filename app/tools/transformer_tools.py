@@ -1,22 +1,61 @@
-import pytesseract
-import re, os
+import re, os, threading, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Union
 from datetime import datetime
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
-from langchain_groq import ChatGroq
-from openai import OpenAI
-from groq import Groq
 
 from config import settings
-from prompts.purchase_extractor import get_purchase_extractor_prompt, get_purchase_parser
+from prompts.purchase_extractor import (get_purchase_extractor_prompt, get_purchase_parser, get_prompt_version,
+                                       get_structured_system_prompt)
+from prompts.batch_purchase_extractor import get_batch_purchase_extractor_prompt, get_batch_purchase_parser, format_batch_texts
 from logger import log
+from tools.http_clients import http_clients
+from tools.ocr_engine import OCR_BACKENDS, OCREngine, tesserocr_available
+from tools.provider_router import ProviderRouter
+from tools.cache_tools import TieredCache, build_llm_extraction_cache
+from tools.llm_batcher import ExtractionMicroBatcher
+from model.output_models import PurchaseInfo, PurchaseInfoBatch
+
+# The provider SDKs (langchain_openai, langchain_groq, openai, groq) are imported when the first
+# client is created, not at import, so worker startup does not pay for them
+
+EXTRACTION_SYSTEM_PROMPT = "You are a helpful assistant that extracts purchase information from text."
+
+
+def _chat_messages(system_prompt: str, text: str) -> list:
+    from langchain_core.messages import SystemMessage, HumanMessage
+    return [SystemMessage(content=system_prompt), HumanMessage(content=text)]
 
 
 class OCRTools:
-    def __init__(self, processor="pytesseract"):
-        self.processor = processor
+    def __init__(self, processor="pytesseract", engine: OCREngine = None, save_text_files: bool = True):
+        """
+        processor picks the backend of the engine built here; a given engine keeps its own backend.
+        """
+        if engine is None:
+            if processor not in OCR_BACKENDS:
+                log.error(f"Unsupported OCR processor: {processor}")
+                raise ValueError(f"Unsupported OCR processor: {processor}")
+            if processor == "tesserocr" and not tesserocr_available():
+                log.warning("tesserocr is not installed, falling back to pytesseract")
+                processor = "pytesseract"
+            engine = OCREngine(
+                pool_size=settings.ocr_pool_size,
+                backend=processor,
+                preprocess=settings.ocr_preprocess,
+                target_dpi=settings.ocr_target_dpi,
+                document_width_inches=settings.ocr_document_width_inches,
+            )
+        self.engine = engine
+        # Off when the OCR text is kept in the message store
+        self.save_text_files = save_text_files
+        log.info("OCRTools initialized", processor=self.processor, ocr_pool_size=self.engine.pool_size)
+
+    @property
+    def processor(self) -> str:
+        """The OCR backend in use: the engine's, which is the only switch."""
+        return self.engine.backend
 
     def __process_ocr_output(self, ocr_text: str) -> str:
         # Remove non-printable characters, but keep punctuation and currency symbols
@@ -36,13 +75,13 @@ class OCRTools:
         cleaned_text = '\n'.join([line for line in cleaned_text.splitlines() if len(line) > 2])
         return cleaned_text.strip()
     
-    def __save_ocr_text_to_file(self, text: str, image_path: str) -> None:
+    def __save_ocr_text_to_file(self, text: str, file_name: str) -> None:
         
         # Create directory if it doesn't exist
         os.makedirs(settings.local_ocr_text_path, exist_ok=True)
         
-        # Generate file name based on image path
-        file_name = os.path.basename(image_path).replace('.jpeg', '.txt')
+        # Generate file name based on image file name
+        file_name = os.path.basename(file_name).replace('.jpeg', '.txt')
         file_path = os.path.join(settings.local_ocr_text_path, file_name)
         
         # Write text to file
@@ -51,20 +90,43 @@ class OCRTools:
         
         log.info("OCR text saved to file", file_path=file_path)
 
-    def __pytesseract_extract_text_with_ocr(self, image_path: str) -> str:
-        return self.__process_ocr_output(pytesseract.image_to_string(image_path))
+    def __extract_text_with_ocr(self, image: Union[str, bytes, memoryview]) -> str:
+        return self.__process_ocr_output(self.engine.image_to_string(image))
 
-    def extract_text_from_image_with_ocr(self, image_path: str) -> str:
-        if self.processor == "pytesseract":
-            ocr_text = self.__pytesseract_extract_text_with_ocr(image_path)
-        else:
-            log.error(f"Unsupported OCR processor: {self.processor}")
-            raise ValueError(f"Unsupported OCR processor: {self.processor}")
-        log.info("OCR text extracted", image_path=image_path, text_length=len(ocr_text))
-        self.__save_ocr_text_to_file(ocr_text, image_path)
+    def extract_text_from_image_with_ocr(self, image: Union[str, bytes, memoryview], file_name: Optional[str] = None) -> str:
+        """
+        Extract text from an image given as a file path or as in-memory encoded bytes.
+        file_name names the saved OCR text and is required for in-memory images.
+        """
+        if file_name is None:
+            if not isinstance(image, str):
+                raise ValueError("file_name is required for in-memory images")
+            file_name = image
+        ocr_text = self.__extract_text_with_ocr(image)
+        log.info("OCR text extracted", image=file_name, text_length=len(ocr_text))
+        if self.save_text_files:
+            self.__save_ocr_text_to_file(ocr_text, file_name)
         return ocr_text
 
+    def warm_up(self) -> None:
+        """Start the OCR worker processes ahead of the first image."""
+        self.engine.warm_up()
+
+    def close(self) -> None:
+        self.engine.shutdown()
+
         
+def fill_missing_date(purchase_info: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of an extracted purchase with an "Unknown" date set to the current timestamp.
+    Applied on every use of a result, never before it is cached.
+    """
+    if purchase_info.get("date") != "Unknown":
+        return purchase_info
+    log.warning("Date field is missing in the extracted information, using default value")
+    return {**purchase_info, "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+
+
 class LLMTools:
     def __init__(self, default_provider: str = "openai"):
         self.default_provider = default_provider.lower()
@@ -72,93 +134,351 @@ class LLMTools:
         self.openai_model = settings.open_ai_model
         self.groq_api_key = settings.groq_api_key
         self.groq_model = settings.groq_model
-        self.purchase_prompt = get_purchase_extractor_prompt()
-        self.purchase_parser = get_purchase_parser()
-        log.info("LLMTools initialized", default_provider=self.default_provider)
+        # "parser": format instructions in the prompt + PydanticOutputParser
+        # "structured": provider-native JSON schema / tool calling with a compact system prompt
+        self.extraction_mode = settings.llm_extraction_mode
+        self._structured_clients: Dict[Any, Any] = {}
+        self._token_usage: Dict[str, Dict[str, int]] = {}
+        self._usage_lock = threading.Lock()
+        self.extraction_cache: Optional[TieredCache] = build_llm_extraction_cache() if settings.llm_cache_enabled else None
+        # Clients are created once per provider and reuse the shared connection pools
+        self._chat_clients: Dict[str, Any] = {}
+        self._audio_clients: Dict[str, Any] = {}
+        self._clients_lock = threading.Lock()
+        # Routers track latency/errors per provider and skip providers whose circuit is open
+        providers = [self.default_provider, "groq" if self.default_provider == "openai" else "openai"]
+        self.chat_router = self._build_router("chat", providers)
+        self.audio_router = self._build_router("audio", providers)
+        # Optional micro-batching of concurrent extraction requests into one LLM call
+        self.batcher: Optional[ExtractionMicroBatcher] = None
+        if settings.llm_batch_enabled:
+            self.batcher = ExtractionMicroBatcher(
+                batch_fn=lambda texts: self.chat_router.call(
+                    lambda provider: self._get_text_info_batch_with_provider(provider, texts)),
+                single_fn=self._extract_single,
+                max_batch_size=settings.llm_batch_max_size,
+                max_wait_ms=settings.llm_batch_max_wait_ms,
+            )
+        # Voice notes are decoded, trimmed and chunked before transcription (numpy loads on first use)
+        self.audio_preprocessor = None
+        self._audio_executor: Optional[ThreadPoolExecutor] = None
+        log.info("LLMTools initialized", default_provider=self.default_provider,
+                 extraction_mode=self.extraction_mode, batching=self.batcher is not None)
+
+    @property
+    def purchase_prompt(self):
+        return get_purchase_extractor_prompt()
+
+    @property
+    def purchase_parser(self):
+        return get_purchase_parser()
+
+    @property
+    def batch_prompt(self):
+        return get_batch_purchase_extractor_prompt()
+
+    @property
+    def batch_parser(self):
+        return get_batch_purchase_parser()
+
+    @staticmethod
+    def _build_router(name: str, providers: list) -> ProviderRouter:
+        return ProviderRouter(
+            name=name,
+            providers=providers,
+            window=settings.llm_router_window,
+            failure_threshold=settings.llm_circuit_failure_threshold,
+            cooldown=settings.llm_circuit_cooldown,
+            hedge=settings.llm_hedge_enabled,
+            hedge_percentile=settings.llm_hedge_percentile,
+            hedge_min_samples=settings.llm_hedge_min_samples,
+        )
 
     def _get_client(self, provider: str):
+        client = self._chat_clients.get(provider)
+        if client is not None:
+            return client
+        with self._clients_lock:
+            if provider not in self._chat_clients:
+                if provider == "openai":
+                    from langchain_openai import ChatOpenAI
+                    client = ChatOpenAI(api_key=self.openai_api_key, model=self.openai_model, temperature=0.1,
+                                        base_url=settings.openai_base_url, http_client=http_clients.get("openai"))
+                elif provider == "groq":
+                    from langchain_groq import ChatGroq
+                    client = ChatGroq(api_key=self.groq_api_key, model=self.groq_model, temperature=0.1,
+                                      base_url=settings.groq_base_url, http_client=http_clients.get("groq"))
+                else:
+                    raise ValueError(f"Unsupported provider: {provider}")
+                self._chat_clients[provider] = client
+            return self._chat_clients[provider]
+
+    def _get_audio_client(self, provider: str):
+        client = self._audio_clients.get(provider)
+        if client is not None:
+            return client
+        with self._clients_lock:
+            if provider not in self._audio_clients:
+                if provider == "openai":
+                    from openai import OpenAI
+                    client = OpenAI(api_key=self.openai_api_key, base_url=settings.openai_base_url,
+                                    http_client=http_clients.get("openai"))
+                elif provider == "groq":
+                    from groq import Groq
+                    client = Groq(api_key=self.groq_api_key, base_url=settings.groq_base_url,
+                                  http_client=http_clients.get("groq"))
+                else:
+                    raise ValueError(f"Unsupported provider: {provider}")
+                self._audio_clients[provider] = client
+            return self._audio_clients[provider]
+
+    def _get_structured_client(self, provider: str, schema: type):
+        key = (provider, schema)
+        client = self._structured_clients.get(key)
+        if client is not None:
+            return client
+        # OpenAI enforces the JSON schema natively; Groq gets it as a tool definition
+        method = "json_schema" if provider == "openai" else "function_calling"
+        client = self._get_client(provider).with_structured_output(schema, method=method, include_raw=True)
+        with self._clients_lock:
+            self._structured_clients.setdefault(key, client)
+        return self._structured_clients[key]
+
+    def _record_token_usage(self, provider: str, message: Any) -> Dict[str, int]:
+        """
+        Accumulate prompt/completion token counts per extraction mode and provider.
+        """
+        usage = getattr(message, "usage_metadata", None) or {}
+        prompt_tokens = usage.get("input_tokens", 0)
+        completion_tokens = usage.get("output_tokens", 0)
+        key = f"{self.extraction_mode}:{provider}"
+        with self._usage_lock:
+            totals = self._token_usage.setdefault(key, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+
+    def token_usage_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Token totals and per-call averages, keyed by "<extraction mode>:<provider>".
+        """
+        with self._usage_lock:
+            return {
+                key: {
+                    **totals,
+                    "avg_prompt_tokens": totals["prompt_tokens"] / totals["calls"],
+                    "avg_completion_tokens": totals["completion_tokens"] / totals["calls"],
+                }
+                for key, totals in self._token_usage.items()
+            }
+
+    def _invoke_structured(self, provider: str, schema: type, system_prompt: str, text: str):
+        client = self._get_structured_client(provider, schema)
+        response = client.invoke(_chat_messages(system_prompt, text))
+        tokens = self._record_token_usage(provider, response["raw"])
+        if response["parsed"] is None:
+            raise ValueError(f"Structured output parsing failed: {response.get('parsing_error')}")
+        return response["parsed"], tokens
+
+    def _get_text_info_with_provider(self, provider: str, text: str) -> Dict[str, Any]:
+        model = self.openai_model if provider == "openai" else self.groq_model
+        if self.extraction_mode == "structured":
+            log.debug(f"Sending structured request to {provider.capitalize()}", model=model, text_length=len(text))
+            result, tokens = self._invoke_structured(provider, PurchaseInfo, get_structured_system_prompt(), text)
+        else:
+            # Prepare and send prompt to LLM
+            client = self._get_client(provider)
+            formatted_prompt = self.purchase_prompt.format(text=text)
+            log.debug(f"Sending request to {provider.capitalize()}", model=model, prompt_length=len(formatted_prompt))
+            response = client.invoke(_chat_messages(EXTRACTION_SYSTEM_PROMPT, formatted_prompt))
+            tokens = self._record_token_usage(provider, response)
+            result = self.purchase_parser.parse(response.content)
+        extracted_info = result.model_dump()
+        log.info(f"Successfully processed text with {provider.capitalize()}", extracted_info=extracted_info,
+                 extraction_mode=self.extraction_mode, **tokens)
+        return extracted_info
+
+    def _get_text_info_batch_with_provider(self, provider: str, texts: List[str]) -> List[Dict[str, Any]]:
+        if self.extraction_mode == "structured":
+            system_prompt = (get_structured_system_prompt() +
+                             f" The input has {len(texts)} numbered texts: return one item per text, in order.")
+            result, tokens = self._invoke_structured(provider, PurchaseInfoBatch, system_prompt, format_batch_texts(texts))
+        else:
+            # One prompt for several texts; the parser validates a list of PurchaseInfo
+            client = self._get_client(provider)
+            formatted_prompt = self.batch_prompt.format(count=len(texts), texts=format_batch_texts(texts))
+            log.debug(f"Sending batch request to {provider.capitalize()}", batch_size=len(texts), prompt_length=len(formatted_prompt))
+            response = client.invoke(_chat_messages(EXTRACTION_SYSTEM_PROMPT, formatted_prompt))
+            tokens = self._record_token_usage(provider, response)
+            result = self.batch_parser.parse(response.content)
+        log.info(f"Successfully processed batch with {provider.capitalize()}", batch_size=len(texts),
+                 items=len(result.items), extraction_mode=self.extraction_mode, **tokens)
+        return [item.model_dump() for item in result.items]
+
+    def _extract_single(self, text: str) -> Dict[str, Any]:
+        return self.chat_router.call(lambda provider: self._get_text_info_with_provider(provider, text))
+
+    def _extraction_cache_key(self, text: str) -> str:
+        """
+        Hash of the whitespace-normalized text, the configured models, the extraction mode and its prompt version.
+        """
+        normalized = " ".join(text.split())
+        key_source = "\x1f".join([normalized, self.openai_model, self.groq_model,
+                                  self.extraction_mode, get_prompt_version(self.extraction_mode)])
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+    def get_text_info(self, text: str, fill_date: bool = True) -> Dict[str, Any]:
+        """
+        Extract purchase information from text using the LLM providers, with automatic fallback.
+        The chat router picks the healthiest/fastest provider (default provider first until it has
+        enough samples), skips providers whose circuit is open and optionally hedges slow calls.
+        Results are cached by normalized text, model and prompt version.
+        With fill_date off an "Unknown" date is returned as is, for callers that cache the result
+        and apply fill_missing_date on each use.
+        """
+        cache_key = self._extraction_cache_key(text) if self.extraction_cache is not None else None
+        result = self.extraction_cache.get(cache_key) if cache_key else None
+        if result is not None:
+            log.info("LLM extraction served from cache", cache_key=cache_key)
+            result = dict(result)
+        else:
+            try:
+                result = self.batcher.extract(text) if self.batcher is not None else self._extract_single(text)
+            except Exception as e:
+                log.error(e, "Failed to process text with both OpenAI and Groq via LangChain")
+                return {
+                    "error": "Failed to process text with both OpenAI and Groq",
+                    "message": str(e)
+                }
+            if cache_key:
+                self.extraction_cache.set(cache_key, dict(result))
+        # After caching, so replays get their own timestamp
+        return fill_missing_date(result) if fill_date else result
+
+    @staticmethod
+    def _open_audio(audio: Union[str, bytes, memoryview], file_name: Optional[str]):
+        """
+        File argument for the transcription APIs: an open file for paths, a (name, bytes) tuple for in-memory audio.
+        """
+        if isinstance(audio, str):
+            return open(audio, "rb")
+        if file_name is None:
+            raise ValueError("file_name is required for in-memory audio")
+        return nullcontext((file_name, audio if isinstance(audio, bytes) else bytes(audio)))
+
+    def _get_text_from_audio_with_provider(self, provider: str, audio: Union[str, bytes, memoryview],
+                                           file_name: Optional[str]) -> Dict[str, Any]:
+        audio_name = file_name or audio
         if provider == "openai":
-            return ChatOpenAI(api_key=self.openai_api_key, model=self.openai_model, temperature=0.1)
+            # Transcribe audio using OpenAI Whisper
+            log.debug(f"Sending audio to OpenAI Whisper for transcription", audio=audio_name)
+            client = self._get_audio_client("openai")
+            with self._open_audio(audio, file_name) as audio_file:
+                result = client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=audio_file
+                )
+            log.info(f"Successfully transcribed audio with OpenAI", text=result.text)
+            return {"text": result.text}
         elif provider == "groq":
-            return ChatGroq(api_key=self.groq_api_key, model=self.groq_model, temperature=0.1)
+            # Transcribe audio using Groq Whisper
+            log.debug(f"Sending audio to Groq Whisper for transcription", audio=audio_name)
+            client = self._get_audio_client("groq")
+            with self._open_audio(audio, file_name) as audio_file:
+                result = client.audio.transcriptions.create(
+                    file=audio_file,
+                    model="whisper-large-v3-turbo",
+                    response_format="verbose_json",
+                    temperature=0.0
+                )
+            log.info(f"Successfully transcribed audio with Groq", text=result.text)
+            return {"text": result.text}
         else:
             raise ValueError(f"Unsupported provider: {provider}")
 
-    def get_text_info(self, text: str) -> Dict[str, Any]:
+    def get_audio_preprocessor(self):
+        """The voice note preprocessor, or None when settings.audio_preprocess_enabled is off."""
+        if not settings.audio_preprocess_enabled:
+            return None
+        if self.audio_preprocessor is None:
+            with self._clients_lock:
+                if self.audio_preprocessor is None:
+                    from tools.audio_preprocessor import AudioPreprocessor
+                    self.audio_preprocessor = AudioPreprocessor(
+                        energy_ratio=settings.audio_vad_energy_ratio,
+                        min_silence_ms=settings.audio_min_silence_ms,
+                        padding_ms=settings.audio_speech_padding_ms,
+                        chunk_seconds=settings.audio_chunk_seconds,
+                        chunk_bitrate=settings.audio_chunk_bitrate,
+                    )
+                    self._audio_executor = ThreadPoolExecutor(
+                        max_workers=settings.audio_transcription_concurrency, thread_name_prefix="loris-audio")
+        return self.audio_preprocessor
+
+    def _transcribe(self, audio: Union[str, bytes, memoryview], file_name: Optional[str]) -> Dict[str, Any]:
+        return self.audio_router.call(
+            lambda provider: self._get_text_from_audio_with_provider(provider, audio, file_name))
+
+    def _transcribe_preprocessed(self, audio: Union[str, bytes, memoryview], file_name: Optional[str]) -> Optional[Dict[str, Any]]:
         """
-        Extract purchase information from text using the default LLM provider, with automatic fallback.
-        Tries OpenAI first, then Groq if OpenAI fails.
+        Transcribe the speech chunks of a voice note in parallel and join them in order.
+        Returns None when the audio cannot be preprocessed, so it is sent as it is.
         """
-        providers = [self.default_provider, "groq" if self.default_provider == "openai" else "openai"]
-        last_exception = None
-        for provider in providers:
-            try:
-                # Prepare and send prompt to LLM
-                client = self._get_client(provider)
-                formatted_prompt = self.purchase_prompt.format(text=text)
-                log.debug(f"Sending request to {provider.capitalize()}", model=(self.openai_model if provider=="openai" else self.groq_model), prompt_length=len(formatted_prompt))
-                messages = [
-                    SystemMessage(content="You are a helpful assistant that extracts purchase information from text."),
-                    HumanMessage(content=formatted_prompt)
-                ]
-                response = client.invoke(messages)
-                result = self.purchase_parser.parse(response.content)
-                # If date is missing, set to current timestamp
-                if result.model_dump()["date"] == "Unknown":
-                    log.warning("Date field is missing in the extracted information, using default value")
-                    result.date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                log.info(f"Successfully processed text with {provider.capitalize()}", extracted_info=result.model_dump())
-                log.info("Saving output JSON to Local FS")
-                return result.model_dump()
-            except Exception as e:
-                log.warning(f"{provider.capitalize()} processing failed, trying fallback if available", error=str(e))
-                last_exception = e
-        log.error(str(last_exception), "Failed to process text with both OpenAI and Groq via LangChain")
-        return {
-            "error": "Failed to process text with both OpenAI and Groq",
-            "message": str(last_exception)
-        }
+        from tools.audio_preprocessor import AudioDecodeError
+        try:
+            preprocessed = self.get_audio_preprocessor().process(audio)
+        except AudioDecodeError as e:
+            log.warning("Audio preprocessing skipped, sending the original audio", audio=file_name or audio, reason=str(e))
+            return None
+        base_name = os.path.splitext(os.path.basename(file_name or audio))[0]
+        futures = [
+            self._audio_executor.submit(self._transcribe, chunk, f"{base_name}-{index}.{preprocessed.chunk_format}")
+            for index, chunk in enumerate(preprocessed.chunks)
+        ]
+        texts = [future.result()["text"].strip() for future in futures]
+        return {"text": " ".join(text for text in texts if text), "audio": preprocessed.model_dump()}
 
-    def get_text_from_audio(self, audio_path: str) -> Dict[str, Any]:
+    def get_text_from_audio(self, audio: Union[str, bytes, memoryview], file_name: Optional[str] = None) -> Dict[str, Any]:
         """
-        Transcribe audio to text using the default LLM provider, with automatic fallback.
-        Tries OpenAI first, then Groq if OpenAI fails.
+        Transcribe audio to text using the LLM providers, with automatic fallback through the audio router.
+        Audio is a file path or in-memory bytes; file_name (with extension) is required for bytes.
+        With audio preprocessing on, only the speech is sent, in chunks transcribed in parallel, and
+        the result has an "audio" entry with the seconds received, transcribed and saved.
         """
-        providers = [self.default_provider, "groq" if self.default_provider == "openai" else "openai"]
-        last_exception = None
-        for provider in providers:
-            try:
-                if provider == "openai":
-                    # Transcribe audio using OpenAI Whisper
-                    log.debug(f"Sending audio to OpenAI Whisper for transcription", audio_path=audio_path)
-                    client = OpenAI(api_key=self.openai_api_key)
-                    with open(audio_path, "rb") as audio_file:
-                        result = client.audio.transcriptions.create(
-                            model="whisper-1",
-                            file=audio_file
-                        )
-                    log.info(f"Successfully transcribed audio with OpenAI", text=result.text)
-                    return {"text": result.text}
-                elif provider == "groq":
-                    # Transcribe audio using Groq Whisper
-                    log.debug(f"Sending audio to Groq Whisper for transcription", audio_path=audio_path)
-                    client = Groq(api_key=self.groq_api_key)
-                    with open(audio_path, "rb") as audio_file:
-                        result = client.audio.transcriptions.create(
-                            file=audio_file,
-                            model="whisper-large-v3-turbo",
-                            response_format="verbose_json",
-                            temperature=0.0
-                        )
-                    log.info(f"Successfully transcribed audio with Groq", text=result.text)
-                    return {"text": result.text}
-                else:
-                    raise ValueError(f"Unsupported provider: {provider}")
-            except Exception as e:
-                log.warning(f"{provider.capitalize()} audio transcription failed, trying fallback if available", error=str(e))
-                last_exception = e
-        log.error(str(last_exception), "Failed to transcribe audio with both OpenAI and Groq")
-        return {
-            "error": "Failed to transcribe audio with both OpenAI and Groq",
-            "message": str(last_exception)
-        }
\ No newline at end of file
+        try:
+            if self.get_audio_preprocessor() is not None:
+                result = self._transcribe_preprocessed(audio, file_name)
+                if result is not None:
+                    return result
+            return self._transcribe(audio, file_name)
+        except Exception as e:
+            log.error(e, "Failed to transcribe audio with both OpenAI and Groq")
+            return {
+                "error": "Failed to transcribe audio with both OpenAI and Groq",
+                "message": str(e)
+            }
+
+    def warm_up(self) -> None:
+        """
+        Import the provider SDKs and build the clients and prompts ahead of the first message.
+        """
+        for provider in self.chat_router.providers:
+            self._get_client(provider)
+            self._get_audio_client(provider)
+            if self.extraction_mode == "structured":
+                self._get_structured_client(provider, PurchaseInfo)
+        if self.extraction_mode == "parser":
+            get_purchase_extractor_prompt()
+            if self.batcher is not None:
+                get_batch_purchase_extractor_prompt()
+        get_prompt_version(self.extraction_mode)
+        self.get_audio_preprocessor()
+
+    def close(self) -> None:
+        if self.batcher is not None:
+            self.batcher.close()
+        self.chat_router.shutdown()
+        self.audio_router.shutdown()
+        if self._audio_executor is not None:
+            self._audio_executor.shutdown(wait=False, cancel_futures=True)
@@ -1,16 +1,20 @@
-import requests
+import httpx
 import re
 import json
-from glob import glob
-from typing import Dict, Any
-import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Optional, Tuple, Union
 
 from config import settings
 from model.whatsapp_model import WhatsAppMedia, WhatsAppWebhook, Message
 from logger import log
+from tools.http_clients import http_clients
+from tools.message_store import MessageStore
 
 class WhatsAppTools:
-    def __init__(self):
+    def __init__(self, http_client: httpx.Client = None, store: Optional[MessageStore] = None):
+        self.http = http_client or http_clients.get("graph")
+        # With a message store, media goes to its content-addressed tree instead of the per-type folders
+        self.store = store
         self.token = settings.meta_acces_token
         self.phone_number_id = settings.meta_phone_number_id
         self.version = settings.meta_api_version
@@ -24,8 +28,12 @@ class WhatsAppTools:
             "Content-type": "application/json",
             "Authorization": f"Bearer {self.token}",
         }
-        self.base_url = f"https://graph.facebook.com/{self.version}"
+        self.base_url = f"{settings.meta_graph_base_url}/{self.version}"
         self.url = f"{self.base_url}/{self.phone_number_id}/messages"
+        self.chunk_size = settings.media_download_chunk_size
+        # Media archiving runs off the critical path when media is processed in memory
+        self._archive_executor = ThreadPoolExecutor(
+            max_workers=settings.media_archive_workers, thread_name_prefix="loris-media-archive")
         log.info("WhatsAppTools initialized", 
                 phone_number_id=self.phone_number_id,
                 api_version=self.version)
@@ -33,7 +41,7 @@ class WhatsAppTools:
     def _get_media_info(self, image_id: str) -> WhatsAppMedia:
         media_req_url = self.base_url + "/" + image_id
         try:
-            response = requests.get(
+            response = self.http.get(
                 url=media_req_url,
                 headers=self.headers
             )
@@ -48,62 +56,21 @@ class WhatsAppTools:
             log.error(str(e), image_id=image_id)
             raise
     
-    def _get_media(self, meta_media_info: WhatsAppMedia) -> requests.Response:
+    def _get_media(self, meta_media_info: WhatsAppMedia) -> httpx.Response:
+        """
+        Open a streaming media download. The caller must close the returned response.
+        """
         try:
-            media_response = requests.get(
-                url=meta_media_info.url,
-                headers=self.headers,
-                stream=True
-            )
+            request = self.http.build_request("GET", meta_media_info.url, headers=self.headers)
+            media_response = self.http.send(request, stream=True)
+            if media_response.is_error:
+                media_response.close()
             media_response.raise_for_status()
             return media_response
         except Exception as e:
             log.error(str(e), media_url=meta_media_info.url)
             raise
 
-    def is_message_already_processed(self, message: Message) -> bool:
-        """
-        Check if a WhatsApp message (image, audio, document, text) has already been processed and saved locally.
-        """
-        media_type = message.type
-        message_id = message.id
-        if not media_type or not message_id:
-            log.warning("Message type or ID is missing", 
-                        message_id=message_id, 
-                        media_type=media_type)
-            return False
-        
-        # Only check supported media types
-        if media_type not in ["image", "audio", "text"]:
-            log.warning(f"Unsupported media type: {media_type}", message_id=message_id)
-            return False
-
-        # Build file path and check existence for each type
-        if media_type == "image":
-            extension = message.image.mime_type.split('/')[-1] if message.image.mime_type else "jpeg"
-            file_path = f"{settings.local_image_path}/{message_id}.{extension}"
-            exists = os.path.exists(file_path)
-            log.debug("Checking if image already processed", file_path=file_path, exists=exists)
-            return exists
-        elif media_type == "audio":
-            extension = message.audio.mime_type.split('/')[-1].split(';')[0] if message.audio.mime_type else "ogg"
-            file_path = f"{settings.localt_audio_path}/{message_id}.{extension}"
-            exists = os.path.exists(file_path)
-            log.debug("Checking if audio already processed", file_path=file_path, exists=exists)
-            return exists
-        # elif media_type == "document":
-        #     extension = message.document.mime_type.split('/')[-1] if message.document.mime_type else "bin"
-        #     file_path = f"{settings.local_document_path}/{message_id}.{extension}"
-        #     exists = os.path.exists(file_path)
-        #     log.debug("Checking if document already processed", file_path=file_path, exists=exists)
-        #     return exists
-        elif media_type == "text":
-            extension = "txt"
-            file_path = f"{settings.local_text_path}/{message_id}.{extension}"
-            exists = os.path.exists(file_path)
-            log.debug("Checking if text already processed", file_path=file_path, exists=exists)
-            return exists
-
     def process_text_for_whatsapp(self, text: str) -> str:
         """
         Format text for WhatsApp by removing brackets and converting double asterisks to single asterisks.
@@ -122,11 +89,13 @@ class WhatsAppTools:
     def check_webhook_type(self, webhook: WhatsAppWebhook) -> str:
         """
         Determine the type of incoming WhatsApp webhook event.
+        A webhook carrying any message is a "message" webhook, even if it also has statuses.
         """
-        if webhook.entry[0].changes[0].value.messages:
+        values = [change.value for entry in webhook.entry for change in entry.changes]
+        if any(value.messages for value in values):
             log.debug("Webhook type: message")
             return "message"
-        elif webhook.entry[0].changes[0].value.statuses:
+        elif any(value.statuses for value in values):
             log.debug("Webhook type: message_status_update")
             return "message_status_update"
         log.debug("Webhook type: unknown")
@@ -158,10 +127,10 @@ class WhatsAppTools:
         """
         try:
             log.info("Sending message to WhatsApp API")
-            response = requests.post(
+            response = self.http.post(
                 url=self.url,
                 headers=self.headers,
-                data=data
+                content=data
             )
             
             if response.status_code == 200:
@@ -176,60 +145,141 @@ class WhatsAppTools:
                      error_details=error_response)
             response.raise_for_status()
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             log.error(str(e))
             raise
         except Exception as e:
             log.error(str(e))
             raise
 
+    def _get_media_target(self, message: Message) -> Tuple[Optional[str], str, str]:
+        """
+        Get the media id, file extension and local folder for a message.
+        """
+        media_type = message.type
+        if media_type == "image":
+            extension = message.image.mime_type.split('/')[-1] if message.image.mime_type else "jpeg"
+            return message.image.id, extension, settings.local_image_path
+        elif media_type == "audio":
+            extension = message.audio.mime_type.split('/')[-1].split(';')[0] if message.audio.mime_type else "ogg"
+            return message.audio.id, extension, settings.localt_audio_path
+        elif media_type == "document":
+            extension = message.document.mime_type.split('/')[-1] if message.document.mime_type else "bin"
+            return message.document.id, extension, settings.local_document_path
+        elif media_type == "text":
+            return None, "txt", settings.local_text_path
+        log.error(f"Unsupported media type: {media_type}", message_id=message.id)
+        raise ValueError(f"Unsupported media type: {media_type}")
+
+    def get_media_filename(self, message: Message) -> str:
+        """
+        File name (message id plus extension) used for the message media.
+        """
+        _, extension, _ = self._get_media_target(message)
+        return f"{message.id}.{extension}"
+
     def download_and_save_whatsapp_media_to_local_fs(self, message: Message) -> str:
         """
         Download and save WhatsApp media (image, audio, document, text) to local filesystem.
-        Returns the local file path.
+        Returns the local file path (None for text messages with a message store).
         """
         try:
             media_type = message.type
             message_id = message.id
-            
-            # Handle each media type accordingly
-            if media_type == "image":
-                media_id = message.image.id
-                extension = message.image.mime_type.split('/')[-1] if message.image.mime_type else "jpeg"
-                local_media_path = settings.local_image_path
-            elif media_type == "audio":
-                media_id = message.audio.id
-                extension = message.audio.mime_type.split('/')[-1].split(';')[0] if message.audio.mime_type else "ogg"
-                local_media_path = settings.localt_audio_path
-            elif media_type == "document":
-                media_id = message.document.id
-                extension = message.document.mime_type.split('/')[-1] if message.document.mime_type else "bin"
-                local_media_path = settings.local_document_path
-            elif media_type == "text":
-                extension = "txt"
-                local_media_path = settings.local_text_path
+            media_id, extension, local_media_path = self._get_media_target(message)
+
+            if self.store is not None:
+                if media_type == "text":
+                    # The body is stored with the message metadata
+                    return None
+                return self.store.save_media(message_id, self.download_whatsapp_media_to_memory(message), extension)
+
+            if media_type == "text":
                 # Save text message directly
                 with open(f"{local_media_path}/{message_id}.{extension}", "w") as file:
                     file.write(message.text.body)
                 log.info("Text message saved to local filesystem", 
                          file_path=f"{local_media_path}/{message_id}.{extension}")
                 return f"{local_media_path}/{message_id}.{extension}"
-            else:
-                log.error(f"Unsupported media type: {media_type}", message_id=message.id)
-                raise ValueError(f"Unsupported media type: {media_type}")
 
             log.info("Saving media to local filesystem", media_type=media_type, media_id=media_id)
             meta_media_info = self._get_media_info(media_id)
             media_response = self._get_media(meta_media_info=meta_media_info)
 
             file_path = f"{local_media_path}/{message_id}.{extension}"
-            with open(file_path, "wb") as media_file:
-                for chunk in media_response.iter_content(1024):
-                    media_file.write(chunk)
+            try:
+                with open(file_path, "wb") as media_file:
+                    for chunk in media_response.iter_bytes(self.chunk_size):
+                        media_file.write(chunk)
+            finally:
+                media_response.close()
 
             log.info("Media saved successfully", file_path=file_path)
             return file_path
 
         except Exception as e:
             log.error(str(e), media_id=media_id if 'media_id' in locals() else None)
-            raise
\ No newline at end of file
+            raise
+
+    def download_whatsapp_media_to_memory(self, message: Message) -> memoryview:
+        """
+        Download WhatsApp media (image, audio, document) into a single buffer preallocated
+        from the size Meta reports. Returns a memoryview over the downloaded bytes.
+        """
+        media_id = None
+        try:
+            media_id, _, _ = self._get_media_target(message)
+            if media_id is None:
+                raise ValueError(f"Message type has no media to download: {message.type}")
+
+            meta_media_info = self._get_media_info(media_id)
+            buffer = bytearray(meta_media_info.file_size)
+            offset = 0
+            media_response = self._get_media(meta_media_info=meta_media_info)
+            try:
+                for chunk in media_response.iter_bytes(self.chunk_size):
+                    end = offset + len(chunk)
+                    # Slice assignment grows the buffer if Meta under-reported the size
+                    buffer[offset:end] = chunk
+                    offset = end
+            finally:
+                media_response.close()
+
+            log.info("Media downloaded to memory", media_id=media_id, size=offset,
+                     expected_size=meta_media_info.file_size)
+            return memoryview(buffer)[:offset]
+
+        except Exception as e:
+            log.error(str(e), media_id=media_id)
+            raise
+
+    def _write_archive(self, file_path: str, data: Union[bytes, memoryview]) -> None:
+        try:
+            with open(file_path, "wb") as media_file:
+                media_file.write(data)
+            log.info("Media archived", file_path=file_path)
+        except Exception as e:
+            log.error(e, "Error archiving media", file_path=file_path)
+
+    def _store_archive(self, message_id: str, data: Union[bytes, memoryview], extension: str) -> None:
+        try:
+            self.store.save_media(message_id, data, extension)
+        except Exception as e:
+            log.error(e, "Error archiving media", message_id=message_id)
+
+    def archive_media_async(self, message: Message, data: Union[bytes, memoryview]) -> Future:
+        """
+        Write in-memory media (or the text body for text messages) to the local filesystem
+        in the background. Returns the Future of the write.
+        """
+        _, extension, local_media_path = self._get_media_target(message)
+        if self.store is not None:
+            return self._archive_executor.submit(self._store_archive, message.id, data, extension)
+        file_path = f"{local_media_path}/{message.id}.{extension}"
+        return self._archive_executor.submit(self._write_archive, file_path, data)
+
+    def close(self) -> None:
+        """
+        Wait for pending archive writes.
+        """
+        self._archive_executor.shutdown(wait=True)